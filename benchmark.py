@@ -0,0 +1,125 @@
+"""
+OLMS - GEDI Storer benchmark
+
+Generate synthetic GEDI granules and time GEDI Storer stages, optionally
+against a stored baseline.
+
+Author: Marcus Moresco Boeno
+
+Usage:
+    python benchmark.py --granules 2 --shots 100000 --backend null
+    python benchmark.py --baseline bench.json --save-baseline
+    python benchmark.py --downloader --files 8 --file-mb 16
+    python benchmark.py --finder --latency 0.5
+    python benchmark.py --finder --bbox 5 -75 -34 -34 --tile-size 5
+
+"""
+
+# Standard library imports
+import os
+import sys
+import argparse
+import tempfile
+
+# Local appplication imports
+from utils import config, gediClasses, benchTasks
+
+
+def main():
+    """
+    > main()
+        Parse arguments, generate granules and run the benchmark.
+
+    > Arguments:
+        - No arguments (see --help).
+
+    > Output:
+        - No outputs (prints results, exits with 1 on baseline mismatch).
+    """
+    parser = argparse.ArgumentParser(description="GEDI Storer benchmark")
+    parser.add_argument("--granules", type=int, default=2)
+    parser.add_argument("--shots", type=int, default=100000, help="shots by beam")
+    parser.add_argument("--gap-rate", type=float, default=0.01)
+    parser.add_argument("--waveforms", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--backend", choices=["null", "mongodb", "parquet"], default="null"
+        )
+    parser.add_argument("--roi", default=os.path.join("geo", "sc_b5k_s2k_edit.geojson"))
+    parser.add_argument("--folder", default=None, help="keep granules here")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--downloader", action="store_true", help="benchmark GEDI Downloader"
+        )
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--file-mb", type=float, default=16)
+    parser.add_argument("--workers", type=int, default=config.download_workers)
+    parser.add_argument(
+        "--finder", action="store_true", help="benchmark GEDI Finder queries"
+        )
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument(
+        "--bbox", type=float, nargs=4, default=config.default_bbox,
+        help="ul_lat ul_lon lr_lat lr_lon"
+        )
+    parser.add_argument("--tile-size", type=float, default=config.finder_tile_size)
+    args = parser.parse_args()
+
+    # GEDI Finder against a local gedifinder stand-in
+    if args.finder:
+        folder = args.folder or tempfile.mkdtemp(prefix="gedi_bench_")
+        results = benchTasks.bench_finder(
+            folder, args.latency, bbox=args.bbox, tile_size=args.tile_size
+            )
+        print("\n > GEDI Finder benchmark:")
+        for name, value in results.items():
+            print(f"     - {name}: {value}")
+        return
+
+    # GEDI Downloader against a local HTTP server
+    if args.downloader:
+        folder = args.folder or tempfile.mkdtemp(prefix="gedi_bench_")
+        results = benchTasks.bench_downloader(
+            folder, args.files, args.file_mb, args.workers
+            )
+        print("\n > GEDI Downloader benchmark:")
+        for name, value in results.items():
+            print(f"     - {name}: {value}")
+        if results["failed"]:
+            sys.exit(1)
+        return
+
+    # Synthetic local storage (temporary unless --folder is given)
+    folder = args.folder or tempfile.mkdtemp(prefix="gedi_bench_")
+    print(f"\n ... Writing {args.granules} synthetic granules to {folder} ...")
+    granules = [
+        benchTasks.bench_make_granule(
+            folder, index + 1, args.shots, args.gap_rate,
+            waveforms=args.waveforms, seed=args.seed
+            )
+        for index in range(args.granules)
+        ]
+
+    # Compiled ROI cached inside the bench folder
+    roi = gediClasses.GEDI_ROI(
+        args.roi, cache=os.path.join(folder, "ROI_CACHE")
+        ).load()
+
+    # Run benchmark and compare with baseline
+    results = benchTasks.bench_storer(
+        folder, granules, roi, args.backend, args.waveforms
+        )
+    baseline = benchTasks.bench_load_baseline(args.baseline)
+    matches = benchTasks.bench_report(results, baseline)
+
+    if args.save_baseline:
+        benchTasks.bench_save_baseline(results, args.baseline)
+        print(f"\n ... Baseline saved to {args.baseline}")
+
+    if not matches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
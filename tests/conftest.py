@@ -0,0 +1,80 @@
+"""
+pytest configuration and shared fixtures
+
+Tests import the local application packages (utils) from the repository
+root, as olms.py and benchmark.py do
+
+Author: Marcus Moresco Boeno
+
+"""
+
+# Standard library imports
+import os
+import sys
+
+# Third party library imports
+import pytest
+
+# Repository root on the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Local application imports
+from utils import config, gediClasses, benchTasks
+
+
+# ROI of the synthetic granule tracks (see benchmark.py)
+roi_path = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
+    "geo", "sc_b5k_s2k_edit.geojson"
+    )
+
+
+@pytest.fixture
+def bench(tmp_path, monkeypatch):
+    """
+    Local storage with 3 synthetic granule triplets (see benchTasks), the
+    compiled ROI and a factory of GEDI_Shots instances. Runs inside tmp_path,
+    so default (Windows) paths of utils/config.py land there.
+    """
+    monkeypatch.chdir(tmp_path)
+    folder = str(tmp_path / "local")
+    granules = [
+        benchTasks.bench_make_granule(folder, index, 2000, waveforms=True) 
+        for index in range(1, 4)
+        ]
+    roi = gediClasses.GEDI_ROI(roi_path, cache=str(tmp_path / "roi")).load()
+
+    def make_shots(index, **kwargs):
+        strMatch, files = granules[index]
+        gediShots = gediClasses.GEDI_Shots(
+            path=folder, l1b=files[0], l2a=files[1], l2b=files[2],
+            vers=files[0][-5:-3], strMatch=strMatch, beams=config.beam_list,
+            db="gedi_test", roi=roi, index_gran=index + 1, 
+            num_grans=len(granules), **kwargs
+            )
+        gediShots.footprint = gediClasses.GEDI_Footprint(
+            files[0], root=str(tmp_path / "footprints")
+            )
+        return gediShots
+
+    return {"folder": folder, "granules": granules, "roi": roi, "shots": make_shots}
+
+
+@pytest.fixture
+def mongo_db():
+    """
+    Name of a scratch MongoDB database (dropped after the test), tests are
+    skipped when no MongoDB server is running.
+    """
+    import pymongo
+    client = pymongo.MongoClient(serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        client.close()
+        pytest.skip("MongoDB server not running")
+    
+    db = f"olms_test_{os.getpid()}"
+    yield db
+    client.drop_database(db)
+    client.close()
@@ -0,0 +1,583 @@
+"""
+Tests of GEDI Classes
+
+Storer pool, writers, waveform store, catalog and downloads, on synthetic
+granules (see utils/gediClasses.py and utils/benchTasks.py)
+
+Author: Marcus Moresco Boeno
+
+"""
+
+# Standard library imports
+import os
+import copy
+import hashlib
+import functools
+import threading
+from http.server import ThreadingHTTPServer
+
+# Third party library imports
+import h5py
+import numpy as np
+import pytest
+import requests
+
+# Local application imports
+from utils import config, gediClasses, geoTasks, benchTasks
+
+
+def collect_windows(gediShots):
+    # Items streamed by process_windows() (see GEDI_StorerPool)
+    items = []
+    gediShots.process_windows(items.append)
+    return items
+
+
+def window_shots(items):
+    # Shot numbers of the windows of each beam
+    shots = {}
+    for item in items:
+        if item[0] == "window":
+            shots.setdefault(item[2], []).extend(item[3]["shot_number"].tolist())
+    return shots
+
+
+def test_process_window_matches_reference(bench):
+    gediShots = bench["shots"](0, predicates=[])
+    beam = config.beam_list[0]
+    
+    # Reference: shots common to every product, within ROI (exact test)
+    h5 = {
+        product: h5py.File(os.path.join(bench["folder"], product, name), "r")
+        for product, name in zip(
+            config.gedi_products, 
+            [gediShots.l1b_file, gediShots.l2a_file, gediShots.l2b_file]
+            )
+        }
+    try:
+        shots = {p: f[beam]["shot_number"][:] for p, f in h5.items()}
+        common = np.intersect1d(np.intersect1d(shots["GEDI01_B"], shots["GEDI02_A"]), shots["GEDI02_B"])
+        rows = {p: np.searchsorted(s, common) for p, s in shots.items()}
+        lon = h5["GEDI01_B"][beam]["geolocation/longitude_bin0"][:][rows["GEDI01_B"]]
+        lat = h5["GEDI01_B"][beam]["geolocation/latitude_bin0"][:][rows["GEDI01_B"]]
+        inside = geoTasks.contains_xy(bench["roi"].geometry, lon, lat)
+        rh100 = h5["GEDI02_B"][beam]["rh100"][:][rows["GEDI02_B"]]
+    finally:
+        for f in h5.values():
+            f.close()
+
+    with gediShots.open_granule() as reader:
+        cols = gediShots.process_window(reader, beam, reader.beam_indexes(beam))
+    
+    assert inside.any() and not inside.all()
+    assert cols["shot_number"].tolist() == common[inside].tolist()
+    assert cols["rh100"].tolist() == rh100[inside].tolist()
+    assert gediShots.filter_stats == {
+        "shots_read": len(common), "roi": int((~inside).sum()), 
+        "shots_kept": int(inside.sum())
+        }
+
+
+def test_process_and_store_counters(bench):
+    gediShots = bench["shots"](0)
+
+    with gediClasses.GEDI_NullWriter() as writer:
+        gediShots.process_and_store(writer)
+    
+    stats = gediShots.filter_stats
+    assert writer.docs == stats["shots_kept"] > 0
+    assert stats["shots_read"] == sum(v for k, v in stats.items() if k != "shots_read")
+    assert sorted(gediShots.beam_stats) == sorted(config.beam_list)
+
+
+@pytest.mark.parametrize("options", [
+    {"window_size": 97}, {"window_size": 0}, {"footprints": False}
+    ])
+def test_process_windows_same_shots(bench, options):
+    # Window size and footprint index only change how shots are read
+    reference = collect_windows(bench["shots"](1, window_size=5000))
+    items = collect_windows(bench["shots"](1, **options))
+
+    assert window_shots(items) == window_shots(reference)
+    assert [i[0] for i in items if i[0] != "window"] == ["beam"] * 8 + ["done"]
+    if options.get("window_size", 0) > 0:
+        assert all(
+            len(i[3]["shot_number"]) <= options["window_size"] 
+            for i in items if i[0] == "window"
+            )
+
+
+def test_subset_granule_keeps_granules(bench):
+    reference = window_shots(collect_windows(bench["shots"](0)))
+    gediShots = bench["shots"](0, subset=True)
+    files = [gediShots.l1b_file, gediShots.l2a_file, gediShots.l2b_file]
+    paths = [
+        os.path.join(bench["folder"], product, f) 
+        for product, f in zip(config.gedi_products, files)
+        ]
+    digests = [hashlib.md5(open(path, "rb").read()).hexdigest() for path in paths]
+
+    # Subsets hold the shots stored from the granules
+    assert window_shots(collect_windows(gediShots)) == reference
+    assert [hashlib.md5(open(path, "rb").read()).hexdigest() for path in paths] == digests
+    subsets = gediShots.granule_files()
+    assert subsets == [f[:-len(".h5")] + ".subset.h5" for f in files]
+    for product, f in zip(config.gedi_products, subsets):
+        with h5py.File(os.path.join(bench["folder"], product, f), "r") as h5:
+            assert h5.attrs["olms_subset"] == bench["roi"].file_hash()
+    
+    # Later runs read the subsets as they are
+    assert not gediShots.subset_granule()
+    assert window_shots(collect_windows(bench["shots"](0))) == reference
+
+
+def test_subset_granule_of_another_roi(bench):
+    bench["shots"](0, subset=True).subset_granule()
+
+    # Same ROI file contents, different hash
+    roi = copy.copy(bench["roi"])
+    roi.hash = "0" * 16
+    gediShots = bench["shots"](0, subset=True)
+    gediShots.roi = roi
+
+    with pytest.raises(ValueError, match="another ROI"):
+        gediShots.subset_granule()
+    assert [i[0] for i in collect_windows(gediShots)] == ["error"]
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_storer_pool_skips_failed_granules(bench, workers):
+    tasks = [bench["shots"](index) for index in range(3)]
+    
+    # Second granule fails (L2A missing from local storage)
+    os.remove(os.path.join(bench["folder"], "GEDI02_A", tasks[1].l2a_file))
+
+    with gediClasses.GEDI_NullWriter() as writer:
+        with gediClasses.GEDI_StorerPool(writer, workers) as pool:
+            for gediShots in tasks:
+                pool.submit(gediShots)
+            stored = pool.run()
+
+    # Failed granule left out, the others stored
+    assert [g.strMatch for g in stored] == [tasks[0].strMatch, tasks[2].strMatch]
+    assert not pool.busy()
+    
+    # Every shot kept by the stored granules was written
+    kept = sum(g.filter_stats["shots_kept"] for g in stored)
+    assert kept > 0
+    assert writer.docs == kept
+
+
+def test_storer_pool_worker_stats_merged(bench):
+    # Counters of worker processes are copied back to the parent instances
+    serial, pooled = bench["shots"](0), bench["shots"](0)
+    
+    with gediClasses.GEDI_NullWriter() as writer:
+        with gediClasses.GEDI_StorerPool(writer, 0) as pool:
+            pool.submit(serial)
+            pool.run()
+        with gediClasses.GEDI_StorerPool(writer, 1) as pool:
+            pool.submit(pooled)
+            pool.run()
+
+    assert serial.filter_stats == pooled.filter_stats
+    assert serial.filter_stats["shots_kept"] > 0
+
+
+def test_writer_round_trip(mongo_db):
+    docs = [{"shot_number": sn, "value": sn * 2} for sn in range(2500)]
+    
+    with gediClasses.GEDI_Writer(mongo_db, batch_size=1000) as writer:
+        db = writer.get_database()
+        db["shots"].create_index("shot_number", unique=True)
+        writer.insert_many("shots", docs)
+        writer.insert_one("processed", {"str2match": "granule"})
+        writer.delete_many("shots", {"shot_number": {"$lt": 500}})
+        
+        # Writes of a rerun are skipped as duplicates
+        writer.insert_many("shots", [dict(d) for d in docs[2000:]])
+    assert (writer.docs, writer.duplicates) == (2500, 500)
+    
+    with gediClasses.GEDI_Writer(mongo_db) as writer:
+        db = writer.get_database()
+        assert db["shots"].count_documents({}) == 2000
+        assert db["shots"].find_one({"shot_number": 2499})["value"] == 4998
+        assert db["processed"].count_documents({"str2match": "granule"}) == 1
+
+
+def test_writer_surfaces_write_errors(mongo_db):
+    writer = gediClasses.GEDI_Writer(mongo_db)
+    writer.start()
+    writer.insert_one("shots", {"_id": 1})
+    writer.delete_many("shots", {"$bad": 1})
+
+    with pytest.raises(Exception):
+        writer.close()
+
+
+def test_writer_indexes_follow_writer_settings(mongo_db):
+    with gediClasses.GEDI_Writer(mongo_db, storage="buckets", schema=2) as writer:
+        writer.create_indexes(["01"])
+        db = writer.get_database()
+        buckets = db["buckets_v01"].index_information().values()
+        shots = db["shots_v01"].index_information().values()
+
+    assert any(info.get("unique") and len(info["key"]) == 3 for info in buckets)
+    assert not any(info.get("unique") for info in shots)
+
+
+def test_writer_reset_beams_of_interrupted_run(bench, mongo_db):
+    # Bucket boundaries move with the window size of a rerun
+    def run(window_size):
+        gediShots = bench["shots"](0, storage="buckets", window_size=window_size)
+        with gediClasses.GEDI_Writer(mongo_db, storage="buckets") as writer:
+            writer.create_indexes([gediShots.version])
+            gediShots.process_and_store(writer)
+            db = writer.get_database()
+        
+        # Interrupted before any beam checkpoint
+        db["checkpoints_v" + gediShots.version].delete_many({})
+        buckets = list(db["buckets_v" + gediShots.version].find({}, {"n": 1}))
+        return gediShots, sum(b["n"] for b in buckets)
+
+    first, first_shots = run(500)
+    second, second_shots = run(333)
+
+    assert first_shots == second_shots == second.filter_stats["shots_kept"] > 0
+
+
+def read_parquet(root, collection):
+    # Rows of every partition file, with the tile/year of its folder
+    pq = pytest.importorskip("pyarrow.parquet")
+    parts = []
+    for folder, _, names in os.walk(os.path.join(root, collection)):
+        for name in names:
+            tile, year = os.path.relpath(folder, os.path.join(root, collection)).split(os.sep)
+            parts.append((tile, year, pq.read_table(os.path.join(folder, name)).to_pydict()))
+    return parts
+
+
+def test_parquet_writer_round_trip(bench, tmp_path):
+    pytest.importorskip("pyarrow")
+    root = str(tmp_path / "parquet")
+    gediShots = bench["shots"](0, window_size=500)
+    with gediClasses.GEDI_ParquetWriter(root, tile_size=1) as writer:
+        gediShots.process_and_store(writer)
+    
+    # Every kept shot once, on the partition of its tile and year
+    parts = read_parquet(root, "shots_v" + gediShots.version)
+    shots = [s for _, _, part in parts for s in part["shot_number"]]
+    assert len(shots) == len(set(shots)) == gediShots.filter_stats["shots_kept"] > 0
+    for tile, year, part in parts:
+        lat0, lon0 = (float(v) for v in tile[len("tile="):].split("_"))
+        assert all(lat0 <= lat < lat0 + 1 for lat in part["lat"])
+        assert all(lon0 <= lon < lon0 + 1 for lon in part["lon"])
+        assert {str(d.year) for d in part["date_acquired"]} == {year[len("year="):]}
+    
+    # Granule registered once
+    granules = gediClasses.GEDI_ParquetWriter.read_meta(root, "granules_v" + gediShots.version)
+    assert [g["_id"] for g in granules] == [gediShots.strMatch]
+
+
+def test_parquet_writer_reset_beams_of_interrupted_run(bench, tmp_path):
+    pytest.importorskip("pyarrow")
+    root = str(tmp_path / "parquet")
+
+    # Partition filenames move with the window size of a rerun
+    for window_size in [500, 333]:
+        gediShots = bench["shots"](0, window_size=window_size)
+        with gediClasses.GEDI_ParquetWriter(root, tile_size=1) as writer:
+            gediShots.process_and_store(writer)
+        
+        # Interrupted before any beam checkpoint
+        os.remove(os.path.join(root, "_meta", f"checkpoints_v{gediShots.version}.jsonl"))
+    
+    parts = read_parquet(root, "shots_v" + gediShots.version)
+    shots = [s for _, _, part in parts for s in part["shot_number"]]
+    assert len(shots) == len(set(shots)) == gediShots.filter_stats["shots_kept"]
+
+
+def test_waveform_store_read_back(tmp_path):
+    store = gediClasses.GEDI_WaveformStore(str(tmp_path / "waveforms"), tile_size=1)
+    rng = np.random.default_rng(0)
+    shots = np.arange(1000, 1200, dtype="<u8")
+    lon = rng.uniform(-50.5, -48.5, len(shots))
+    lat = rng.uniform(-27.5, -26.5, len(shots))
+    waveforms = np.empty(len(shots), dtype=object)
+    waveforms[:] = [rng.random(rng.integers(1, 50)).astype("<f4") for _ in shots]
+
+    # Appended in two batches, the second one repeating shots
+    store.append("002", shots[:120], lon[:120], lat[:120], waveforms[:120])
+    store.append("002", shots[100:], lon[100:], lat[100:], waveforms[100:])
+    store.append("002", shots[:10], lon[:10], lat[:10], waveforms[:10])
+
+    found = store.get_waveforms("002", shots[::-1], lon[::-1], lat[::-1])
+    assert sorted(found) == shots.tolist()
+    for shot, wave in zip(shots, waveforms):
+        np.testing.assert_array_equal(found[int(shot)], wave)
+    
+    # Each shot stored once, on the tile of its coordinates
+    records = 0
+    for (lat0, lon0), rows in store._group_tiles(lon, lat).items():
+        index = np.fromfile(
+            os.path.join(store.tile_folder("002", lat0, lon0), "index.bin"), 
+            dtype=store.index_dtype
+            )
+        assert sorted(index["shot_number"].tolist()) == shots[rows].tolist()
+        records += len(index)
+    assert records == len(shots)
+
+
+def test_waveform_store_missing_shots(tmp_path):
+    store = gediClasses.GEDI_WaveformStore(str(tmp_path / "waveforms"))
+    waveforms = np.empty(1, dtype=object)
+    waveforms[0] = np.ones(5, dtype="<f4")
+    store.append("002", np.array([7], "<u8"), np.array([-49.5]), np.array([-27.5]), waveforms)
+
+    # Unknown shot on a stored tile, and a tile without store
+    found = store.get_waveforms(
+        "002", np.array([7, 8, 9], "<u8"), 
+        np.array([-49.5, -49.5, 10.5]), np.array([-27.5, -27.5, 10.5])
+        )
+    assert list(found) == [7]
+
+
+def test_roi_file_hash_read_once(tmp_path):
+    path = tmp_path / "roi.geojson"
+    path.write_bytes(b'{"type": "FeatureCollection", "features": []}')
+    roi = gediClasses.GEDI_ROI(str(path), cache=str(tmp_path / "roi"))
+    first = roi.file_hash()
+    
+    # Later calls (cache path, subsets) reuse the hash of the first read
+    path.write_bytes(path.read_bytes() + b"\n")
+    assert roi.file_hash() == first
+    assert os.path.basename(roi.cache_path()).startswith(first)
+    assert gediClasses.GEDI_ROI(str(path)).file_hash() != first
+
+
+
+@pytest.mark.parametrize("name", [
+    "GEDI02_A_2019109210808_O01988_T02056_02_003_01.h5",
+    "processed_GEDI02_A_2019109210808_O01988_T02056_02_003_01.h5",
+    "https://e4ftl01.cr.usgs.gov/GEDI/GEDI02_A.001/2019.04.19/"
+    "GEDI02_A_2019109210808_O01988_T02056_02_003_01.h5\n",
+    ])
+def test_parse_name(name):
+    parsed = gediClasses.GEDI_Catalog.parse_name(name)
+
+    assert parsed == {
+        "name": "GEDI02_A_2019109210808_O01988_T02056_02_003_01.h5",
+        "product": "GEDI02_A",
+        "version": "01",
+        "str2match": "2019109210808_O01988_T02056",
+        "orbit": 1988,
+        "track": 2056,
+        "acquired": "2019-04-19"
+        }
+
+
+def test_catalog_triplets_use_local_names(bench, tmp_path):
+    folder = bench["folder"]
+    files = [f for _, triplet in bench["granules"] for f in triplet]
+    
+    # Downloaded name (no prefix) next to the 'processed_' bench files
+    strMatch, triplet = bench["granules"][0]
+    downloaded = triplet[1][len("processed_"):]
+    os.replace(
+        os.path.join(folder, "GEDI02_A", triplet[1]), 
+        os.path.join(folder, "GEDI02_A", downloaded)
+        )
+    files[1] = downloaded
+    
+    with gediClasses.GEDI_Catalog(str(tmp_path / "catalog.db")) as catalog:
+        catalog.sync_local(files[:-1], folder)
+        triplets = catalog.granule_triplets()
+
+        # Every version and match, products ordered as config.gedi_products
+        version = bench["granules"][0][1][0][-5:-3]
+        assert sorted(triplets) == [version]
+        assert triplets[version][strMatch] == [triplet[0], downloaded, triplet[2]]
+        assert triplets[version][bench["granules"][2][0]] == bench["granules"][2][1][:2]
+        assert catalog.local_names("GEDI02_A") == {
+            catalog.parse_name(f)["name"] for f in files[1::3]
+            }
+
+        # Subsets are read instead of their granules
+        subset = triplet[0][:-len(".h5")] + ".subset.h5"
+        open(os.path.join(folder, "GEDI01_B", subset), "wb").close()
+        catalog.sync_local(files[:-1] + [subset], folder)
+        triplet_files = catalog.granule_triplets()[version][strMatch]
+        assert triplet_files == [subset, downloaded, triplet[2]]
+        assert catalog.local_names("GEDI01_B") == {
+            catalog.parse_name(f)["name"] for f in files[0::3]
+            }
+        gediShots = gediClasses.GEDI_Shots(
+            folder, *triplet_files, version, strMatch, config.beam_list, 
+            "gedi_test", bench["roi"], 1, 1
+            )
+        assert gediShots.l1b_file == triplet[0]
+
+        # Files removed from local storage are no longer matched
+        catalog.sync_local(files[3:], folder)
+        assert strMatch not in catalog.granule_triplets()[version]
+
+
+def test_catalog_tile_priority(tmp_path):
+    names = [
+        f"GEDI02_A_2019{day}210808_O{orbit}_T02056_02_003_01.h5" 
+        for day, orbit in [(109, "01988"), (110, "01989"), (111, "01990")]
+        ]
+    with gediClasses.GEDI_Catalog(str(tmp_path / "catalog.db")) as catalog:
+        catalog.set_coverage({
+            names[0]: ["-30_-55", "-25_-50"], names[1]: ["-25_-55"], 
+            names[2]: ["-20_-60"]
+            })
+
+        # First priority tile touched, len(tiles) for granules touching none
+        priority = catalog.tile_priority(
+            ["processed_" + names[0], names[1], names[2], "processed_" + names[1]],
+            ["-25_-50", "-25_-55", "-30_-55"]
+            )
+        assert priority == {
+            "processed_" + names[0]: 0, names[1]: 1, names[2]: 3, 
+            "processed_" + names[1]: 1
+            }
+        assert catalog.tile_priority(names, []) == dict.fromkeys(names, 0)
+
+
+def test_catalog_opened_once(tmp_path):
+    catalog = gediClasses.GEDI_Catalog(str(tmp_path / "catalog.db"))
+    catalog.open()
+    conn = catalog.conn
+
+    # Context manager keeps the connection of an open catalog
+    with catalog:
+        assert catalog.conn is conn
+    assert catalog.conn is None
+
+
+@pytest.fixture
+def server(tmp_path):
+    # Local HTTP stand-in serving a random file (Range requests supported)
+    served = tmp_path / "served"
+    served.mkdir()
+    data = os.urandom(3 * 1024**2 + 123)
+    (served / "granule.h5").write_bytes(data)
+
+    handler = functools.partial(benchTasks.BenchHandler, directory=str(served))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/granule.h5", data
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def downloader():
+    # No retries, so every test sees the first error
+    with gediClasses.GEDI_Downloader(workers=2, chunk_size=64 * 1024, retries=0) as d:
+        yield d
+
+
+def md5(data):
+    return "md5:" + hashlib.md5(data).hexdigest()
+
+
+def test_transfer_full_file(server, downloader, tmp_path):
+    url, data = server
+    partName = str(tmp_path / "granule.h5.part")
+
+    size, checksum = downloader._transfer(url, partName)
+
+    assert size == len(data)
+    assert checksum == md5(data)
+    with open(partName, "rb") as f:
+        assert f.read() == data
+
+
+def test_transfer_resumes_with_range(server, downloader, tmp_path):
+    url, data = server
+    partName = str(tmp_path / "granule.h5.part")
+    with open(partName, "wb") as f:
+        f.write(data[:1000000])
+
+    size, checksum = downloader._transfer(url, partName, md5(data))
+
+    assert size == len(data)
+    assert downloader.bytes == len(data) - 1000000
+    with open(partName, "rb") as f:
+        assert f.read() == data
+
+
+def test_transfer_416_complete_part(server, downloader, tmp_path):
+    # Part file already complete (interrupted before the rename)
+    url, data = server
+    partName = str(tmp_path / "granule.h5.part")
+    with open(partName, "wb") as f:
+        f.write(data)
+
+    size, checksum = downloader._transfer(url, partName, md5(data))
+
+    assert (size, checksum) == (len(data), md5(data))
+    assert downloader.bytes == 0
+
+
+def test_transfer_416_stale_part(server, downloader, tmp_path):
+    # Part file larger than the file on the server
+    url, data = server
+    partName = str(tmp_path / "granule.h5.part")
+    with open(partName, "wb") as f:
+        f.write(data + b"stale")
+
+    with pytest.raises(requests.ConnectionError):
+        downloader._transfer(url, partName)
+    assert not os.path.exists(partName)
+
+
+def test_transfer_resumed_checksum_from_sidecar(server, downloader, tmp_path):
+    # Checksum of the first response kept next to the part file
+    url, data = server
+    partName = str(tmp_path / "granule.h5.part")
+    with open(partName, "wb") as f:
+        f.write(data[:1000])
+    with open(partName + ".sum", "w") as f:
+        f.write(md5(b"another file"))
+
+    with pytest.raises(IOError):
+        downloader._transfer(url, partName)
+    assert not os.path.exists(partName)
+    assert not os.path.exists(partName + ".sum")
+
+
+def test_verify_truncated_part_is_kept(downloader, tmp_path):
+    partName = str(tmp_path / "granule.h5.part")
+    with open(partName, "wb") as f:
+        f.write(b"x" * 10)
+
+    with pytest.raises(requests.ConnectionError):
+        downloader._verify(partName, 20, None)
+    assert os.path.exists(partName)
+
+
+def test_verify_checksum_mismatch_removes_part(downloader, tmp_path):
+    partName = str(tmp_path / "granule.h5.part")
+    with open(partName, "wb") as f:
+        f.write(b"x" * 10)
+
+    with pytest.raises(IOError):
+        downloader._verify(partName, 10, md5(b"y" * 10))
+    assert not os.path.exists(partName)
+
+
+def test_fetch_renames_verified_file(server, downloader, tmp_path):
+    url, data = server
+    fileName = str(tmp_path / "granule.h5")
+    with open(fileName + ".part", "wb") as f:
+        f.write(data[:12345])
+
+    size, checksum = downloader.fetch(url, fileName)
+
+    assert (size, checksum) == (len(data), md5(data))
+    assert not os.path.exists(fileName + ".part")
+    with open(fileName, "rb") as f:
+        assert f.read() == data
@@ -0,0 +1,107 @@
+"""
+Tests of GEDI Tasks
+
+Shot docs read back by GEDI Extractor, built from synthetic granule 
+windows (see utils/gediTasks.py)
+
+Author: Marcus Moresco Boeno
+
+"""
+
+# Third party library imports
+import numpy as np
+import pytest
+
+# Local application imports
+from utils import config, gediTasks
+
+
+@pytest.fixture
+def window(bench):
+    # First window of shots within ROI of a synthetic beam
+    gediShots = bench["shots"](0)
+    gediShots.granule_id = "granule-0"
+    with gediShots.open_granule() as reader:
+        for beam in config.beam_list:
+            cols = next(iter(gediShots.beam_windows(reader, beam)), None)
+            if cols is not None and len(cols["shot_number"]) > 0:
+                break
+    granules = {
+        "granule-0": {
+            "l1b": gediShots.l1b_file, "l2a": gediShots.l2a_file, 
+            "l2b": gediShots.l2b_file
+            }
+        }
+    return gediShots, cols, beam, granules
+
+
+def test_normalize_shot_schemas_agree(window):
+    gediShots, cols, beam, granules = window
+    
+    # Same shots as schema 2 (typed, short keys) and schema 1 (strings)
+    gediShots.schema = 2
+    typed = gediShots.shot_documents(cols, beam)
+    gediShots.schema = 1
+    legacy = gediShots.shot_documents(cols, beam)
+    
+    for i, (doc2, doc1) in enumerate(zip(typed, legacy)):
+        doc2["_id"], doc1["_id"] = i, i
+        shot2 = gediTasks.ge_normalize_shot(doc2, granules)
+        shot1 = gediTasks.ge_normalize_shot(doc1, granules)
+
+        # Legacy docs are returned as they are
+        assert shot1 is doc1
+        
+        for field in ["location", "beam", "date_acquired", "l1b_file", "l2a_file", "l2b_file"]:
+            assert shot2[field] == shot1[field]
+        for field in config.basicInfo:
+            if field in cols:
+                assert shot2[field] == pytest.approx(float(shot1[field]), rel=1e-6)
+        assert shot2["beam"] == beam
+        assert shot2["shot_number"] == int(cols["shot_number"][i])
+
+
+def test_buckets_round_trip(window, monkeypatch):
+    gediShots, cols, beam, granules = window
+    monkeypatch.setattr(config, "bucket_size", 7)
+    
+    buckets = gediShots.bucket_documents(cols, beam)
+    assert [b["n"] for b in buckets[:-1]] == [7] * (len(buckets) - 1)
+
+    # Every member of every bucket back as shot data
+    shots = []
+    for index, bucket in enumerate(buckets):
+        bucket["_id"] = index
+        unpacked = gediTasks.ge_unpack_bucket(bucket)
+        mask = np.ones(bucket["n"], dtype=bool)
+        shots += gediTasks.ge_unbucket(
+            bucket, unpacked, mask, np.zeros(bucket["n"]), granules
+            )
+    
+    assert len(shots) == len(cols["shot_number"])
+    for i, shot in enumerate(shots):
+        assert shot["location"]["coordinates"] == [cols["lon"][i], cols["lat"][i]]
+        assert shot["beam"] == beam
+        assert shot["l1b_file"] == gediShots.l1b_file
+        for field in cols:
+            if field not in ["lon", "lat"]:
+                assert shot[field] == cols[field][i]
+
+
+def test_unbucket_selected_members(window):
+    gediShots, cols, beam, granules = window
+    bucket = gediShots.bucket_documents(cols, beam)[0]
+    bucket["_id"] = "b"
+    mask = np.zeros(bucket["n"], dtype=bool)
+    
+    # Nothing selected
+    assert gediTasks.ge_unbucket(bucket, gediTasks.ge_unpack_bucket(bucket), mask, None, granules) == []
+
+    # Selected members keep their position in the bucket
+    mask[[0, -1]] = True
+    dist = np.arange(bucket["n"], dtype=float)
+    shots = gediTasks.ge_unbucket(
+        bucket, gediTasks.ge_unpack_bucket(bucket), mask, dist, granules
+        )
+    assert [s["_id"] for s in shots] == ["b:0", f"b:{bucket['n'] - 1}"]
+    assert [s["dist2ref"] for s in shots] == [0.0, bucket["n"] - 1]
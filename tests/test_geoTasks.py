@@ -0,0 +1,118 @@
+"""
+Tests of GEO Tasks utilities
+
+Raster-accelerated point tests, footprint segment boxes within ROI and 
+GEDI Finder tiles (see utils/geoTasks.py)
+
+Author: Marcus Moresco Boeno
+
+"""
+
+# Third party library imports
+import numpy as np
+import pytest
+from shapely.geometry import Polygon
+
+# Local application imports
+from utils import geoTasks
+
+
+@pytest.fixture
+def extent():
+    # Concave polygon with a hole (boundary cells on every ring)
+    return Polygon(
+        [(-55, -30), (-47, -30), (-47, -25), (-51, -27.3), (-55, -25), (-55, -30)],
+        holes=[[(-53, -29), (-52, -29), (-52, -28), (-53, -28), (-53, -29)]]
+        )
+
+
+def test_rasterize_extent_classes(extent):
+    raster = geoTasks.rasterize_extent(extent, 0.05)
+    mask, size = raster["mask"], raster["cell_size"]
+
+    # Cell centers by class
+    rows, cols = np.indices(mask.shape)
+    lon = raster["minx"] + (cols + 0.5) * size
+    lat = raster["miny"] + (rows + 0.5) * size
+    inside = geoTasks.contains_xy(extent, lon.ravel(), lat.ravel()).reshape(mask.shape)
+
+    assert set(np.unique(mask).tolist()) == {0, 1, 2}
+    assert inside[mask == 1].all()
+    assert not inside[mask == 0].any()
+
+
+def test_rasterize_extent_max_cells(extent):
+    raster = geoTasks.rasterize_extent(extent, 0.001, max_cells=10000)
+
+    assert raster["cell_size"] > 0.001
+    assert raster["mask"].size <= 1.1 * 10000
+
+
+def test_points_within_matches_exact_test(extent):
+    # Points spread over the bounding box, plus points close to every ring
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(-56, -46, 50000)
+    lat = rng.uniform(-31, -24, 50000)
+    for ring in [extent.exterior] + list(extent.interiors):
+        coords = np.asarray(ring.coords)
+        t = rng.uniform(0, 1, (len(coords) - 1, 200))
+        x0, y0, x1, y1 = coords[:-1, :1], coords[:-1, 1:], coords[1:, :1], coords[1:, 1:]
+        noise = rng.normal(0, 0.01, (2,) + t.shape)
+        lon = np.concatenate([lon, (x0 + t * (x1 - x0) + noise[0]).ravel()])
+        lat = np.concatenate([lat, (y0 + t * (y1 - y0) + noise[1]).ravel()])
+    raster = geoTasks.rasterize_extent(extent, 0.05)
+    exact = geoTasks.contains_xy(extent, lon, lat)
+
+    # Boundary cells hold points on both sides of the rings
+    boundary = geoTasks.raster_lookup(raster, lon, lat) == 2
+    assert exact[boundary].any() and not exact[boundary].all()
+
+    # Raster lookup gives the same answer as the exact test
+    within = geoTasks.points_within(extent, lon, lat, raster=raster)
+    assert (within == exact).all()
+    assert (geoTasks.points_within(extent, lon, lat) == exact).all()
+
+
+def test_boxes_within(extent):
+    boxes = np.array([
+        [-54.9, -29.9, -54.8, -29.8],   # inside
+        [-52.8, -28.8, -52.2, -28.2],   # inside the hole
+        [-53.5, -28.5, -52.5, -28.4],   # crossing the hole ring
+        [-51.2, -26.0, -50.8, -25.5],   # inside the concave notch
+        [-60.0, -40.0, -59.0, -39.0],   # outside the bounding box
+        ])
+
+    within = geoTasks.boxes_within(extent, boxes)
+
+    assert within.tolist() == [True, False, True, False, False]
+
+
+def test_bbox_tiles_cover_bbox():
+    bbox = [-24, -55, -30, -47]
+
+    tiles = geoTasks.bbox_tiles(bbox, 5)
+
+    assert dict(tiles) == {
+        "-30_-55": [-25, -55, -30, -50],
+        "-30_-50": [-25, -50, -30, -47],
+        "-25_-55": [-24, -55, -25, -50],
+        "-25_-50": [-24, -50, -25, -47],
+        }
+
+    # Tiles do not overlap and add up to the bbox
+    area = sum((ul_lat - lr_lat) * (lr_lon - ul_lon) for ul_lat, ul_lon, lr_lat, lr_lon in dict(tiles).values())
+    assert area == pytest.approx((bbox[0] - bbox[2]) * (bbox[3] - bbox[1]))
+
+
+def test_bbox_tiles_edges_left_out():
+    # Bbox edges on tile boundaries, no zero-area tiles
+    tiles = geoTasks.bbox_tiles([-20, -55, -30, -45], 5)
+
+    assert sorted(dict(tiles)) == ["-25_-50", "-25_-55", "-30_-50", "-30_-55"]
+
+
+@pytest.mark.parametrize("tile_size", [0, 10])
+def test_bbox_tiles_single_query(tile_size):
+    bbox = [-26, -54, -28, -52]
+
+    assert geoTasks.bbox_tiles(bbox, tile_size) == [["bbox", bbox]]
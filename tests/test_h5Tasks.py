@@ -0,0 +1,103 @@
+"""
+Tests of HDF5 Tasks utilities
+
+Shot alignment, row gathering and footprint segments (see utils/h5Tasks.py)
+
+Author: Marcus Moresco Boeno
+
+"""
+
+# Third party library imports
+import h5py
+import numpy as np
+import pytest
+
+# Local application imports
+from utils import h5Tasks
+
+
+@pytest.fixture
+def h5file(tmp_path):
+    # Writable HDF5 file, closed after the test
+    with h5py.File(tmp_path / "test.h5", "w") as f:
+        yield f
+
+
+def test_align_shots_gaps_and_drops():
+    # L1B complete, L2A with a gap, L2B with dropped shots (unsorted)
+    l1b = np.arange(100, 120, dtype="u8")
+    l2a = np.concatenate([np.arange(100, 105), np.arange(110, 120)]).astype("u8")
+    l2b = np.array([119, 101, 103, 100, 111, 112, 104], dtype="u8")
+
+    common, indexes = h5Tasks.align_shots([l1b, l2a, l2b])
+
+    assert common.tolist() == [100, 101, 103, 104, 111, 112, 119]
+    for shots, index in zip([l1b, l2a, l2b], indexes):
+        assert shots[index].tolist() == common.tolist()
+
+
+def test_align_shots_no_common_shots():
+    common, indexes = h5Tasks.align_shots([np.arange(5), np.arange(5, 10)])
+
+    assert len(common) == 0
+    assert all(len(index) == 0 for index in indexes)
+
+
+@pytest.mark.parametrize("max_gap", [None, 0, 3, 100])
+def test_gather_rows_keeps_index_order(h5file, max_gap):
+    dataset = h5file.create_dataset("values", data=np.arange(1000) * 10)
+    index = np.array([512, 3, 4, 999, 5, 20, 511, 3])
+
+    rows = h5Tasks.gather_rows(dataset, index, max_gap)
+
+    assert rows.tolist() == (index * 10).tolist()
+
+
+def test_gather_rows_empty_index(h5file):
+    dataset = h5file.create_dataset("values", data=np.arange(10, dtype="f4"))
+
+    rows = h5Tasks.gather_rows(dataset, np.array([], dtype=int), 5)
+
+    assert rows.shape == (0,)
+    assert rows.dtype == np.dtype("f4")
+
+
+def test_rows_in_ranges():
+    index = np.array([0, 4, 5, 9, 10, 14, 15, 30, 41])
+    ranges = [[5, 10], [14, 16], [40, 41]]
+
+    mask = h5Tasks.rows_in_ranges(index, ranges)
+
+    assert index[mask].tolist() == [5, 9, 14, 15]
+
+
+def test_rows_in_ranges_no_ranges():
+    assert not h5Tasks.rows_in_ranges(np.arange(5), []).any()
+
+
+def test_segment_bounds_cover_track(h5file):
+    # Straight track with fill values on the second segment
+    lat = np.linspace(-30, -25, 1000)
+    lon = np.linspace(-55, -50, 1000)
+    lat[300:400] = -9999.0
+    h5file.create_dataset("lat", data=lat)
+    h5file.create_dataset("lon", data=lon)
+
+    segments = h5Tasks.segment_bounds(h5file["lat"], h5file["lon"], 250, 7)
+
+    # Segments are contiguous and span every row
+    assert [s[:2] for s in segments] == [[0, 250], [250, 500], [500, 750], [750, 1000]]
+
+    # Every valid shot lies inside the box of its segment
+    for beg, end, minx, miny, maxx, maxy in segments:
+        valid = lat[beg:end] > -90
+        assert (lon[beg:end][valid] >= minx).all() and (lon[beg:end][valid] <= maxx).all()
+        assert (lat[beg:end][valid] >= miny).all() and (lat[beg:end][valid] <= maxy).all()
+
+
+def test_segment_bounds_skip_invalid_segments(h5file):
+    # Whole granule without valid coordinates
+    h5file.create_dataset("lat", data=np.full(100, -9999.0))
+    h5file.create_dataset("lon", data=np.full(100, -9999.0))
+
+    assert h5Tasks.segment_bounds(h5file["lat"], h5file["lon"], 10, 3) == []
@@ -0,0 +1,530 @@
+"""
+Benchmark Tasks utilities
+
+Functions to generate synthetic GEDI granules and benchmark GEDI Storer
+
+Author: Marcus Moresco Boeno
+
+"""
+
+# Standard library imports
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Peak memory (not available on Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Third party library imports
+import h5py
+import numpy as np
+
+# Local application imports
+from utils import strings, config, gediClasses, gediTasks
+
+
+# HDF5 dtypes of synthetic columns (float32 if not listed)
+bench_dtypes = {
+    "lat": "f8",
+    "lon": "f8",
+    "shot_number": "u8",
+    "degrade": "u1",
+    "stale_return_flag": "u1",
+    "l2a_quality_flag": "u1",
+    "l2b_quality_flag": "u1"
+}
+
+# Metrics compared against the baseline (timings and throughput)
+bench_metrics = [
+    "read_s", "store_s", "drain_s", "total_s", "shots_per_s", "mb_per_s",
+    "peak_rss_mb"
+    ]
+
+
+class BenchHandler(SimpleHTTPRequestHandler):
+    """Static file handler of the local HTTP stand-in (open-ended Range 
+    requests as on LP DAAC, no request logs)"""
+    def send_head(self):
+        # Plain responses for folders, missing files and full requests
+        path = self.translate_path(self.path)
+        start = self.headers.get("Range", "")[len("bytes="):].rstrip("-")
+        if not os.path.isfile(path) or not start.isdigit():
+            return super().send_head()
+        
+        # Range not satisfiable past the end of the file
+        size, start = os.path.getsize(path), int(start)
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        
+        # Partial content from the requested byte
+        f = open(path, "rb")
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+        return f
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FinderHandler(SimpleHTTPRequestHandler):
+    """GEDI Finder stand-in: fake granule links after a fixed latency"""
+    latency = 0.5
+    num_links = 100
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        product, version = query["product"][0], query["version"][0]
+        time.sleep(self.latency)
+
+        # LP DAAC links of bench granules
+        links = [
+            f"https://e4ftl01.cr.usgs.gov/GEDI/{product}.{version}/"
+            f"2019.04.19/{product}_2019{100 + i:03d}000000_O{i:05d}_T{i:05d}"
+            f"_02_003_01.h5"
+            for i in range(1, self.num_links + 1)
+            ]
+        body = json.dumps({"data": links}).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_granule_names(index, version="01"):
+    """
+    > bench_granule_names(index, version="01")
+        Filenames of a synthetic L1B, L2A and L2B granule triplet.
+
+    > Arguments:
+        - index: Granule index (orbit number);
+        - version: GEDI Product Version.
+
+    > Output:
+        - str: String with Granule unique ID (str2match);
+        - list: L1B, L2A and L2B filenames.
+    """
+    # Same layout as LP DAAC granules (see GEDI_Catalog.parse_name())
+    strMatch = f"2019{100 + index:03d}000000_O{index:05d}_T{index:05d}"
+    return strMatch, [
+        f"processed_{product}_{strMatch}_02_003_{version}.h5"
+        for product in config.gedi_products
+        ]
+
+
+def bench_make_granule(
+    folder, index, num_shots, gap_rate=0.01, track=(-33, -22, -51),
+    waveforms=False, seed=0
+    ):
+    """
+    > bench_make_granule(folder, index, num_shots, gap_rate, track,
+                         waveforms, seed)
+        Write a synthetic L1B, L2A and L2B granule triplet (8 beams).
+
+    > Arguments:
+        - folder: Local storage folder (one subfolder per GEDI product);
+        - index: Granule index (orbit number);
+        - num_shots: Shots by beam;
+        - gap_rate: Fraction of shots missing on each product;
+        - track: [lat_start, lat_end, lon] of the along-track line;
+        - waveforms: Write rxwaveform and its sample ranges;
+        - seed: Random seed (same seed, same granule).
+
+    > Output:
+        - str: String with Granule unique ID (str2match);
+        - list: L1B, L2A and L2B filenames.
+    """
+    rng = np.random.default_rng(seed + index)
+    strMatch, files = bench_granule_names(index)
+
+    # Datasets of every product (see config.basicDatasets)
+    datasets = {product: {} for product in config.gedi_products}
+    for column, (product, dataset) in config.basicDatasets.items():
+        datasets[product][dataset] = column
+    for name, product, dataset, op, value in config.ingest_predicates:
+        datasets[product].setdefault(dataset, name)
+    if waveforms:
+        for column, (product, dataset) in config.waveformDatasets.items():
+            datasets[product][dataset] = column
+
+    # Open one file per product
+    h5 = {}
+    for product, filename in zip(config.gedi_products, files):
+        os.makedirs(os.path.join(folder, product), exist_ok=True)
+        h5[product] = h5py.File(os.path.join(folder, product, filename), "w")
+
+    for pos, beam in enumerate(config.beam_list):
+
+        # Along-track line, beams side by side (granules shifted eastwards)
+        t = np.linspace(0, 1, num_shots)
+        shots = np.uint64(index) * 10**13 + np.uint64(pos) * 10**10
+        cols = {
+            "shot_number": shots + np.arange(num_shots, dtype="u8") * 2,
+            "lat": track[0] + t * (track[1] - track[0]),
+            "lon": track[2] + 0.3 * index + 0.01 * pos + 0.2 * t,
+            "degrade": (rng.random(num_shots) < 0.02).astype("u1"),
+            "stale_return_flag": (rng.random(num_shots) < 0.02).astype("u1"),
+            "l2a_quality_flag": (rng.random(num_shots) < 0.8).astype("u1"),
+            "l2b_quality_flag": (rng.random(num_shots) < 0.8).astype("u1"),
+            "rx_sample_count": np.full(num_shots, 128, dtype="u2"),
+            "rx_sample_start_index": 1 + np.arange(num_shots, dtype="u8") * 128
+        }
+
+        for product in config.gedi_products:
+
+            # Shots missing from the product (misaligned products)
+            keep = np.flatnonzero(rng.random(num_shots) >= gap_rate)
+            group = h5[product].create_group(beam)
+            group.create_dataset("shot_number", data=cols["shot_number"][keep])
+
+            for dataset, column in datasets[product].items():
+                if dataset == "shot_number":
+                    continue
+                if column in cols:
+                    values = cols[column]
+                else:
+                    values = rng.random(num_shots) * 50
+                group.create_dataset(
+                    dataset,
+                    data=values[keep].astype(bench_dtypes.get(column, "f4"))
+                    )
+
+            # Waveform samples (sample ranges refer to the full array)
+            if waveforms and product == "GEDI01_B":
+                group.create_dataset(
+                    "rxwaveform", data=rng.random(num_shots * 128).astype("f4")
+                    )
+
+    # Close files
+    for f in h5.values():
+        f.close()
+
+    # Return results
+    return strMatch, files
+
+
+def bench_peak_rss():
+    """
+    > bench_peak_rss()
+        Peak resident memory of the process, in MB.
+
+    > Arguments:
+        - No arguments.
+
+    > Output:
+        - float: Peak RSS in MB (None if not available).
+    """
+    if resource is None:
+        return None
+
+    # Linux reports KB, macOS reports bytes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+def bench_storer(
+    folder, granules, roi, backend="null", waveforms=False, 
+    mongo_db="gedi_bench"
+    ):
+    """
+    > bench_storer(folder, granules, roi, backend, waveforms, mongo_db)
+        Time GEDI Storer stages over synthetic granules.
+
+    > Arguments:
+        - folder: Local storage folder with synthetic granules;
+        - granules: List of (str2match, [l1b, l2a, l2b]) granules;
+        - roi: Compiled ROI (GEDI_ROI instance);
+        - backend: Writer ("null" stand-in, "mongodb" or "parquet");
+        - waveforms: Store waveforms (granules written with waveforms);
+        - mongo_db: Database used by the "mongodb" backend (dropped first).
+
+    > Output:
+        - dict: Stage timings, throughput, peak RSS and shot counters.
+    """
+    # Writer under test
+    if backend == "mongodb":
+        writer = gediClasses.GEDI_Writer(mongo_db)
+    elif backend == "parquet":
+        writer = gediClasses.GEDI_ParquetWriter(os.path.join(folder, "PARQUET"))
+    else:
+        writer = gediClasses.GEDI_NullWriter()
+    writer.waveform_store = gediClasses.GEDI_WaveformStore(
+        os.path.join(folder, "WAVEFORMS")
+        )
+
+    # GEDI_Shots instances (footprints cached inside the bench folder)
+    tasks = []
+    for index_gran, (strMatch, files) in enumerate(granules):
+        gediShots = gediClasses.GEDI_Shots(
+            path=folder, l1b=files[0], l2a=files[1], l2b=files[2],
+            vers=files[0][-5:-3], strMatch=strMatch, beams=config.beam_list,
+            db=mongo_db, roi=roi, index_gran=index_gran+1,
+            num_grans=len(granules), waveforms=waveforms
+            )
+        gediShots.footprint = gediClasses.GEDI_Footprint(
+            files[0], root=os.path.join(folder, "FOOTPRINTS")
+            )
+        tasks.append(gediShots)
+
+    stages = {"read_s": 0.0, "store_s": 0.0, "drain_s": 0.0}
+    start = time.perf_counter()
+
+    writer.start()
+    try:
+        # Start from an empty database
+        if backend == "mongodb":
+            writer.client.drop_database(mongo_db)
+            writer.create_indexes([tasks[0].version])
+
+        # Granules read in-process, windows stored as they are read
+        pool = gediClasses.GEDI_StorerPool(writer, workers=0)
+        with pool:
+            t0 = time.perf_counter()
+            for gediShots in tasks:
+                pool.submit(gediShots)
+            pool.run()
+        
+        # Docs/tables creation and queueing vs. HDF5 and geometry work
+        stages["store_s"] = pool.store_time
+        stages["read_s"] = time.perf_counter() - t0 - pool.store_time
+
+    finally:
+        # Wait for queued writes
+        t0 = time.perf_counter()
+        writer.close()
+        stages["drain_s"] = time.perf_counter() - t0
+
+    total = time.perf_counter() - start
+
+    # Sum counters of every granule
+    counters = {}
+    for gediShots in tasks:
+        for name, count in gediShots.filter_stats.items():
+            counters[name] = counters.get(name, 0) + count
+    counters["docs"] = writer.docs
+
+    # Bytes of the granules
+    num_bytes = sum(
+        os.path.getsize(os.path.join(folder, product, f))
+        for strMatch, files in granules
+        for product, f in zip(config.gedi_products, files)
+        )
+
+    # Return results
+    return {
+        **stages,
+        "total_s": total,
+        "shots_per_s": counters.get("shots_read", 0) / total,
+        "mb_per_s": num_bytes / 1e6 / max(stages["read_s"], 1e-9),
+        "peak_rss_mb": bench_peak_rss(),
+        "counters": counters,
+        "stages": gediClasses.GEDI_Shots.sum_stats(tasks)["stages"]
+    }
+
+
+def bench_downloader(folder, num_files=8, size_mb=16, workers=config.download_workers):
+    """
+    > bench_downloader(folder, num_files, size_mb, workers)
+        Time GEDI Downloader against a local HTTP stand-in of LP DAAC.
+
+    > Arguments:
+        - folder: Folder with served and downloaded files;
+        - num_files: Number of files to download;
+        - size_mb: Size of each file, in MB;
+        - workers: Parallel transfers.
+
+    > Output:
+        - dict: Files, bytes, elapsed time, throughput and failed files.
+    """
+    served = os.path.join(folder, "SERVED")
+    local = os.path.join(folder, "DOWNLOADED")
+    os.makedirs(served, exist_ok=True)
+    os.makedirs(local, exist_ok=True)
+
+    # Random files to serve
+    names = [f"bench_{index:03d}.h5" for index in range(num_files)]
+    for name in names:
+        with open(os.path.join(served, name), "wb") as f:
+            f.write(os.urandom(int(size_mb * 1024**2)))
+
+    # Local HTTP server (any free port) on a background thread
+    handler = functools.partial(BenchHandler, directory=served)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    # Download every file
+    failed = []
+    try:
+        with gediClasses.GEDI_Downloader(workers=workers) as downloader:
+            jobs = [[url + name, os.path.join(local, name)] for name in names]
+            for f, fileName, size, checksum, error in downloader.download(jobs):
+                expected = os.path.getsize(os.path.join(served, os.path.basename(fileName)))
+                if error is not None or size != expected:
+                    failed.append(f)
+            elapsed = time.perf_counter() - downloader.start_time
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # Return results
+    return {
+        "files": downloader.files,
+        "mb": downloader.bytes / 1e6,
+        "elapsed_s": elapsed,
+        "mb_per_s": downloader.bytes / 1e6 / max(elapsed, 1e-9),
+        "failed": failed
+    }
+
+
+def bench_finder(
+    folder, latency=0.5, workers=config.finder_workers, 
+    bbox=config.default_bbox, tile_size=config.finder_tile_size
+    ):
+    """
+    > bench_finder(folder, latency, workers, bbox, tile_size)
+        Time GEDI Finder queries against a local stand-in of the gedifinder
+        endpoint (cold run, then cached run).
+
+    > Arguments:
+        - folder: Folder of the response cache;
+        - latency: Seconds the stand-in takes to answer each query;
+        - workers: Concurrent queries;
+        - bbox: Bounding box [ul_lat, ul_lon, lr_lat, lr_lon];
+        - tile_size: Tile size of large bboxes, in degrees (0 = no tiles).
+
+    > Output:
+        - dict: Elapsed time of each run, links found by query (no 
+            duplicates) and tiles searched.
+    """
+    pv_list = [[p, v] for p in config.gedi_products for v in config.gedi_versions]
+    FinderHandler.latency = latency
+
+    # Local HTTP server (any free port) on a background thread
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FinderHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    options = {
+        "base_url": f"http://127.0.0.1:{server.server_address[1]}/gedifinder?",
+        "cache": os.path.join(folder, "FINDER_CACHE"),
+        "ttl": 3600
+    }
+
+    # Cold queries, then queries served by the response cache
+    results = {}
+    try:
+        for run in ["cold_s", "cached_s"]:
+            start = time.perf_counter()
+            link_lists, coverage = gediTasks.gf_requests(
+                pv_list, bbox, workers, tile_size, **options
+                )
+            results[run] = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # Return results
+    results["links"] = {f"{p}_{v}": len(l) for (p, v), l in link_lists.items()}
+    results["tiles"] = len({t for tiles in coverage.values() for t in tiles})
+    return results
+
+
+def bench_report(results, baseline=None):
+    """
+    > bench_report(results, baseline=None)
+        Print benchmark results and differences to a baseline.
+
+    > Arguments:
+        - results: Output from bench_storer();
+        - baseline: Stored results of a previous run (default = None).
+
+    > Output:
+        - bool: False if shot counters differ from the baseline.
+    """
+    print("\n > GEDI Storer benchmark:")
+    for metric in bench_metrics:
+        value = results[metric]
+        line = f"     - {metric}: {'n/a' if value is None else round(value, 3)}"
+
+        # Relative change to the baseline
+        if baseline is not None and baseline.get(metric) and value is not None:
+            change = 100 * (value - baseline[metric]) / baseline[metric]
+            line += f" (baseline {round(baseline[metric], 3)}, {change:+.1f}%)"
+        print(line)
+
+    # Fine-grained stages (see GEDI_Shots.stage())
+    print("\n > Storer stages:")
+    for name, seconds in results["stages"].items():
+        print(f"     - {name}: {round(seconds, 3)}")
+
+    # Shot counters must match the baseline (same granules, same results)
+    matches = True
+    print("\n > Shot counters:")
+    for name, count in results["counters"].items():
+        line = f"     - {name}: {count}"
+        if baseline is not None:
+            expected = baseline["counters"].get(name)
+            if expected != count:
+                matches = False
+                line = strings.colors(line + f" (baseline {expected})", 1)
+        print(line)
+
+    if baseline is not None and not matches:
+        print(strings.colors("\n[WARNING] Shot counters differ from baseline!", 1))
+
+    # Return results
+    return matches
+
+
+def bench_load_baseline(path):
+    """
+    > bench_load_baseline(path)
+        Load results stored by bench_save_baseline().
+
+    > Arguments:
+        - path: Baseline JSON file.
+
+    > Output:
+        - dict: Baseline results (None if the file does not exist).
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def bench_save_baseline(results, path):
+    """
+    > bench_save_baseline(results, path)
+        Store benchmark results as a baseline.
+
+    > Arguments:
+        - results: Output from bench_storer();
+        - path: Baseline JSON file.
+
+    > Output:
+        - No outputs (Writing of external JSON file).
+    """
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
@@ -10,15 +10,75 @@ Author: Marcus Moresco Boeno
 # Local storage for files downloaded from earthdata
 localStorage = "C:\\Users\\marcu\\gedi_files"
 
+# Local catalog (SQLite) of granules found, downloaded and stored
+catalogPath = "C:\\Users\\marcu\\gedi_files\\gedi_catalog.sqlite"
+
+# GEDI Downloader transfers: parallel transfers on a pooled session, max
+# connections by host, chunk size (bytes) and timeout (seconds)
+download_workers = 4
+download_host_limit = 4
+download_chunk_size = 1024 * 1024
+download_timeout = 60
+
+# Retries of interrupted transfers (resumed from the .part file) and optional
+# checksum manifest ("<checksum>  <filename>" lines, md5 or sha256; "" = none)
+download_retries = 3
+download_checksums = ""
+
+# Pipelined download and store: delete raw granules once they are stored
+pipeline_delete_raw = False
+
+# Listing cache of localStorage product folders, re-globbed only when a 
+# folder changes ("" = always glob)
+localManifest = "C:\\Users\\marcu\\gedi_files\\gedi_manifest.json"
+
 # Name of base MongoDB database (without GEDI version)
 base_mongodb = "gedi_sc"
 
 # Bounding Box for the Santa Catarina State
 default_bbox = [-25.9, -53.9, -29.5, -48]
 
+# GEDI Finder queries: endpoint, parallel queries, timeout (seconds), 
+# retries (exponential backoff) and on-disk response cache by (product, 
+# version, bbox) kept for finder_cache_ttl seconds (0 = no cache)
+finder_url = "https://lpdaacsvc.cr.usgs.gov/services/gedifinder?"
+finder_workers = 6
+finder_timeout = 30
+finder_retries = 3
+finderCache = "C:\\Users\\marcu\\gedi_files\\FINDER_CACHE"
+finder_cache_ttl = 24 * 3600
+
+# GEDI Finder bboxes larger than finder_tile_size degrees are searched as 
+# tiles (0 = single query), and granules are ranked for download and ingest 
+# by the first tile of priority_tiles ("<lat0>_<lon0>") they touch
+finder_tile_size = 5
+priority_tiles = []
+
 # ROI for shot collection
 roiPath = "C:\\Users\\marcu\\gedi_files\\GEO\\sc_b5k_s2k_edit.geojson"
 
+# Compiled ROI cache (geometry and raster mask of roiPath keyed by file hash),
+# raster cells of roi_cell_size degrees (coarser if above roi_max_cells)
+roiCache = "C:\\Users\\marcu\\gedi_files\\GEO\\ROI_CACHE"
+roi_cell_size = 0.001
+roi_max_cells = 4000000
+
+# JSON-lines log of GEDI Storer stage timings and counters ("" = no log)
+storer_log = "C:\\Users\\marcu\\gedi_files\\gedi_storer_log.jsonl"
+
+# Number of GEDI Storer worker processes (0 = granules processed one by one 
+# in the GEDI Storer process, N = N worker processes; same meaning for 
+# GEDI Storer, Download and Store and GEDI_StorerPool)
+storer_workers = 0
+
+# Beam windows in flight between GEDI Storer worker processes and the writer
+# (workers block while the queue is full, bounding parent memory)
+storer_queue_size = 8
+
+# GEDI Storer MongoDB writer: docs per insert_many and max queued batches
+writer_batch_size = 1000
+writer_queue_size = 16
+
 # Available GEDI products and versions
 gedi_products = ["GEDI01_B", "GEDI02_A", "GEDI02_B"]
 gedi_versions = ["001"]
@@ -35,10 +95,118 @@ basicInfo = [
     "l2a_file", "l2b_file"
     ]
 
+# HDF5 datasets read by GEDI Storer for each basicInfo column
+# column: [GEDI product, dataset path inside the BEAM group]
+basicDatasets = {
+    "lat": ["GEDI01_B", "geolocation/latitude_bin0"],
+    "lon": ["GEDI01_B", "geolocation/longitude_bin0"],
+    "shot_number": ["GEDI01_B", "shot_number"],
+    "degrade": ["GEDI01_B", "geolocation/degrade"],
+    "stale_return_flag": ["GEDI01_B", "stale_return_flag"],
+    "l2a_quality_flag": ["GEDI02_A", "quality_flag"],
+    "l2b_quality_flag": ["GEDI02_B", "l2b_quality_flag"],
+    "omega": ["GEDI02_B", "omega"],
+    "cover": ["GEDI02_B", "cover"],
+    "pai": ["GEDI02_B", "pai"],
+    "rh100": ["GEDI02_B", "rh100"],
+    "fhd": ["GEDI02_B", "fhd_normal"],
+    "elev_TDX": ["GEDI01_B", "geolocation/digital_elevation_model"],
+    "elev_highest": ["GEDI02_A", "elev_highestreturn"],
+    "elev_ground": ["GEDI02_A", "elev_lowestmode"]
+}
+
+# Ingest predicates of GEDI Storer, evaluated as NumPy masks right after
+# shot alignment and before the ROI test (shots failing any are not stored)
+# [name, GEDI product, dataset inside the BEAM group, operator, value]
+#   operators: "==", "!=", ">", ">=", "<", "<="
+ingest_predicates = [
+    # ["l2a_quality_flag", "GEDI02_A", "quality_flag", "==", 1],
+    # ["l2b_quality_flag", "GEDI02_B", "l2b_quality_flag", "==", 1],
+    # ["degrade", "GEDI01_B", "geolocation/degrade", "==", 0],
+    # ["sensitivity", "GEDI02_A", "sensitivity", ">=", 0.9],
+]
+
+# Aligned shots per GEDI Storer window (read, align, filter and write),
+# bounds peak memory regardless of granule size (0 = whole beam at once)
+window_size = 50000
+
+# GEDI01_B datasets with rxwaveform sample ranges (see store_waveforms)
+waveformDatasets = {
+    "rx_sample_start_index": ["GEDI01_B", "rx_sample_start_index"],
+    "rx_sample_count": ["GEDI01_B", "rx_sample_count"]
+}
+
+# Shot docs schema written by GEDI Storer
+#   1: stringified numbers and full field names (legacy)
+#   2: native doubles/ints/int64, short keys and granules_v<version> ids
+shots_schema = 2
+
+# Short keys of schema 2 shot docs for each basicInfo field
+shotKeys = {
+    "location": "loc",
+    "shot_number": "sn",
+    "degrade": "dg",
+    "stale_return_flag": "srf",
+    "l2a_quality_flag": "qa",
+    "l2b_quality_flag": "qb",
+    "omega": "om",
+    "cover": "cv",
+    "pai": "pai",
+    "rh100": "rh",
+    "fhd": "fhd",
+    "elev_TDX": "et",
+    "elev_highest": "eh",
+    "elev_ground": "eg",
+    "beam": "b",
+    "date_acquired": "d",
+    "granule": "g"
+}
+
+# Storage backend of GEDI Storer and GEDI Extractor
+#   "mongodb": shots_v<version>/buckets_v<version> collections (base_mongodb)
+#   "parquet": columnar files on parquetStorage (requires pyarrow), one 
+#              partition per parquet_tile_size degrees lat/lon tile and year
+storage_backend = "mongodb"
+parquetStorage = "C:\\Users\\marcu\\gedi_files\\PARQUET"
+parquet_tile_size = 1
+
+# Granule footprint index used by GEDI Storer to skip beam segments outside 
+# the ROI (boxes of footprint_segment shots, from latitude_bin0/longitude_bin0 
+# read every footprint_step shots and padded by footprint_pad degrees)
+use_footprints = True
+footprintStorage = "C:\\Users\\marcu\\gedi_files\\FOOTPRINTS"
+footprint_segment = 1000
+footprint_step = 50
+footprint_pad = 0.01
+
+# Full-waveform store (GEDI01_B rxwaveform) filled by GEDI Storer, one 
+# memory-mappable sample array per version and waveform_tile_size tile
+store_waveforms = False
+waveformStorage = "C:\\Users\\marcu\\gedi_files\\WAVEFORMS"
+waveform_tile_size = 1
+
+# Granule subsetter: subsets of the downloaded granules are written next to 
+# them (<granule>.subset.h5) keeping only the datasets of basicDatasets, 
+# waveformDatasets, ingest_predicates and fullInfo, and the shots of footprint 
+# segments intersecting roiPath (gzip level subset_compression). Subsets are 
+# read from then on, downloads are left as they are (subsets of another ROI 
+# fail the granule until removed).
+subset_granules = False
+subset_compression = 4
+
+# Shot storage mode of GEDI Storer (mongodb backend)
+#   "shots": one doc per shot on shots_v<version>
+#   "buckets": one doc per bucket_size consecutive shots on buckets_v<version>
+storage_mode = "shots"
+bucket_size = 1000
+
+# Keys of bucket packed arrays not listed in shotKeys
+bucketKeys = {"lon": "x", "lat": "y"}
+
 fullInfo = {
     "GEDI01_B": [
         "rx_sample_count", "rx_sample_start_index", "rxwaveform", "shot_number",
-        "stale_return_flag", "gelocation/degrade", "geolocation/surface_type",  
+        "stale_return_flag", "geolocation/degrade", "geolocation/surface_type",  
         "geolocation/digital_elevation_model"
     ],
     "GEDI02_A": [
@@ -51,3 +219,15 @@ fullInfo = {
         "rhov", "rhov_error", "rossg", "rv", "surface_flag"
     ]
 }
+
+# HDF5 datasets read by GEDI Extractor for each fullInfo column
+# (rxwaveform is sliced with rx_sample_start_index and rx_sample_count)
+fullDatasets = {
+    dataset.split("/")[-1]: [product, dataset]
+    for product, datasets in fullInfo.items() for dataset in datasets
+    if dataset != "rxwaveform"
+}
+
+# Max gap (rows) read through by a single HDF5 slice when GEDI Extractor 
+# reads sparse shots of a beam (larger gaps split the read)
+extract_read_gap = 4096
@@ -10,21 +10,39 @@ Author: Marcus Moresco Boeno
 # Standard library imports
 import os
 import sys
-import urllib.request
+import glob
 import json
+import time
+import queue
+import threading
+import hashlib
+import base64
+import contextlib
+import sqlite3
+import multiprocessing
 
 # library specific imports
 from datetime import datetime
-from shapely.geometry import Point
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse
 
 # Third party library imports
 import h5py
 import pymongo
-import pandas as pd
+import requests
 import numpy as np
+from bson.binary import Binary
+from shapely import wkb
+
+# Optional columnar storage backend (see config.storage_backend)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
 # Local application imports
-from utils import strings
+from utils import strings, config, geoTasks, h5Tasks
 
 
 class GEDI_request(object):
@@ -35,36 +53,51 @@ class GEDI_request(object):
     of interest
 
     Attributes:
-        - lpdaac_base_url: LPDAAC_NASA GEDI Finder base URL;
+        - lpdaac_base_url: LPDAAC_NASA GEDI Finder base URL 
+            (see config.finder_url);
         - product: GEDI Product Level;
         - version: GEDI Product Version;
         - bbox: Bounding of of ROI (see config.default_bbox);
-        - output: Output format (always set to "json").
+        - output: Output format (always set to "json");
+        - timeout: Request timeout, in seconds (see config.finder_timeout);
+        - retries: Retries with exponential backoff (see config.finder_retries);
+        - cache: Response cache folder (see config.finderCache, "" = no cache);
+        - ttl: Seconds a cached response is valid (see config.finder_cache_ttl);
+        - from_cache: True if the last response was read from cache.
     
     Methods:
-        - process_request(self): Process request and return list of
+        - request_url(self): GEDI Finder URL of the request
+        - cache_path(self): Path to the cached response
+        - process_request(self, session): Process request and return list of
             GEDI granules of interest.
 
     """
-    # GEDI Finder base URL
-    lpdaac_base_url = "https://lpdaacsvc.cr.usgs.gov/services/gedifinder?"
-
-    def __init__(self, p, v, bbox):
+    def __init__(
+        self, p, v, bbox, base_url=config.finder_url, 
+        timeout=config.finder_timeout, retries=config.finder_retries,
+        cache=config.finderCache, ttl=config.finder_cache_ttl
+        ):
+        self.lpdaac_base_url = base_url
         self.product = p
         self.version = v
         self.bbox = str(bbox).replace(" ","")
         self.output = "json"
+        self.timeout = timeout
+        self.retries = retries
+        self.cache = cache
+        self.ttl = ttl
+        self.from_cache = False
 
-    def process_request(self):
+    def request_url(self):
         """
-        > process_request(self)
-            Make GEDI Finder Request and return list of GEDI Granules.
+        > request_url(self)
+            GEDI Finder URL of the request.
 
         > Arguments:
             - self: GEDI_request instance.
         
         > Output:
-            - list: List of GEDI Granules matching a given Bouding Box.
+            - str: URL.
         """
         # Crete URL to access LP DAAC GEDI-Finder
         url = self.lpdaac_base_url + "product=" + self.product
@@ -72,14 +105,460 @@ class GEDI_request(object):
         url += "&bbox=" + self.bbox
         url += "&output=" + self.output
         
-        # Read data as a JSON file
-        with urllib.request.urlopen(url) as webPage:
-            data = json.loads(webPage.read().decode())
+        # Return results
+        return url
+
+    def cache_path(self):
+        """
+        > cache_path(self)
+            Path to the cached response, keyed by product, version and bbox.
+
+        > Arguments:
+            - self: GEDI_request instance.
+        
+        > Output:
+            - str: Path to JSON file.
+        """
+        key = f"{self.lpdaac_base_url}|{self.product}|{self.version}|{self.bbox}"
+        digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+        return os.path.join(
+            self.cache, f"{self.product}_{self.version}_{digest}.json"
+            )
+
+    def process_request(self, session=None):
+        """
+        > process_request(self, session=None)
+            Make GEDI Finder Request and return list of GEDI Granules (cached
+            responses younger than self.ttl are returned without a request).
+
+        > Arguments:
+            - self: GEDI_request instance;
+            - session: requests.Session shared by requests (default = None).
+        
+        > Output:
+            - list: List of GEDI Granules matching a given Bouding Box.
+        """
+        # Cached response
+        self.from_cache = False
+        if self.cache and self.ttl > 0 and os.path.exists(self.cache_path()):
+            if time.time() - os.path.getmtime(self.cache_path()) < self.ttl:
+                with open(self.cache_path(), "r") as f:
+                    self.from_cache = True
+                    return json.load(f)["data"]
+        
+        # Request with retries (connection errors, timeouts and 5xx codes)
+        get = requests.get if session is None else session.get
+        for attempt in range(self.retries + 1):
+            try:
+                response = get(self.request_url(), timeout=self.timeout)
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    data = response.json()
+                    break
+                error = requests.HTTPError(f"Status code: {response.status_code}")
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                error = exc
+            
+            if attempt == self.retries:
+                raise error
+            time.sleep(2 ** attempt)
+        
+        # Update cache (atomic rename)
+        if self.cache and self.ttl > 0:
+            os.makedirs(self.cache, exist_ok=True)
+            with open(self.cache_path() + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(self.cache_path() + ".tmp", self.cache_path())
         
         # Return list of HTTPS links for download steps 
         return data["data"]
 
 
+class GEDI_Downloader():
+    """
+    GEDI_Downloader class
+
+    Download GEDI granules with parallel transfers on a pooled HTTP session
+
+    Attributes:
+        - auth: (username, password) for the session (None = no auth)
+        - workers: Parallel transfers (see config.download_workers)
+        - host_limit: Max connections by host (see config.download_host_limit)
+        - chunk_size: Bytes by read/write (see config.download_chunk_size)
+        - timeout: Connect/read timeout, in seconds
+        - verify: Verify TLS certificates
+        - retries: Retries of interrupted transfers (resumed with HTTP Range)
+        - checksums: {filename: checksum} expected (see load_checksums())
+        - session: Pooled requests.Session shared by every transfer
+        - pool: Transfer threads of submit() (created on first call)
+        - host_slots: Semaphore by host (connection limits)
+        - bytes: Bytes downloaded
+        - files: Files downloaded
+        - start_time: Time the downloader was started
+    
+    Methods:
+        - start(self): Create pooled session
+        - close(self): Close pooled session
+        - fetch(self, url, fileName): Download, resume and verify a file
+        - load_checksums(path): Read checksum manifest (staticmethod)
+        - download(self, jobs): Download files in parallel (generator)
+        - submit(self, jobs, done): Download files in parallel (callback)
+        - report(self): Print aggregate throughput
+
+    """
+    def __init__(
+        self, auth=None, workers=config.download_workers, 
+        host_limit=config.download_host_limit, 
+        chunk_size=config.download_chunk_size, 
+        timeout=config.download_timeout, verify=False,
+        retries=config.download_retries, checksums=None
+        ):
+        self.auth = auth
+        self.workers = workers
+        self.host_limit = host_limit
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.verify = verify
+        self.retries = retries
+        self.checksums = checksums or {}
+        self.session = None
+        self.pool = None
+        self.host_slots = {}
+        self.bytes = 0
+        self.files = 0
+        self.start_time = None
+        self.lock = threading.Lock()
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """
+        > start(self)
+            Create pooled session (one connection pool by host).
+
+        > Arguments:
+            - self: GEDI_Downloader instance.
+        
+        > Output:
+            - No outputs (leads to session creation).
+        """
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.workers, pool_maxsize=self.workers
+            )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.auth = self.auth
+        self.session.verify = self.verify
+        self.start_time = time.perf_counter()
+
+    def close(self):
+        """
+        > close(self)
+            Stop transfer threads (queued transfers are cancelled) and close
+            pooled session.
+
+        > Arguments:
+            - self: GEDI_Downloader instance.
+        
+        > Output:
+            - No outputs (leads to session closing).
+        """
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def fetch(self, url, fileName):
+        """
+        > fetch(self, url, fileName)
+            Download a file to fileName + ".part", resuming interrupted 
+            transfers with HTTP Range requests. The file is renamed to 
+            fileName only once size and checksum are verified.
+
+        > Arguments:
+            - self: GEDI_Downloader instance;
+            - url: File URL;
+            - fileName: Destination file.
+        
+        > Output:
+            - int: File size, in bytes;
+            - str: File checksum ("<algorithm>:<hexdigest>").
+        """
+        partName = fileName + ".part"
+        
+        # Expected checksum (manifest first, then server headers)
+        expected = self.checksums.get(os.path.basename(fileName))
+
+        with self._host_slot(url):
+            for attempt in range(self.retries + 1):
+                try:
+                    size, checksum = self._transfer(url, partName, expected)
+                    break
+                except Exception as error:
+                    # Interrupted (dropped connections, timeouts, truncated 
+                    # bodies, 5xx codes), .part file is kept and resumed
+                    if attempt == self.retries or not self._retryable(error):
+                        raise
+                    time.sleep(2 ** attempt)
+        
+        # Verified file gets its final name (atomic rename)
+        os.replace(partName, fileName)
+        if os.path.exists(partName + ".sum"):
+            os.remove(partName + ".sum")
+        with self.lock:
+            self.files += 1
+        
+        # Return results
+        return size, checksum
+
+    @staticmethod
+    def load_checksums(path=config.download_checksums):
+        """
+        > load_checksums(path=config.download_checksums)
+            Read checksum manifest (md5sum/sha256sum format).
+
+        > Arguments:
+            - path: Manifest with "<checksum>  <filename>" lines ("" = none).
+        
+        > Output:
+            - dict: {filename: "<algorithm>:<hexdigest>"}.
+        """
+        checksums = {}
+        if not path or not os.path.exists(path):
+            return checksums
+        
+        with open(path, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 2:
+                    continue
+                digest, name = parts[0].lower(), parts[-1].lstrip("*")
+                
+                # Algorithm given by the digest length
+                algorithm = {32: "md5", 64: "sha256"}.get(len(digest))
+                if algorithm is not None:
+                    checksums[os.path.basename(name)] = f"{algorithm}:{digest}"
+        
+        # Return results
+        return checksums
+
+    def download(self, jobs):
+        """
+        > download(self, jobs)
+            Download files in parallel, reported as transfers complete.
+
+        > Arguments:
+            - self: GEDI_Downloader instance;
+            - jobs: List of [url, fileName].
+        
+        > Output:
+            - Generator of (url, fileName, size, checksum, error) by file 
+                (error is None for files downloaded).
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {
+                pool.submit(self.fetch, url, fileName): (url, fileName)
+                for url, fileName in jobs
+                }
+            for future in as_completed(futures):
+                url, fileName = futures[future]
+                try:
+                    yield (url, fileName, *future.result(), None)
+                except Exception as error:
+                    yield url, fileName, None, None, error
+
+    def submit(self, jobs, done):
+        """
+        > submit(self, jobs, done)
+            Download files in parallel without blocking, each result is 
+            passed to done() by the transfer thread once it completes.
+
+        > Arguments:
+            - self: GEDI_Downloader instance;
+            - jobs: List of [url, fileName];
+            - done: Function called with (url, fileName, size, checksum, 
+                error) by file (error is None for files downloaded).
+        
+        > Output:
+            - No outputs (leads to files download).
+        """
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        
+        def report(future, url, fileName):
+            # Cancelled transfers (see close()) are not reported
+            if future.cancelled():
+                return
+            try:
+                size, checksum = future.result()
+            except Exception as error:
+                done(url, fileName, None, None, error)
+            else:
+                done(url, fileName, size, checksum, None)
+
+        for url, fileName in jobs:
+            future = self.pool.submit(self.fetch, url, fileName)
+            future.add_done_callback(
+                lambda future, url=url, fileName=fileName: report(future, url, fileName)
+                )
+
+    def report(self):
+        """
+        > report(self)
+            Print files, bytes and aggregate throughput (MB/s).
+
+        > Arguments:
+            - self: GEDI_Downloader instance.
+        
+        > Output:
+            - No outputs (prints downloader throughput).
+        """
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.bytes / 1e6 / elapsed if elapsed > 0 else 0
+        print(f"\n > Files downloaded: {self.files} ({self.bytes / 1e6:.1f} MB)", end=" ")
+        print(strings.colors(f"in {elapsed:.1f} s ({rate:.1f} MB/s)", 3))
+
+    def _transfer(self, url, partName, expected=None):
+        # Bytes already on disk are requested with a Range header
+        offset = os.path.getsize(partName) if os.path.exists(partName) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        with self.session.get(
+            url, stream=True, timeout=self.timeout, headers=headers
+            ) as response:
+            
+            # Range not satisfiable: .part may already be complete
+            if response.status_code == 416:
+                total = self._range_total(response.headers)
+                if total != offset:
+                    os.remove(partName)
+                    raise requests.ConnectionError(f"Stale partial file {partName}")
+                if expected is None:
+                    expected = self._expected_checksum(url, partName, response)
+                return self._verify(partName, total, expected)
+
+            response.raise_for_status()
+            
+            # Server ignored the Range header, start over
+            if response.status_code != 206:
+                offset = 0
+            total = self._range_total(response.headers)
+            if total is None and "Content-Length" in response.headers:
+                total = offset + int(response.headers["Content-Length"])
+            
+            # Checksum sent by the server, kept next to the .part file so 
+            # resumed (206) transfers are verified too
+            if expected is None:
+                expected = self._expected_checksum(url, partName, response)
+
+            # Large buffered chunks appended to the .part file
+            with open(partName, "ab" if offset else "wb", buffering=self.chunk_size) as f:
+                for chunk in response.iter_content(self.chunk_size):
+                    f.write(chunk)
+                    with self.lock:
+                        self.bytes += len(chunk)
+        
+        # Return results
+        return self._verify(partName, total, expected)
+
+    def _verify(self, partName, total, expected):
+        # Size check (truncated transfers are resumed)
+        size = os.path.getsize(partName)
+        if total is not None and size < total:
+            raise requests.ConnectionError(
+                f"Truncated transfer {partName}: {size} of {total} bytes"
+                )
+        
+        # Checksum of the whole file (expected algorithm, md5 otherwise)
+        algorithm = expected.split(":")[0] if expected else "md5"
+        h = hashlib.new(algorithm)
+        with open(partName, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                h.update(chunk)
+        checksum = f"{algorithm}:{h.hexdigest()}"
+        
+        # Corrupt files are removed (never renamed to the final name)
+        if (total is not None and size != total) or (expected and checksum != expected):
+            os.remove(partName)
+            if os.path.exists(partName + ".sum"):
+                os.remove(partName + ".sum")
+            raise IOError(
+                f"Verification failed for {partName}: {size} bytes, {checksum} "
+                f"(expected {total} bytes, {expected})"
+                )
+        
+        # Return results
+        return size, checksum
+
+    def _expected_checksum(self, url, partName, response):
+        # Full responses carry the checksum headers of the file
+        if response.status_code == 200:
+            expected = self._header_checksum(response.headers)
+            if expected is not None:
+                with open(partName + ".sum", "w") as f:
+                    f.write(expected)
+            elif os.path.exists(partName + ".sum"):
+                os.remove(partName + ".sum")
+            return expected
+        
+        # Resumed transfers: checksum of the first response, else HEAD request
+        if os.path.exists(partName + ".sum"):
+            with open(partName + ".sum", "r") as f:
+                return f.read().strip() or None
+        head = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+        return self._header_checksum(head.headers) if head.ok else None
+
+    @staticmethod
+    def _retryable(error):
+        # Errors of interrupted transfers (4xx codes and corrupt files are not)
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code >= 500
+        return isinstance(error, (
+            requests.ConnectionError, requests.Timeout, 
+            requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.ContentDecodingError
+            ))
+
+    @staticmethod
+    def _range_total(headers):
+        # Total size from "Content-Range: bytes <start>-<end>/<total>"
+        total = headers.get("Content-Range", "").split("/")[-1]
+        return int(total) if total.isdigit() else None
+
+    @staticmethod
+    def _header_checksum(headers):
+        # Content-MD5 or Digest (md5/sha-256) headers, base64 encoded
+        digests = {"md5": headers.get("Content-MD5")}
+        for item in headers.get("Digest", "").split(","):
+            name, _, value = item.strip().partition("=")
+            if name.lower() in ("md5", "sha-256"):
+                digests[name.lower().replace("-", "")] = value
+        for algorithm in ("sha256", "md5"):
+            if digests.get(algorithm):
+                try:
+                    digest = base64.b64decode(digests[algorithm]).hex()
+                except ValueError:
+                    continue
+                return f"{algorithm}:{digest}"
+        return None
+
+    def _host_slot(self, url):
+        # Semaphore limiting connections to the url host
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.host_limit)
+            return self.host_slots[host]
+
+
 class GEDI_Shots():
     """
     GEDI_Shots class
@@ -95,59 +574,209 @@ class GEDI_Shots():
         - strMatch: String with Granule unique ID
         - beams: GEDI BEAM List [BEAM0000, BEAM0001, ..., BEAM1011]
         - db: Default database (see config.base_mongodb)
-        - extent: Limiting extent to db inserts (see config.roiPath)
+        - roi: Compiled ROI limiting db inserts (GEDI_ROI, see config.roiPath)
         - index_gran: Batch index for granule
         - num_grans: Number of granule being batch processed
+        - schema: Shot docs schema (see config.shots_schema)
+        - storage: One doc per shot or per bucket (see config.storage_mode)
+        - granule_id: Granule _id on granules_v<version>
+        - committed_beams: Beams already committed (see checkpoints_v<version>)
+        - predicates: Ingest predicates (see config.ingest_predicates)
+        - filter_stats: Shots read, removed by each filter and kept
+        - beam_stats: Stage timings, shot counters, bytes read and docs by beam
+        - window_size: Shots per streaming window (see config.window_size)
+        - waveforms: Store GEDI01_B waveforms (see config.store_waveforms)
+        - footprints: Skip segments outside ROI (see config.use_footprints)
+        - footprint: GEDI_Footprint of the granule (loaded on first beam,
+            default cache folder unless set beforehand)
+        - subset: Subset granules before reading (see config.subset_granules)
+        - subset_suffix: Filename suffix of granule subsets (class attribute)
     
     Methods:
-        - update_process_log(self): Update log of files processed
-        - process_and_store(self): Insert Shot data into MongoDB
+        - register_granule(self, writer): Get granule _id
+        - load_checkpoints(self, writer): Get beams already committed
+        - uncommitted_beams(self): Beams left to store
+        - checkpoint_beam(self, writer, beam): Queue beam checkpoint
+        - update_process_log(self, writer): Update log of files processed
+        - process_and_store(self, writer): Insert Shot data into MongoDB
+        - source_name(fileName): Granule filename of a subset (static)
+        - granule_files(self): Filenames read (subsets when found)
+        - open_granule(self): Create GranuleReader for the granules
+        - process_windows(self, put): Stream windows of shots within ROI
+        - subset_granule(self): Write granule subsets keeping ROI shots only
+        - subset_beam(self, src, dst, rows, datasets): Copy beam rows
+        - store_shots(self, writer, cols, beam): Insert shots into MongoDB
+        - beam_windows(self, reader, beam): Walk beam in windows of shots
+        - footprint_runs(self, reader, beam, indexes): Runs of shots within 
+            ROI footprint segments
+        - process_window(self, reader, beam, indexes): Read window shots
+        - count_shots(self, name, count, beam): Update filter counters
+        - stage(self, beam, name): Time a storer stage (context manager)
+        - beam_stat(self, beam, name, value): Update a beam counter
+        - log_stats(self, path): Append stats to the JSON-lines storer log
+        - sum_stats(tasks): Sum beam stats of a set of granules (static)
+        - merge_stats(self, filter_stats, beam_stats): Add worker stats
+        - shot_documents(self, cols, beam): Create MongoDB docs from columns
+        - shot_documents_v1(self, cols, beam): Create legacy (schema 1) docs
+        - bucket_documents(self, cols, beam): Create bucket docs from columns
+        - shot_table(self, cols, beam): Create columnar shot table
 
     """
-    def __init__(self, path, l1b, l2a, l2b, vers, strMatch, beams, db, extent, index_gran, num_grans):
+    # Granule subsets, next to the granules (see subset_granule())
+    subset_suffix = ".subset.h5"
+
+    def __init__(
+        self,
+        path,
+        l1b,
+        l2a,
+        l2b,
+        vers,
+        strMatch,
+        beams,
+        db,
+        roi,
+        index_gran,
+        num_grans,
+        schema=config.shots_schema,
+        storage=config.storage_mode,
+        predicates=config.ingest_predicates,
+        window_size=config.window_size,
+        waveforms=config.store_waveforms,
+        footprints=config.use_footprints,
+        subset=config.subset_granules
+        ):
         self.path = path
-        self.l1b_file = l1b
-        self.l2a_file = l2a
-        self.l2b_file = l2b
+        self.l1b_file = self.source_name(l1b)
+        self.l2a_file = self.source_name(l2a)
+        self.l2b_file = self.source_name(l2b)
         self.version = vers
         self.strMatch = strMatch
         self.beams = beams
         self.db = db
-        self.extent = extent
+        self.roi = roi
         self.index_gran = index_gran
         self.num_grans = num_grans
-    
-    def update_process_log(self):
+        self.schema = schema
+        self.storage = storage
+        self.granule_id = None
+        self.committed_beams = []
+        self.predicates = predicates
+        self.window_size = window_size
+        self.waveforms = waveforms
+        self.footprints = footprints
+        self.footprint = None
+        self.subset = subset
+        self.filter_stats = {}
+        self.beam_stats = {}
+
+    def register_granule(self, writer):
         """
-        > process_request(self)
-            Update log of files processed into MongoDB Database.
+        > register_granule(self, writer)
+            Get granule _id on granules_v<version> (inserted if missing).
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - writer: Running GEDI_Writer instance.
+        
+        > Output:
+            - Granule _id referenced by shot and bucket docs.
+        """
+        # Granule filenames are stored once instead of on every shot doc
+        self.granule_id = writer.register_granule(
+            self.version, self.strMatch, 
+            self.l1b_file, self.l2a_file, self.l2b_file
+            )
+
+        # Return results
+        return self.granule_id
+
+    def load_checkpoints(self, writer):
+        """
+        > load_checkpoints(self, writer)
+            Get beams already committed by a previous (interrupted) run.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - writer: Running GEDI_Writer instance.
+        
+        > Output:
+            - list: Committed beams (also stored on self.committed_beams).
+        """
+        # Checkpoints of the granule
+        self.committed_beams = writer.find_checkpoints(self.version, self.strMatch)
+
+        # Return results
+        return self.committed_beams
+
+    def uncommitted_beams(self):
+        """
+        > uncommitted_beams(self)
+            Get beams not committed yet (see load_checkpoints()).
 
         > Arguments:
             - self: GEDI_Shots instance.
         
+        > Output:
+            - list: Beams left to store.
+        """
+        return [beam for beam in self.beams if beam not in self.committed_beams]
+
+    def checkpoint_beam(self, writer, beam):
+        """
+        > checkpoint_beam(self, writer, beam)
+            Queue beam checkpoint, written after every beam doc.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - writer: Running GEDI_Writer instance;
+            - beam: GEDI BEAM name (see config.beam_list).
+        
+        > Output:
+            - No outputs (leads to checkpoint insertion).
+        """
+        writer.insert_one(
+            "checkpoints_v" + self.version, 
+            {"str2match": self.strMatch, "beam": beam}
+            )
+
+    def update_process_log(self, writer):
+        """
+        > update_process_log(self, writer)
+            Update log of files processed into MongoDB Database.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - writer: Running GEDI_Writer instance.
+        
         > Output:
             - No outputs (leads to process log update).
         """
-        with pymongo.mongo_client.MongoClient() as mongo:
-                    
-            # Get DB
-            db = mongo.get_database(self.db)
-                    
-            # Upload log
-            db["processed_v" + self.version].insert_one({
+        # Log is queued after the granule shots, so it is written only once
+        # all of them were committed by the writer
+        writer.insert_one(
+            "processed_v" + self.version, 
+            {
                 "str2match": self.strMatch,
                 "l1b": self.l1b_file,
                 "l2a": self.l2a_file,
                 "l2b": self.l2b_file
-            })
+            }
+        )
+
+        # Beam checkpoints are no longer needed
+        writer.delete_many(
+            "checkpoints_v" + self.version, {"str2match": self.strMatch}
+            )
     
-    def process_and_store(self):
+    def process_and_store(self, writer):
         """
-        > process_request(self)
+        > process_and_store(self, writer)
             Insert Shot data into MongoDB.
 
         > Arguments:
-            - self: GEDI_Shots instance.
+            - self: GEDI_Shots instance;
+            - writer: Running GEDI_Writer instance.
         
         > Output:
             - No outputs (leads to Shot data insertion).
@@ -155,135 +784,3205 @@ class GEDI_Shots():
         # Print message on file being processed
         print(f"\n> Processing files ({self.index_gran}/{self.num_grans})")
         print(strings.colors(f"     > {self.l1b_file}", 3))
-        print(strings.colors(f"     > {self.l1b_file}", 3))
-        print(strings.colors(f"     > {self.l1b_file}", 3))
+        print(strings.colors(f"     > {self.l2a_file}", 3))
+        print(strings.colors(f"     > {self.l2b_file}", 3))
 
+        # Get granule reference for shot and bucket docs
+        self.register_granule(writer)
 
-        # Iterate over BEAM list
-        for beam in self.beams:
+        # Resume at the first uncommitted beam
+        self.load_checkpoints(writer)
+        writer.reset_beams(self.version, self.strMatch, self.uncommitted_beams())
 
-            # Print info on beam being processed
-            print(f"          > {beam}")
+        # Compact granules (no-op for granules already subset)
+        if self.subset:
+            self.subset_granule()
 
-            # Create connection with HDF5 files
-            l1b_h5 = h5py.File(
-                self.path + os.sep + "GEDI01_B" + os.sep + self.l1b_file, 
-                "r"
-                )
-            l2a_h5 = h5py.File(
-                self.path + os.sep + "GEDI02_A" + os.sep + self.l2a_file, 
-                "r"
+        # Open L1B, L2A and L2B granules only once
+        with self.open_granule() as reader:
+
+            # Iterate over BEAM list
+            for beam in self.beams:
+
+                # Print info on beam being processed
+                print(f"          > {beam}")
+
+                # Skip beams committed by a previous run
+                if beam in self.committed_beams:
+                    print(strings.colors("               (already stored)", 3))
+                    continue
+
+                # Stream beam windows (read, align, filter) to the writer
+                for cols in self.beam_windows(reader, beam):
+                    self.store_shots(writer, cols, beam)
+                
+                # Beam is committed once all its windows are written
+                self.checkpoint_beam(writer, beam)
+
+    @staticmethod
+    def source_name(fileName):
+        """
+        > source_name(fileName)
+            Granule filename of a subset filename.
+
+        > Arguments:
+            - fileName: Granule or subset filename.
+        
+        > Output:
+            - str: Granule filename, as downloaded.
+        """
+        suffix = GEDI_Shots.subset_suffix
+        if fileName.endswith(suffix):
+            return fileName[:-len(suffix)] + ".h5"
+        return fileName
+
+    def granule_files(self):
+        """
+        > granule_files(self)
+            L1B, L2A and L2B filenames read: subsets (see subset_granule()) 
+            when all of them are found on local storage, granules otherwise.
+
+        > Arguments:
+            - self: GEDI_Shots instance.
+        
+        > Output:
+            - list: L1B, L2A and L2B filenames.
+        """
+        files = [self.l1b_file, self.l2a_file, self.l2b_file]
+        subsets = [os.path.splitext(f)[0] + self.subset_suffix for f in files]
+        found = all(
+            os.path.exists(os.path.join(self.path, product, f)) 
+            for product, f in zip(config.gedi_products, subsets)
             )
-            l2b_h5 = h5py.File(
-                self.path + os.sep + "GEDI02_B" + os.sep + self.l2b_file, 
-                "r"
-                )
+        
+        # Return results
+        return subsets if found else files
 
+    def open_granule(self):
+        """
+        > open_granule(self)
+            Create GranuleReader for the L1B, L2A and L2B granules (or their
+            subsets, see granule_files()).
 
-            # Getting indexes for matching shots on L1B, L2A and L2B products
-            # Check L1B shot_numbers
-            firstShots = [
-                l1b_h5[beam + "/shot_number"][0],
-                l2a_h5[beam + "/shot_number"][0],
-                l2b_h5[beam + "/shot_number"][0]
-            ]
+        > Arguments:
+            - self: GEDI_Shots instance.
+        
+        > Output:
+            - GranuleReader instance (use as a context manager).
+        """
+        # Waveform sample ranges are read only when waveforms are stored
+        datasets = dict(config.basicDatasets)
+        if self.waveforms:
+            datasets.update(config.waveformDatasets)
+        
+        # Return results
+        return GranuleReader(self.path, *self.granule_files(), datasets)
 
-            lastShots = [
-                l1b_h5[beam + "/shot_number"][-1],
-                l2a_h5[beam + "/shot_number"][-1],
-                l2b_h5[beam + "/shot_number"][-1]
-            ]
+    def process_windows(self, put):
+        """
+        > process_windows(self, put)
+            Read shots within ROI of every uncommitted beam, window by window
+            (GEDI Storer workers, see GEDI_StorerPool).
 
-            # Get shots that are common to all products
-            firstShot, lastShot = max(firstShots), min(lastShots)
-            
-            # L1B Begin and End indexes
-            l1b_firstShot = np.where(l1b_h5[beam + "/shot_number"][:] == firstShot)
-            l1b_beg = [l for l in l1b_firstShot][0].flat[0]
-            l1b_lastShot = np.where(l1b_h5[beam + "/shot_number"][:] == lastShot)
-            l1b_end = [l for l in l1b_lastShot][0].flat[0]
-            
-            # L2A Begin and End indexes
-            l2a_firstShot = np.where(l2a_h5[beam + "/shot_number"][:] == firstShot)
-            l2a_beg = [l for l in l2a_firstShot][0].flat[0]
-            l2a_lastShot = np.where(l2a_h5[beam + "/shot_number"][:] == lastShot)
-            l2a_end = [l for l in l2a_lastShot][0].flat[0]
-
-            # L2A Begin and End indexes
-            l2b_firstShot = np.where(l2b_h5[beam + "/shot_number"][:] == firstShot)
-            l2b_beg = [l for l in l2b_firstShot][0].flat[0]
-            l2b_lastShot = np.where(l2b_h5[beam + "/shot_number"][:] == lastShot)
-            l2b_end = [l for l in l2b_lastShot][0].flat[0]
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - put: Function called with each item streamed to the writer:
+                ("window", key, beam, cols): Columns of a beam window;
+                ("beam", key, beam): Every window of the beam was sent;
+                ("done", key, filter_stats, beam_stats): Granule finished;
+                ("error", key, message): Granule failed.
+                (key = (version, str2match))
+        
+        > Output:
+            - No outputs (items are passed to put).
+        """
+        key = (self.version, self.strMatch)
+        try:
+            # Compact granules (no-op for granules already subset)
+            if self.subset:
+                self.subset_granule()
+
+            # Open L1B, L2A and L2B granules only once
+            with self.open_granule() as reader:
+                for beam in self.beams:
+                    if beam in self.committed_beams:
+                        continue
+                    
+                    # Windows are sent as they are read (bounded memory)
+                    for cols in self.beam_windows(reader, beam):
+                        put(("window", key, beam, cols))
+                    put(("beam", key, beam))
+        
+        except Exception as error:
+            put(("error", key, f"{type(error).__name__}: {error}"))
+            return
+        
+        # Counters are not shared with the parent process
+        put(("done", key, self.filter_stats, self.beam_stats))
+
+    def subset_granule(self):
+        """
+        > subset_granule(self)
+            Write subsets of the L1B, L2A and L2B granules next to them 
+            (<granule>.subset.h5, read from then on, see granule_files()) 
+            keeping only the datasets read by GEDI Storer/Extractor and the 
+            aligned shots of footprint segments intersecting ROI (compressed).
+            Granules are left as downloaded.
+
+        > Arguments:
+            - self: GEDI_Shots instance.
+        
+        > Output:
+            - bool: True if subsets were written (False if already subset);
+                ValueError is raised for subsets cut to another ROI.
+        """
+        # Subsets are tagged with the hash of the ROI file they were cut to
+        roi_hash = self.roi.file_hash()
+
+        # Datasets kept by product
+        keep = {product: {"shot_number"} for product in config.gedi_products}
+        for product, dataset in list(config.basicDatasets.values()) + list(
+            config.waveformDatasets.values()
+            ):
+            keep[product].add(dataset)
+        for name, product, dataset, op, value in config.ingest_predicates:
+            keep[product].add(dataset)
+        for product, datasets in config.fullInfo.items():
+            keep[product].update(datasets)
+        
+        files = {}
+        with self.open_granule() as reader:
+
+            # Granules already subset to this ROI
+            tags = [h5.attrs.get("olms_subset") for h5 in reader.h5.values()]
+            if all(tag == roi_hash for tag in tags):
+                return False
             
-            # Create pandas dataframe to store shots data
-            df = pd.DataFrame({
-                "lat": l1b_h5[beam + "/geolocation/latitude_bin0"][l1b_beg:l1b_end],
-                "lon": l1b_h5[beam + "/geolocation/longitude_bin0"][l1b_beg:l1b_end],
-                "shot_number": [str(s) for s in l1b_h5[beam + "/shot_number"][l1b_beg:l1b_end]],
-                "degrade": l1b_h5[beam + "/geolocation/degrade"][l1b_beg:l1b_end],
-                "stale_return_flag": l1b_h5[beam + "/stale_return_flag"][l1b_beg:l1b_end],
-                "l2a_quality_flag": l2a_h5[beam + "/quality_flag"][l2a_beg:l2a_end],
-                "l2b_quality_flag": l2b_h5[beam + "/l2b_quality_flag"][l2b_beg:l2b_end],
-                "omega": l2b_h5[beam + "/omega"][l2b_beg:l2b_end],
-                "cover": l2b_h5[beam + "/cover"][l2b_beg:l2b_end],
-                "pai": l2b_h5[beam + "/pai"][l2b_beg:l2b_end],
-                "rh100": l2b_h5[beam + "/rh100"][l2b_beg:l2b_end],
-                "fhd": l2b_h5[beam + "/fhd_normal"][l2b_beg:l2b_end],
-                "elev_TDX": l1b_h5[beam + "/geolocation/digital_elevation_model"][l1b_beg:l1b_end],
-                "elev_highest": l2a_h5[beam + "/elev_highestreturn"][l2a_beg:l2a_end],
-                "elev_ground": l2a_h5[beam + "/elev_lowestmode"][l2a_beg:l2a_end]
-            })
+            # Subsets of another ROI only hold the shots of that ROI
+            if any(tag is not None for tag in tags):
+                raise ValueError(
+                    f"{reader.files['GEDI01_B']} was subset to another ROI "
+                    f"(remove the '{self.subset_suffix}' files to subset again)"
+                    )
             
-            # Get date of shots acquisition
-            date_shots = datetime.strptime(self.l1b_file[21:26], "%y%j")
+            # Aligned rows of segments intersecting ROI (see GEDI_Footprint)
+            footprint = GEDI_Footprint(self.l1b_file)
+            footprint.build(reader)
+            rows = {}
+            for beam in footprint.beams:
+                indexes = reader.beam_indexes(beam)
+                pos = np.flatnonzero(h5Tasks.rows_in_ranges(
+                    indexes["GEDI01_B"], footprint.beam_ranges(beam, self.roi)
+                    ))
+                rows[beam] = {p: indexes[p][pos] for p in reader.products}
             
-            # Crete empty list to store shots docs to insert into mongo
-            shots = []
+            # Write subsets next to the granules
+            for product, src in reader.h5.items():
+                subsetName = os.path.splitext(src.filename)[0] + self.subset_suffix
+                files[subsetName + ".tmp"] = subsetName
+                with h5py.File(subsetName + ".tmp", "w") as dst:
+                    dst.attrs.update(src.attrs)
+                    dst.attrs["olms_subset"] = roi_hash
+                    for beam, beam_rows in rows.items():
+                        group = dst.create_group(beam)
+                        group.attrs.update(src[beam].attrs)
+                        self.subset_beam(
+                            src[beam], group, beam_rows[product], keep[product]
+                            )
+        
+        # Subsets are complete (L1B last, all three are found only once 
+        # every subset is in place)
+        for tmpName in sorted(files, key=lambda f: "GEDI01_B" in f):
+            os.replace(tmpName, files[tmpName])
+        
+        # Return results
+        return True
 
-            # Iterating over the dataframe rows
-            for index, row in df.iterrows():
-                
-                # Create Shapely Point to check if shot is within ROI area
-                shot_geoLocation = Point(row["lon"], row["lat"])
+    def subset_beam(self, src, dst, rows, datasets):
+        """
+        > subset_beam(self, src, dst, rows, datasets)
+            Copy rows of the datasets of a beam into a compressed beam group.
 
-                # Check if the shot is within ROI.
-                # If True store data otherwise move to next shot
-                if shot_geoLocation.within(self.extent) is True:
-                
-                    shots.append(
-                        {
-                            "location": {
-                                "type": "Point",
-                                "coordinates": [row["lon"], row["lat"]]
-                            },
-                            "shot_number": row["shot_number"],
-                            "degrade": str(row["degrade"]),
-                            "stale_return_flag": str(row["stale_return_flag"]),
-                            "l2a_quality_flag": str(row["l2a_quality_flag"]),
-                            "l2b_quality_flag": str(row["l2b_quality_flag"]),
-                            "omega": str(row["omega"]),
-                            "cover": str(row["cover"]),
-                            "pai": str(row["pai"]),
-                            "rh100": str(row["rh100"]),
-                            "fhd": str(row["fhd"]),
-                            "elev_TDX": str(row["elev_TDX"]),
-                            "elev_highest": str(row["elev_highest"]),
-                            "elev_ground": str(row["elev_ground"]),
-                            "beam": beam,
-                            "date_acquired": date_shots,
-                            "l1b_file": self.l1b_file,
-                            "l2a_file": self.l2a_file,
-                            "l2b_file": self.l2b_file
-                        }
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - src: h5py Group of the full beam;
+            - dst: h5py Group of the subset beam;
+            - rows: NumPy array of rows to copy (sorted);
+            - datasets: Dataset paths inside the beam group.
+        
+        > Output:
+            - No outputs (Writing of HDF5 datasets).
+        """
+        for dataset in sorted(datasets):
+            if dataset not in src or dataset == "rxwaveform":
+                continue
+            values = h5Tasks.gather_rows(src[dataset], rows, config.extract_read_gap)
+            self._subset_dataset(dst, dataset, values)
+        
+        # Waveforms of the rows kept, with sample ranges of the subset
+        if "rxwaveform" in datasets and "rxwaveform" in src:
+            counts = h5Tasks.gather_rows(src["rx_sample_count"], rows, config.extract_read_gap)
+            waveforms = h5Tasks.gather_waveforms(
+                src["rxwaveform"], 
+                h5Tasks.gather_rows(src["rx_sample_start_index"], rows, config.extract_read_gap),
+                counts, config.extract_read_gap
+                )
+            samples = np.concatenate(
+                [np.zeros(0, src["rxwaveform"].dtype)] + list(waveforms)
+                )
+            starts = 1 + np.concatenate([[0], np.cumsum(counts, dtype="int64")[:-1]])
+            self._subset_dataset(dst, "rxwaveform", samples)
+            dst["rx_sample_start_index"][...] = starts[:len(rows)].astype(
+                dst["rx_sample_start_index"].dtype
+                )
+
+    @staticmethod
+    def _subset_dataset(group, dataset, values):
+        # Compressed dataset (empty datasets cannot be chunked)
+        if len(values) > 0:
+            group.create_dataset(
+                dataset, data=values, compression="gzip", shuffle=True,
+                compression_opts=config.subset_compression
+                )
+        else:
+            group.create_dataset(dataset, data=values)
+
+    def store_shots(self, writer, cols, beam):
+        """
+        > store_shots(self, writer, cols, beam)
+            Insert shots (whole beam or a window of it) into MongoDB.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - writer: Running GEDI_Writer instance;
+            - cols: Columns (NumPy arrays) from process_window();
+            - beam: GEDI BEAM name (see config.beam_list).
+        
+        > Output:
+            - No outputs (leads to Shot data insertion).
+        """
+        # Waveforms go to the waveform store, not to the shot docs
+        cols = dict(cols)
+        if "rxwaveform" in cols:
+            with self.stage(beam, "queue"):
+                writer.insert_waveforms(
+                    self.version, cols["shot_number"], cols["lon"], cols["lat"], 
+                    cols.pop("rxwaveform")
                     )
-            
-            # Store data into MongoDB
-            if len(shots) > 0:
-                with pymongo.mongo_client.MongoClient() as mongo:
-                    
-                    # Get DB
-                    db = mongo.get_database(self.db)
-                    
-                    # Upload up to 1000 GEDI Shots into MongoDB Shot Collection
-                    db["shots_v" + self.version].insert_many(shots)
 
+        if writer.columnar:
+            # Columns for the local columnar shot store
+            with self.stage(beam, "docs"):
+                table = self.shot_table(cols, beam)
+            with self.stage(beam, "queue"):
+                writer.insert_table("shots_v" + self.version, table)
+            self.beam_stat(beam, "docs", len(table["shot_number"]))
+
+        elif self.storage == "buckets":
+            # Buckets of consecutive shots for the Buckets Collection
+            with self.stage(beam, "docs"):
+                docs = self.bucket_documents(cols, beam)
+            with self.stage(beam, "queue"):
+                writer.insert_many("buckets_v" + self.version, docs)
+            self.beam_stat(beam, "docs", len(docs))
+        
+        else:
+            # GEDI Shots docs for the MongoDB Shot Collection
+            with self.stage(beam, "docs"):
+                docs = self.shot_documents(cols, beam)
+            with self.stage(beam, "queue"):
+                writer.insert_many("shots_v" + self.version, docs)
+            self.beam_stat(beam, "docs", len(docs))
+
+    def beam_windows(self, reader, beam):
+        """
+        > beam_windows(self, reader, beam)
+            Walk beam in windows of config.window_size aligned shots.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - reader: Open GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list).
+        
+        > Output:
+            - Generator of columns (NumPy arrays) of shots within ROI.
+        """
+        bytes_read = reader.bytes_read
+
+        # Join products on shot_number (only shot numbers are read in full)
+        with self.stage(beam, "align"):
+            indexes = reader.beam_indexes(beam)
+        numShots = len(indexes["GEDI01_B"])
+
+        # Runs of consecutive shots to read (whole beam by default)
+        runs = [np.arange(numShots)]
+        if self.footprints:
+            with self.stage(beam, "footprint"):
+                runs = self.footprint_runs(reader, beam, indexes)
+
+        # Whole beam at once if window_size is not set
+        step = self.window_size if self.window_size > 0 else max(numShots, 1)
+
+        # Windows of consecutive shots within each run
+        windows = 0
+        for run in runs:
+            for beg in range(0, len(run), step):
+                window = h5Tasks.subset_indexes(indexes, run[beg:beg + step])
+                windows += 1
+                yield self.process_window(reader, beam, window)
+        
+        # At least one window (even if empty)
+        if windows == 0:
+            yield self.process_window(
+                reader, beam, h5Tasks.subset_indexes(indexes, slice(0, 0))
+                )
+        
+        # HDF5 bytes read for the beam
+        self.beam_stat(beam, "bytes_read", reader.bytes_read - bytes_read)
+
+    def footprint_runs(self, reader, beam, indexes):
+        """
+        > footprint_runs(self, reader, beam, indexes)
+            Runs of aligned shots whose footprint segments intersect ROI.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - reader: Open GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list);
+            - indexes: Index vectors by GEDI product (see beam_indexes()).
+        
+        > Output:
+            - list: NumPy arrays of positions on indexes (consecutive shots).
+        """
+        # Footprint index is built once per granule file (cached on disk, 
+        # rows of subsets differ from rows of the full granule)
+        l1b = reader.files["GEDI01_B"]
+        if self.footprint is None:
+            self.footprint = GEDI_Footprint(l1b)
+        elif self.footprint.granule != l1b:
+            self.footprint = GEDI_Footprint(
+                l1b, self.footprint.root, self.footprint.segment, 
+                self.footprint.step, self.footprint.pad
+                )
+        if self.footprint.beams is None:
+            self.footprint.load_or_build(reader)
+        
+        # L1B row ranges of segments intersecting ROI
+        ranges = self.footprint.beam_ranges(beam, self.roi)
+        keep = np.flatnonzero(
+            h5Tasks.rows_in_ranges(indexes["GEDI01_B"], ranges)
+            )
+        
+        # Shots outside ROI segments are neither read nor stored
+        skipped = len(indexes["GEDI01_B"]) - len(keep)
+        self.count_shots("shots_read", skipped, beam)
+        self.count_shots("footprint", skipped, beam)
+
+        # Return runs of consecutive positions
+        return np.split(keep, np.flatnonzero(np.diff(keep) > 1) + 1)
+
+    def process_window(self, reader, beam, indexes):
+        """
+        > process_window(self, reader, beam, indexes)
+            Read columns of shots passing predicates and within ROI.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - reader: Open GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list);
+            - indexes: Index vectors by GEDI product (window of the beam).
+        
+        > Output:
+            - dict: Columns (NumPy arrays) of shots within ROI.
+        """
+        self.count_shots("shots_read", len(indexes["GEDI01_B"]), beam)
+
+        # Ingest predicates (quality flags, etc.) before geometry work
+        with self.stage(beam, "predicates"):
+            indexes, removed = reader.filter_indexes(beam, indexes, self.predicates)
+        for name, count in removed.items():
+            self.count_shots(name, count, beam)
+
+        # Check which shots are within ROI (vectorized)
+        with self.stage(beam, "read_geo"):
+            geo = reader.read_columns(beam, indexes, ["lon", "lat"])
+        with self.stage(beam, "roi_test"):
+            mask = self.roi.contains(geo["lon"], geo["lat"])
+        self.count_shots("roi", int(np.count_nonzero(~mask)), beam)
+        
+        # Read remaining columns only for shots within ROI
+        indexes = h5Tasks.subset_indexes(indexes, mask)
+        cols = {key: values[mask] for key, values in geo.items()}
+        with self.stage(beam, "read"):
+            cols.update(
+                reader.read_columns(
+                    beam, indexes, [c for c in reader.datasets if c not in cols]
+                    )
+                )
+        self.count_shots("shots_kept", len(cols["lon"]), beam)
+
+        # Waveforms straight from rxwaveform slices (one read per window)
+        if self.waveforms:
+            with self.stage(beam, "waveforms"):
+                cols["rxwaveform"] = reader.read_waveforms(
+                    beam, 
+                    cols.pop("rx_sample_start_index"), 
+                    cols.pop("rx_sample_count")
+                    )
+
+        # Return columns of shots within ROI
+        return cols
+
+    def count_shots(self, name, count, beam=None):
+        """
+        > count_shots(self, name, count, beam=None)
+            Update count of shots read, removed by each filter and kept.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - name: Counter name (predicate name, "roi", etc.);
+            - count: Number of shots;
+            - beam: GEDI BEAM name (also counted by beam, see beam_stats).
+        
+        > Output:
+            - No outputs (updates self.filter_stats and self.beam_stats).
+        """
+        self.filter_stats[name] = self.filter_stats.get(name, 0) + count
+        if beam is not None:
+            shots = self.beam_stats.setdefault(beam, {}).setdefault("shots", {})
+            shots[name] = shots.get(name, 0) + count
+
+    @contextlib.contextmanager
+    def stage(self, beam, name):
+        """
+        > stage(self, beam, name)
+            Time a storer stage of a beam (use as a context manager).
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - beam: GEDI BEAM name (see config.beam_list);
+            - name: Stage name ("align", "read", "docs", etc.).
+        
+        > Output:
+            - No outputs (updates self.beam_stats).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages = self.beam_stats.setdefault(beam, {}).setdefault("stages", {})
+            stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+    def beam_stat(self, beam, name, value):
+        """
+        > beam_stat(self, beam, name, value)
+            Update a beam counter (bytes read, docs).
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - beam: GEDI BEAM name (see config.beam_list);
+            - name: Counter name;
+            - value: Value to add.
+        
+        > Output:
+            - No outputs (updates self.beam_stats).
+        """
+        stats = self.beam_stats.setdefault(beam, {})
+        stats[name] = stats.get(name, 0) + value
+
+    def log_stats(self, path=config.storer_log):
+        """
+        > log_stats(self, path=config.storer_log)
+            Append beam and granule stats to the JSON-lines storer log.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - path: Storer log (see config.storer_log, "" = no log).
+        
+        > Output:
+            - No outputs (Writing of external JSON-lines file).
+        """
+        if not path:
+            return
+        
+        # One record per beam plus one per granule
+        now = datetime.now().isoformat(timespec="seconds")
+        records = [
+            {"time": now, "record": "beam", "version": self.version, 
+             "granule": self.strMatch, "beam": beam, **stats}
+            for beam, stats in self.beam_stats.items()
+            ]
+        records.append(
+            {"time": now, "record": "granule", "version": self.version, 
+             "granule": self.strMatch, **self.sum_stats([self])}
+            )
+        
+        with open(path, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def sum_stats(tasks):
+        """
+        > sum_stats(tasks)
+            Sum beam stats (see beam_stats) of a set of granules.
+
+        > Arguments:
+            - tasks: List of processed GEDI_Shots instances.
+        
+        > Output:
+            - dict: Stage timings, shot counters, bytes read and docs.
+        """
+        totals = {"stages": {}, "shots": {}, "bytes_read": 0, "docs": 0}
+        for gediShots in tasks:
+            for stats in gediShots.beam_stats.values():
+                for key in ["stages", "shots"]:
+                    for name, value in stats.get(key, {}).items():
+                        totals[key][name] = totals[key].get(name, 0) + value
+                totals["bytes_read"] += stats.get("bytes_read", 0)
+                totals["docs"] += stats.get("docs", 0)
+        
+        # Return results
+        return totals
+
+    def merge_stats(self, filter_stats, beam_stats):
+        """
+        > merge_stats(self, filter_stats, beam_stats)
+            Add counters and stage timings of a worker process.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - filter_stats: Worker filter counters (see filter_stats);
+            - beam_stats: Worker beam stats (see beam_stats).
+        
+        > Output:
+            - No outputs (updates self.filter_stats and self.beam_stats).
+        """
+        for name, count in filter_stats.items():
+            self.filter_stats[name] = self.filter_stats.get(name, 0) + count
+        
+        for beam, stats in beam_stats.items():
+            merged = self.beam_stats.setdefault(beam, {})
+            for name, value in stats.items():
+                if isinstance(value, dict):
+                    group = merged.setdefault(name, {})
+                    for key, v in value.items():
+                        group[key] = group.get(key, 0) + v
+                else:
+                    merged[name] = merged.get(name, 0) + value
+
+    def shot_documents(self, cols, beam):
+        """
+        > shot_documents(self, cols, beam)
+            Create MongoDB docs (schema 2) from beam columns.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - cols: Columns (NumPy arrays) from beam_windows();
+            - beam: GEDI BEAM name (see config.beam_list).
+        
+        > Output:
+            - list: Shots docs to insert into MongoDB.
+        """
+        # Legacy schema, stringified numbers
+        if self.schema == 1:
+            return self.shot_documents_v1(cols, beam)
+
+        # Fields shared by every shot of the beam
+        common = {
+            config.shotKeys["beam"]: int(beam[4:], 2),
+            config.shotKeys["date_acquired"]: datetime.strptime(
+                self.l1b_file[21:26], "%y%j"
+                ),
+            config.shotKeys["granule"]: self.granule_id
+        }
+
+        # Native Python types (int64 shot numbers, ints and doubles)
+        fields = [f for f in cols.keys() if f not in ["lon", "lat"]]
+        keys = [config.shotKeys[f] for f in fields]
+        values = [cols[f].tolist() for f in fields]
+
+        # Create list of shots docs to insert into mongo
+        shots = []
+        for lon, lat, *row in zip(cols["lon"].tolist(), cols["lat"].tolist(), *values):
+            doc = {
+                config.shotKeys["location"]: {
+                    "type": "Point",
+                    "coordinates": [lon, lat]
+                }
+            }
+            doc.update(zip(keys, row))
+            doc.update(common)
+            shots.append(doc)
+        
+        # Return results
+        return shots
+
+    def shot_documents_v1(self, cols, beam):
+        """
+        > shot_documents_v1(self, cols, beam)
+            Create legacy MongoDB docs (schema 1) from beam columns.
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - cols: Columns (NumPy arrays) from beam_windows();
+            - beam: GEDI BEAM name (see config.beam_list).
+        
+        > Output:
+            - list: Shots docs to insert into MongoDB.
+        """
+        # Get date of shots acquisition
+        date_shots = datetime.strptime(self.l1b_file[21:26], "%y%j")
+
+        # Return list of shots docs to insert into mongo
+        return [
+            {
+                "location": {
+                    "type": "Point",
+                    "coordinates": [lon, lat]
+                },
+                "shot_number": str(shot_number),
+                "degrade": str(degrade),
+                "stale_return_flag": str(stale),
+                "l2a_quality_flag": str(l2a_flag),
+                "l2b_quality_flag": str(l2b_flag),
+                "omega": str(omega),
+                "cover": str(cover),
+                "pai": str(pai),
+                "rh100": str(rh100),
+                "fhd": str(fhd),
+                "elev_TDX": str(elev_tdx),
+                "elev_highest": str(elev_highest),
+                "elev_ground": str(elev_ground),
+                "beam": beam,
+                "date_acquired": date_shots,
+                "l1b_file": self.l1b_file,
+                "l2a_file": self.l2a_file,
+                "l2b_file": self.l2b_file
+            }
+            for (
+                lon, lat, shot_number, degrade, stale, l2a_flag, l2b_flag,
+                omega, cover, pai, rh100, fhd, elev_tdx, elev_highest, 
+                elev_ground
+            ) in zip(
+                cols["lon"].tolist(), cols["lat"].tolist(), 
+                cols["shot_number"], cols["degrade"], 
+                cols["stale_return_flag"], cols["l2a_quality_flag"], 
+                cols["l2b_quality_flag"], cols["omega"], cols["cover"], 
+                cols["pai"], cols["rh100"], cols["fhd"], cols["elev_TDX"],
+                cols["elev_highest"], cols["elev_ground"]
+            )
+        ]
+
+    def bucket_documents(self, cols, beam):
+        """
+        > bucket_documents(self, cols, beam)
+            Create bucket docs (up to config.bucket_size consecutive shots).
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - cols: Columns (NumPy arrays) from beam_windows();
+            - beam: GEDI BEAM name (see config.beam_list).
+        
+        > Output:
+            - list: Bucket docs to insert into MongoDB.
+        """
+        # Fields shared by every bucket of the beam
+        common = {
+            config.shotKeys["beam"]: int(beam[4:], 2),
+            config.shotKeys["date_acquired"]: datetime.strptime(
+                self.l1b_file[21:26], "%y%j"
+                ),
+            config.shotKeys["granule"]: self.granule_id
+        }
+
+        # Packed array keys (lon/lat plus short shot keys)
+        keys = {
+            f: config.bucketKeys.get(f, config.shotKeys.get(f)) for f in cols.keys()
+            }
+
+        # Create list of buckets docs to insert into mongo
+        buckets = []
+        for beg in range(0, len(cols["shot_number"]), config.bucket_size):
+            
+            # Consecutive shots of the bucket
+            bucket = {f: values[beg:beg + config.bucket_size] for f, values in cols.items()}
+
+            doc = {
+                "env": geoTasks.envelope(bucket["lon"], bucket["lat"]),
+                "n": len(bucket["shot_number"]),
+                config.shotKeys["shot_number"]: int(bucket["shot_number"][0]),
+                "a": {
+                    keys[f]: Binary(np.ascontiguousarray(values).tobytes()) 
+                    for f, values in bucket.items()
+                    },
+                "t": {keys[f]: values.dtype.str for f, values in bucket.items()}
+            }
+            doc.update(common)
+            buckets.append(doc)
+        
+        # Return results
+        return buckets
+
+    def shot_table(self, cols, beam):
+        """
+        > shot_table(self, cols, beam)
+            Create columnar shot table (see GEDI_ParquetWriter).
+
+        > Arguments:
+            - self: GEDI_Shots instance;
+            - cols: Columns (NumPy arrays) from process_window();
+            - beam: GEDI BEAM name (see config.beam_list).
+        
+        > Output:
+            - dict: Columns (NumPy arrays) including beam, date and granule.
+        """
+        # Get date of shots acquisition
+        date_shots = datetime.strptime(self.l1b_file[21:26], "%y%j")
+
+        # Repeated values are dictionary-encoded by Parquet
+        numShots = len(cols["lon"])
+        table = dict(cols)
+        table["beam"] = np.full(numShots, beam)
+        table["date_acquired"] = np.full(numShots, np.datetime64(date_shots, "D"))
+        table["granule"] = np.full(numShots, self.granule_id)
+
+        # Return results
+        return table
+
+
+# Item queue of GEDI Storer worker processes (see GEDI_StorerPool)
+_storer_queue = None
+
+
+def _storer_init(items):
+    # Worker process initializer (queue is inherited, not pickled per task)
+    global _storer_queue
+    _storer_queue = items
+
+
+def _storer_process(gediShots):
+    # Worker process task: stream granule windows to the parent process
+    gediShots.process_windows(_storer_queue.put)
+
+
+class GEDI_StorerPool():
+    """
+    GEDI_StorerPool class
+
+    Process GEDI granules on worker processes that stream beam windows to 
+    the parent process, where they are stored by a running writer
+
+    Attributes:
+        - writer: Running GEDI_Writer instance
+        - workers: Worker processes (see config.storer_workers, 0 = process 
+            granules one by one in the calling process)
+        - queue_size: Max items in flight (see config.storer_queue_size)
+        - items: Queue of worker items (see GEDI_Shots.process_windows())
+        - pool: ProcessPoolExecutor of the workers
+        - pending: Granules waiting for a free worker
+        - running: Granules being processed by (version, str2match)
+        - futures: Worker futures by (version, str2match)
+        - stored: Granules stored (in order of completion)
+        - store_time: Seconds spent storing items in the parent process
+    
+    Methods:
+        - start(self): Start worker processes
+        - close(self): Stop worker processes
+        - submit(self, gediShots): Queue a granule (bounded in-flight)
+        - busy(self): True while granules are pending or running
+        - put(self, item): Queue an item of the parent process
+        - get(self, timeout): Next worker item (None on timeout)
+        - handle(self, item): Store a worker item
+        - run(self): Handle items until every granule is finished
+
+    """
+    def __init__(
+        self, writer, workers=config.storer_workers, 
+        queue_size=config.storer_queue_size
+        ):
+        self.writer = writer
+        self.workers = workers
+        self.queue_size = queue_size
+        self.items = None
+        self.pool = None
+        self.pending = []
+        self.running = {}
+        self.futures = {}
+        self.stored = []
+        self.store_time = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """
+        > start(self)
+            Start worker processes (bounded item queue inherited by workers).
+
+        > Arguments:
+            - self: GEDI_StorerPool instance.
+        
+        > Output:
+            - No outputs (leads to worker processes start).
+        """
+        if self.workers > 0:
+            self.items = multiprocessing.Queue(maxsize=self.queue_size)
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_storer_init, 
+                initargs=(self.items,)
+                )
+        else:
+            self.items = queue.Queue()
+
+    def close(self):
+        """
+        > close(self)
+            Stop worker processes.
+
+        > Arguments:
+            - self: GEDI_StorerPool instance.
+        
+        > Output:
+            - No outputs (leads to worker processes shutdown).
+        """
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+            # Running workers may be blocked on a full queue (items dropped)
+            while any(not future.done() for future in self.futures.values()):
+                try:
+                    self.items.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            pool.shutdown()
+
+    def submit(self, gediShots):
+        """
+        > submit(self, gediShots)
+            Queue a granule, started once a worker is free.
+
+        > Arguments:
+            - self: GEDI_StorerPool instance;
+            - gediShots: GEDI_Shots instance.
+        
+        > Output:
+            - No outputs (leads to granule processing).
+        """
+        self.pending.append(gediShots)
+        self._launch()
+
+    def busy(self):
+        """
+        > busy(self)
+            Check for granules pending or being processed.
+
+        > Arguments:
+            - self: GEDI_StorerPool instance.
+        
+        > Output:
+            - bool: True while granules are pending or running.
+        """
+        return len(self.pending) > 0 or len(self.running) > 0
+
+    def put(self, item):
+        """
+        > put(self, item)
+            Queue an item of the parent process (e.g. finished downloads) 
+            along with the worker items, so a single get() loop waits on both.
+
+        > Arguments:
+            - self: GEDI_StorerPool instance;
+            - item: Picklable item (not handled by handle()).
+        
+        > Output:
+            - No outputs (blocks while the queue is full, dropped once the
+                pool is closed).
+        """
+        while True:
+            try:
+                self.items.put(item, timeout=1)
+                return
+            except queue.Full:
+                if self.pool is None:
+                    return
+
+    def get(self, timeout=1):
+        """
+        > get(self, timeout=1)
+            Next worker item (failed workers are reported as error items).
+
+        > Arguments:
+            - self: GEDI_StorerPool instance;
+            - timeout: Seconds to wait for an item.
+        
+        > Output:
+            - tuple: Worker item (None on timeout).
+        """
+        try:
+            return self.items.get(timeout=timeout)
+        except queue.Empty:
+            pass
+        
+        # Workers that died without reporting (crashes, pickling errors)
+        for key, future in list(self.futures.items()):
+            if future.done() and future.exception() is not None:
+                self.futures.pop(key)
+                return ("error", key, str(future.exception()))
+        return None
+
+    def handle(self, item):
+        """
+        > handle(self, item)
+            Store a worker item (see GEDI_Shots.process_windows()).
+
+        > Arguments:
+            - self: GEDI_StorerPool instance;
+            - item: Worker item.
+        
+        > Output:
+            - GEDI_Shots: Granule finished by the item (None otherwise).
+        """
+        start = time.perf_counter()
+        kind, key = item[0], item[1]
+        gediShots = self.running.get(key)
+        if gediShots is None:
+            return None
+        
+        if kind == "window":
+            gediShots.store_shots(self.writer, item[3], item[2])
+        
+        elif kind == "beam":
+            # Beam is committed once all its windows are written
+            print(f"          > {item[2]} ({gediShots.strMatch})")
+            gediShots.checkpoint_beam(self.writer, item[2])
+        
+        elif kind == "done":
+            # Update process log only when every beam was committed
+            # (worker counters are copies unless granule ran in-process)
+            if item[2] is not gediShots.filter_stats:
+                gediShots.merge_stats(item[2], item[3])
+            gediShots.update_process_log(self.writer)
+            gediShots.log_stats()
+            self.stored.append(gediShots)
+        
+        else:
+            print(strings.colors(f"     [ERROR] {gediShots.l1b_file}: {item[2]}", 1))
+            print("... Moving to the next GEDI Granule ...\n")
+        
+        self.store_time += time.perf_counter() - start
+
+        # Free the worker of finished granules (in-process granules are 
+        # started by the _launch() loop itself)
+        if kind in ["done", "error"]:
+            self.running.pop(key)
+            self.futures.pop(key, None)
+            if self.pool is not None:
+                self._launch()
+            return gediShots
+        return None
+
+    def run(self):
+        """
+        > run(self)
+            Handle worker items until every granule is finished.
+
+        > Arguments:
+            - self: GEDI_StorerPool instance.
+        
+        > Output:
+            - list: GEDI_Shots instances stored (failed granules left out).
+        """
+        while self.busy():
+            item = self.get()
+            if item is not None:
+                self.handle(item)
+        
+        # Return results
+        return self.stored
+
+    def _launch(self):
+        # Start pending granules while workers are free
+        while self.pending and len(self.running) < max(self.workers, 1):
+            gediShots = self.pending.pop(0)
+            key = (gediShots.version, gediShots.strMatch)
+
+            # Print message on file being processed
+            print(f"\n> Processing files ({gediShots.index_gran}/{gediShots.num_grans})")
+            print(strings.colors(f"     > {gediShots.l1b_file}", 3))
+
+            # Granule reference and committed beams (resume)
+            gediShots.register_granule(self.writer)
+            gediShots.load_checkpoints(self.writer)
+            self.writer.reset_beams(
+                gediShots.version, gediShots.strMatch, 
+                gediShots.uncommitted_beams()
+                )
+            self.running[key] = gediShots
+            
+            if self.pool is not None:
+                self.futures[key] = self.pool.submit(_storer_process, gediShots)
+            else:
+                # In-process: items are stored as they are read
+                gediShots.process_windows(self.handle)
+
+
+class GranuleReader():
+    """
+    GranuleReader class
+
+    Read GEDI Shot data from matching L1B, L2A and L2B local granules
+
+    Attributes:
+        - path: Full path to local storage (see config.localStorage)
+        - files: Dictionary of granule filenames by GEDI product
+        - datasets: Columns to read as {column: [product, dataset]}
+            --> default = config.basicDatasets (see utils/config.py)
+        - h5: Dictionary of open HDF5 files by GEDI product
+        - bytes_read: Bytes of the HDF5 selections read so far
+    
+    Methods:
+        - open(self): Open L1B, L2A and L2B granules
+        - close(self): Close all open granules
+        - shot_numbers(self, beam): Read shot numbers of each product
+        - beam_indexes(self, beam): Get indexes of shots common to all products
+        - read_columns(self, beam, indexes, columns, max_gap): Read indexed 
+            columns
+        - filter_indexes(self, beam, indexes, predicates): Apply predicates
+        - read_waveforms(self, beam, starts, counts, max_gap): Read rxwaveform
+            slices
+        - shot_indexes(self, beam, shot_numbers): Locate shots on products
+        - read_shots(self, beam, shot_numbers, max_gap): Read columns of shots
+        - read_beam(self, beam): Read beam columns as NumPy arrays
+
+    """
+    # GEDI products read by the class
+    products = ["GEDI01_B", "GEDI02_A", "GEDI02_B"]
+
+    def __init__(self, path, l1b, l2a, l2b, datasets=config.basicDatasets):
+        self.path = path
+        self.files = dict(zip(self.products, [l1b, l2a, l2b]))
+        self.datasets = datasets
+        self.h5 = {}
+        self.bytes_read = 0
+    
+    def __enter__(self):
+        self.open()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """
+        > open(self)
+            Open L1B, L2A and L2B granules (read-only).
+
+        > Arguments:
+            - self: GranuleReader instance.
+        
+        > Output:
+            - No outputs (leads to HDF5 files opening).
+        """
+        for product in self.products:
+            if product not in self.h5:
+                self.h5[product] = h5py.File(
+                    self.path + os.sep + product + os.sep + self.files[product],
+                    "r"
+                    )
+
+    def close(self):
+        """
+        > close(self)
+            Close all open granules.
+
+        > Arguments:
+            - self: GranuleReader instance.
+        
+        > Output:
+            - No outputs (leads to HDF5 files closing).
+        """
+        for product in list(self.h5.keys()):
+            self.h5.pop(product).close()
+
+    def shot_numbers(self, beam):
+        """
+        > shot_numbers(self, beam)
+            Read shot numbers of a given beam on each GEDI product.
+
+        > Arguments:
+            - self: GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list).
+        
+        > Output:
+            - dict: Shot numbers (NumPy arrays) by GEDI product.
+        """
+        shots = {
+            product: self.h5[product][beam + "/shot_number"][:]
+            for product in self.products
+        }
+        self.bytes_read += sum(values.nbytes for values in shots.values())
+
+        # Return results
+        return shots
+
+    def beam_indexes(self, beam):
+        """
+        > beam_indexes(self, beam)
+            Get indexes of the shots that are common to all GEDI products.
+
+        > Arguments:
+            - self: GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list).
+        
+        > Output:
+            - dict: Index vectors of common shots by GEDI product.
+        """
+        # Read shot numbers only once per product
+        shots = self.shot_numbers(beam)
+
+        # Join products on shot_number
+        common, indexes = h5Tasks.align_shots(
+            [shots[product] for product in self.products]
+            )
+        
+        # Return results
+        return dict(zip(self.products, indexes))
+
+    def read_columns(self, beam, indexes, columns=None, max_gap=None):
+        """
+        > read_columns(self, beam, indexes, columns=None, max_gap=None)
+            Read beam columns (see self.datasets) as NumPy arrays.
+
+        > Arguments:
+            - self: GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list);
+            - indexes: Index vectors by GEDI product (see beam_indexes());
+            - columns: List of columns to read (default = all datasets);
+            - max_gap: Max gap (rows) within a read (see h5Tasks.gather_rows).
+        
+        > Output:
+            - dict: Columns (NumPy arrays) of the indexed shots.
+        """
+        # Read all datasets by default
+        if columns is None:
+            columns = list(self.datasets.keys())
+
+        # Same index vectors are reused for every dataset of a product
+        cols = {}
+        for column in columns:
+            product, dataset = self.datasets[column]
+            h5_dataset = self.h5[product][beam + "/" + dataset]
+            cols[column] = h5Tasks.gather_rows(
+                h5_dataset, indexes[product], max_gap
+                )
+            self.bytes_read += h5Tasks.span_nbytes(
+                h5_dataset, indexes[product], max_gap
+                )
+        
+        # Return results
+        return cols
+
+    def filter_indexes(self, beam, indexes, predicates):
+        """
+        > filter_indexes(self, beam, indexes, predicates)
+            Keep only shots passing every ingest predicate.
+
+        > Arguments:
+            - self: GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list);
+            - indexes: Index vectors by GEDI product (see beam_indexes());
+            - predicates: List of predicates (see config.ingest_predicates).
+        
+        > Output:
+            - dict: Index vectors of shots passing all predicates;
+            - dict: Number of shots removed by each predicate.
+        """
+        removed = {}
+        for name, product, dataset, op, value in predicates:
+
+            # Read predicate dataset only for shots still kept
+            h5_dataset = self.h5[product][beam + "/" + dataset]
+            values = h5Tasks.gather_rows(h5_dataset, indexes[product])
+            self.bytes_read += h5Tasks.span_nbytes(h5_dataset, indexes[product])
+            keep = h5Tasks.predicate_operators[op](values, value)
+            
+            # Following reads skip rejected shots
+            removed[name] = int(np.count_nonzero(~keep))
+            indexes = h5Tasks.subset_indexes(indexes, keep)
+
+        # Return results
+        return indexes, removed
+
+    def read_waveforms(self, beam, starts, counts, max_gap=None):
+        """
+        > read_waveforms(self, beam, starts, counts, max_gap=None)
+            Read GEDI01_B rxwaveform slices of a set of shots.
+
+        > Arguments:
+            - self: GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list);
+            - starts: rx_sample_start_index of the shots (1-based);
+            - counts: rx_sample_count of the shots;
+            - max_gap: Max gap (samples) within a read.
+        
+        > Output:
+            - NumPy object array: Waveform (NumPy array) of each shot.
+        """
+        waveforms = h5Tasks.gather_waveforms(
+            self.h5["GEDI01_B"][beam + "/rxwaveform"], starts, counts, max_gap
+            )
+        self.bytes_read += sum(w.nbytes for w in waveforms)
+
+        # Return results
+        return waveforms
+
+    def shot_indexes(self, beam, shot_numbers):
+        """
+        > shot_indexes(self, beam, shot_numbers)
+            Locate a set of shots on every GEDI product.
+
+        > Arguments:
+            - self: GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list);
+            - shot_numbers: Shot numbers to locate.
+        
+        > Output:
+            - NumPy array: Sorted shot numbers found on all products;
+            - dict: Index vectors of the found shots by GEDI product.
+        """
+        # Read shot numbers only once per product
+        shots = self.shot_numbers(beam)
+
+        # Join requested shots with every product on shot_number
+        common, indexes = h5Tasks.align_shots(
+            [np.unique(np.asarray(shot_numbers, dtype="uint64"))] + 
+            [shots[product] for product in self.products]
+            )
+        
+        # Return results
+        return common, dict(zip(self.products, indexes[1:]))
+
+    def read_shots(self, beam, shot_numbers, max_gap=config.extract_read_gap):
+        """
+        > read_shots(self, beam, shot_numbers, max_gap)
+            Read beam columns (see self.datasets) of a set of shots.
+
+        > Arguments:
+            - self: GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list);
+            - shot_numbers: Shot numbers to read;
+            - max_gap: Max gap (rows) within a read.
+                --> default = config.extract_read_gap (see utils/config.py)
+        
+        > Output:
+            - dict: Columns (NumPy arrays) of the shots, sorted by shot_number
+                (rxwaveform included when its sample ranges are read).
+        """
+        # Sorted index vectors, so reads go forward through each dataset
+        common, indexes = self.shot_indexes(beam, shot_numbers)
+        cols = self.read_columns(beam, indexes, max_gap=max_gap)
+        cols["shot_number"] = common
+
+        # Waveforms sliced with their sample ranges
+        if "rx_sample_start_index" in cols and "rx_sample_count" in cols:
+            cols["rxwaveform"] = self.read_waveforms(
+                beam, cols["rx_sample_start_index"], cols["rx_sample_count"],
+                max_gap
+                )
+        
+        # Return results
+        return cols
+
+    def read_beam(self, beam):
+        """
+        > read_beam(self, beam)
+            Read beam columns (see self.datasets) as NumPy arrays.
+
+        > Arguments:
+            - self: GranuleReader instance;
+            - beam: GEDI BEAM name (see config.beam_list).
+        
+        > Output:
+            - dict: Columns (NumPy arrays) of shots common to all products.
+        """
+        return self.read_columns(beam, self.beam_indexes(beam))
+
+
+class GEDI_Writer():
+    """
+    GEDI_Writer class
+
+    Write GEDI Shot data into MongoDB on a dedicated thread, so reading the
+    next beam overlaps with writing the previous one
+
+    Attributes:
+        - db: Default database (see config.base_mongodb)
+        - batch_size: Docs per insert_many (see config.writer_batch_size)
+        - storage: Shots or buckets collections (see config.storage_mode)
+        - schema: Shot docs schema (see config.shots_schema)
+        - queue: Bounded queue between HDF5 readers and the writer
+            --> maxsize = config.writer_queue_size (batches)
+        - client: Pooled MongoClient shared by every write
+        - thread: Writer thread
+        - docs: Number of docs written
+        - duplicates: Number of docs skipped (already stored)
+        - error: First exception raised by the writer thread
+        - start_time: Time the writer was started
+        - waveform_store: GEDI_WaveformStore (see config.waveformStorage)
+        - write_times: Seconds spent by the writer thread by write kind
+    
+    Methods:
+        - start(self): Connect to MongoDB and start writer thread
+        - insert_many(self, collection, docs): Queue docs in batches
+        - insert_one(self, collection, doc): Queue a single doc
+        - delete_many(self, collection, query): Queue docs deletion
+        - insert_waveforms(self, version, shots, lon, lat, waveforms): Queue
+            waveforms for the waveform store
+        - after_writes(self, func): Queue a call run after every queued write
+        - close(self): Wait for queued writes and close connection
+        - get_database(self): Get database from the pooled client
+        - create_indexes(self, versions): Create collection indexes
+        - register_granule(self, version, strMatch, l1b, l2a, l2b): Granule _id
+        - find_checkpoints(self, version, strMatch): Get committed beams
+        - reset_beams(self, version, strMatch, beams): Drop partial beam shots
+        - report(self): Print throughput of the run
+
+    """
+    # Shots are written as docs (see GEDI_ParquetWriter)
+    columnar = False
+
+    def __init__(
+        self, db, batch_size=config.writer_batch_size, 
+        queue_size=config.writer_queue_size, storage=config.storage_mode,
+        schema=config.shots_schema
+        ):
+        self.db = db
+        self.batch_size = batch_size
+        self.storage = storage
+        self.schema = schema
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.client = None
+        self.thread = None
+        self.docs = 0
+        self.duplicates = 0
+        self.error = None
+        self.start_time = None
+        self.waveform_store = GEDI_WaveformStore()
+        self.write_times = {}
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """
+        > start(self)
+            Connect to MongoDB and start writer thread.
+
+        > Arguments:
+            - self: GEDI_Writer instance.
+        
+        > Output:
+            - No outputs (leads to writer thread start).
+        """
+        self.client = pymongo.mongo_client.MongoClient()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.start_time = time.perf_counter()
+        self.thread.start()
+
+    def insert_many(self, collection, docs):
+        """
+        > insert_many(self, collection, docs)
+            Queue docs to be inserted in batches (unordered).
+
+        > Arguments:
+            - self: GEDI_Writer instance;
+            - collection: Collection name;
+            - docs: List of docs.
+        
+        > Output:
+            - No outputs (blocks while the queue is full).
+        """
+        for beg in range(0, len(docs), self.batch_size):
+            self._put(("many", collection, docs[beg:beg + self.batch_size]))
+
+    def insert_one(self, collection, doc):
+        """
+        > insert_one(self, collection, doc)
+            Queue a single doc, written after every doc queued before it.
+
+        > Arguments:
+            - self: GEDI_Writer instance;
+            - collection: Collection name;
+            - doc: Document to insert.
+        
+        > Output:
+            - No outputs (blocks while the queue is full).
+        """
+        self._put(("one", collection, doc))
+
+    def delete_many(self, collection, query):
+        """
+        > delete_many(self, collection, query):
+            Queue deletion of docs, done after every doc queued before it.
+
+        > Arguments:
+            - self: GEDI_Writer instance;
+            - collection: Collection name;
+            - query: Filter of docs to delete.
+        
+        > Output:
+            - No outputs (blocks while the queue is full).
+        """
+        self._put(("delete", collection, query))
+
+    def insert_waveforms(self, version, shots, lon, lat, waveforms):
+        """
+        > insert_waveforms(self, version, shots, lon, lat, waveforms)
+            Queue waveforms to be appended to the waveform store.
+
+        > Arguments:
+            - self: GEDI_Writer instance;
+            - version: GEDI Product Version;
+            - shots: NumPy array of shot numbers;
+            - lon, lat: NumPy arrays of shot coordinates;
+            - waveforms: NumPy object array of waveforms (one per shot).
+        
+        > Output:
+            - No outputs (blocks while the queue is full).
+        """
+        if len(shots) > 0:
+            self._put(("waveforms", version, [shots, lon, lat, waveforms]))
+
+    def after_writes(self, func):
+        """
+        > after_writes(self, func)
+            Queue a call (no arguments) run on the writer thread once every
+            write queued before it was committed (skipped after a failure).
+
+        > Arguments:
+            - self: GEDI_Writer instance;
+            - func: Function to call.
+        
+        > Output:
+            - No outputs (blocks while the queue is full).
+        """
+        self._put(("callback", None, func))
+
+    def close(self):
+        """
+        > close(self)
+            Wait for queued writes and close MongoDB connection.
+
+        > Arguments:
+            - self: GEDI_Writer instance.
+        
+        > Output:
+            - No outputs (raises writer thread exception, if any).
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            if self.client is not None:
+                self.client.close()
+        
+        # Surface write errors to the caller
+        if self.error is not None:
+            raise self.error
+
+    def get_database(self):
+        """
+        > get_database(self)
+            Get database from the pooled client (synchronous operations).
+
+        > Arguments:
+            - self: GEDI_Writer instance.
+        
+        > Output:
+            - pymongo Database (see config.base_mongodb).
+        """
+        return self.client.get_database(self.db)
+
+    def create_indexes(self, versions):
+        """
+        > create_indexes(self, versions)
+            Create indexes of shots and granules collections (if missing).
+
+        > Arguments:
+            - self: GEDI_Writer instance;
+            - versions: List of GEDI Versions to process.
+        
+        > Output:
+            - No outputs (leads to MongoDB indexes creation).
+        """
+        # Get DB
+        db = self.get_database()
+
+        for version in versions:
+
+            # Granules are referenced by shot/bucket docs through their _id
+            db["granules_v" + version].create_index("str2match", unique=True)
+
+            # Process log and beam checkpoints are written once
+            db["processed_v" + version].create_index("str2match", unique=True)
+            db["checkpoints_v" + version].create_index(
+                [("str2match", pymongo.ASCENDING), ("beam", pymongo.ASCENDING)],
+                unique=True
+                )
+
+            if self.storage == "buckets":
+                # Unique bucket (granule, beam, first shot) and geospatial index
+                db["buckets_v" + version].create_index(
+                    [
+                        (config.shotKeys["granule"], pymongo.ASCENDING), 
+                        (config.shotKeys["beam"], pymongo.ASCENDING), 
+                        (config.shotKeys["shot_number"], pymongo.ASCENDING)
+                    ],
+                    unique=True
+                    )
+                db["buckets_v" + version].create_index([("env", pymongo.GEOSPHERE)])
+        
+            else:
+                # Shot number key of the shot docs schema, plus the keys of
+                # the shots of a beam (see reset_beams())
+                if self.schema > 1:
+                    sn_key = config.shotKeys["shot_number"]
+                    db["shots_v" + version].create_index(
+                        [(config.shotKeys["location"], pymongo.GEOSPHERE)]
+                        )
+                else:
+                    sn_key = "shot_number"
+                db["shots_v" + version].create_index(
+                    [(key, pymongo.ASCENDING) for key in self._beam_keys()]
+                    )
+            
+                # Unique shot number kept by an existing index
+                shots = db["shots_v" + version]
+                if any(
+                    info.get("unique") and info["key"] == [(sn_key, 1)]
+                    for info in shots.index_information().values()
+                    ):
+                    continue
+
+                # Unique shot number of docs holding the key only (legacy docs of
+                # the other schema may share the collection), ingest is not 
+                # idempotent without it
+                try:
+                    shots.create_index(
+                        sn_key, unique=True, 
+                        partialFilterExpression={sn_key: {"$exists": True}}
+                        )
+                except pymongo.errors.OperationFailure as error:
+                    msg = f"[ERROR] No unique '{sn_key}' index on shots_v{version}"
+                    print(strings.colors(f"\n{msg}: {error}", 1))
+                    raise RuntimeError(
+                        f"{msg} (remove duplicated shots and run GEDI Storer again)"
+                        ) from error
+
+    def register_granule(self, version, strMatch, l1b, l2a, l2b):
+        """
+        > register_granule(self, version, strMatch, l1b, l2a, l2b)
+            Get granule _id on granules_v<version> (inserted if missing).
+
+        > Arguments:
+            - self: GEDI_Writer instance;
+            - version: GEDI Product Version;
+            - strMatch: String with Granule unique ID;
+            - l1b, l2a, l2b: Granule filenames.
+        
+        > Output:
+            - ObjectId: Granule _id.
+        """
+        return self.get_database()["granules_v" + version].find_one_and_update(
+            {"str2match": strMatch},
+            {
+                "$setOnInsert": {
+                    "str2match": strMatch, "l1b": l1b, "l2a": l2a, "l2b": l2b
+                }
+            },
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER
+        )["_id"]
+
+    def find_checkpoints(self, version, strMatch):
+        """
+        > find_checkpoints(self, version, strMatch)
+            Get beams of a granule committed by a previous run.
+
+        > Arguments:
+            - self: GEDI_Writer instance;
+            - version: GEDI Product Version;
+            - strMatch: String with Granule unique ID.
+        
+        > Output:
+            - list: Committed beams.
+        """
+        checkpoints = self.get_database()["checkpoints_v" + version].find(
+            {"str2match": strMatch}
+            )
+        return sorted([c["beam"] for c in checkpoints])
+
+    def reset_beams(self, version, strMatch, beams):
+        """
+        > reset_beams(self, version, strMatch, beams)
+            Queue deletion of the shots (or buckets) of uncommitted beams 
+            written by a previous run, done before the beams are stored again
+            (bucket boundaries move with windows, predicates and footprints).
+
+        > Arguments:
+            - self: GEDI_Writer instance;
+            - version: GEDI Product Version;
+            - strMatch: String with Granule unique ID;
+            - beams: Uncommitted beams (see config.beam_list).
+        
+        > Output:
+            - No outputs (blocks while the queue is full).
+        """
+        # Granule registered by register_granule()
+        granule = self.get_database()["granules_v" + version].find_one(
+            {"str2match": strMatch}
+            )
+        if granule is None or len(beams) == 0:
+            return
+        
+        # Docs of the beams by granule reference (legacy docs by filename)
+        granule_key, beam_key = self._beam_keys()
+        if self.storage != "buckets" and self.schema == 1:
+            query = {granule_key: granule["l1b"], beam_key: {"$in": list(beams)}}
+        else:
+            query = {
+                granule_key: granule["_id"], 
+                beam_key: {"$in": [int(beam[4:], 2) for beam in beams]}
+                }
+        collection = "buckets_v" if self.storage == "buckets" else "shots_v"
+        self.delete_many(collection + version, query)
+
+    def report(self):
+        """
+        > report(self)
+            Print number of docs written and throughput (docs/s).
+
+        > Arguments:
+            - self: GEDI_Writer instance.
+        
+        > Output:
+            - No outputs (prints writer throughput).
+        """
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.docs / elapsed if elapsed > 0 else 0
+        print(f"\n > Docs written: {self.docs} in {elapsed:.1f} s", end=" ")
+        print(strings.colors(f"({rate:.0f} docs/s)", 3))
+        if self.duplicates > 0:
+            print(f" > Docs already stored (skipped): {self.duplicates}")
+
+    def _beam_keys(self):
+        # Granule and beam keys of shot/bucket docs (see GEDI_Shots)
+        if self.storage != "buckets" and self.schema == 1:
+            return ["l1b_file", "beam"]
+        return [config.shotKeys["granule"], config.shotKeys["beam"]]
+
+    def _put(self, item):
+        # Stop producers as soon as the writer fails
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+
+    def _run(self):
+        # Writer thread - consume queue until close() sentinel
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            
+            # Skip remaining writes after a failure (keeps process log 
+            # consistent with the shots actually written)
+            if self.error is not None:
+                continue
+
+            start = time.perf_counter()
+            try:
+                if item[0] == "waveforms":
+                    self.waveform_store.append(item[1], *item[2])
+                elif item[0] == "callback":
+                    item[2]()
+                else:
+                    self._write(*item)
+            except Exception as error:
+                self.error = error
+            
+            # Time spent by write kind ("many", "table", "waveforms", etc.)
+            self.write_times[item[0]] = (
+                self.write_times.get(item[0], 0.0) + time.perf_counter() - start
+                )
+
+    def _write(self, kind, collection, payload):
+        # Execute a queued MongoDB write
+        db = self.get_database()
+        try:
+            if kind == "many":
+                db[collection].insert_many(payload, ordered=False)
+                self.docs += len(payload)
+            elif kind == "one":
+                db[collection].insert_one(payload)
+            else:
+                db[collection].delete_many(payload)
+        
+        # Docs already stored by a previous run are skipped
+        except pymongo.errors.BulkWriteError as error:
+            errors = error.details["writeErrors"]
+            if not all(e["code"] == 11000 for e in errors):
+                raise
+            self.docs += error.details["nInserted"]
+            self.duplicates += len(errors)
+        except pymongo.errors.DuplicateKeyError:
+            self.duplicates += 1
+
+
+class GEDI_ParquetWriter(GEDI_Writer):
+    """
+    GEDI_ParquetWriter class
+
+    Write GEDI Shot data into a local columnar store (Parquet), one 
+    partition per lat/lon tile and year:
+        <root>/shots_v<version>/tile=<lat>_<lon>/year=<yyyy>/*.parquet
+
+    Granules, process log and checkpoints are kept as JSON-lines files:
+        <root>/_meta/<collection>.jsonl
+
+    Attributes:
+        - root: Columnar store folder (see config.parquetStorage)
+        - tile_size: Partition tile size, in degrees
+            --> default = config.parquet_tile_size (see utils/config.py)
+        - meta_lock: Lock for JSON-lines metadata files
+        - granule_ids: Registered granule _ids by collection (loaded on start)
+        - (see GEDI_Writer)
+    
+    Methods:
+        - start(self): Start writer thread
+        - create_indexes(self, versions): No indexes (no-op)
+        - insert_table(self, collection, table): Queue columns to write
+        - register_granule(self, version, strMatch, l1b, l2a, l2b): Granule _id
+        - find_checkpoints(self, version, strMatch): Get committed beams
+        - reset_beams(self, version, strMatch, beams): Queue deletion of the
+            partition files of uncommitted beams
+        - read_meta(root, collection): Read JSON-lines metadata (static)
+        - partition_folder(root, collection, lat0, lon0): Tile folder (static)
+        - (see GEDI_Writer)
+
+    """
+    # Shots are written as columns
+    columnar = True
+
+    def __init__(
+        self, root=config.parquetStorage, tile_size=config.parquet_tile_size,
+        queue_size=config.writer_queue_size
+        ):
+        super().__init__(None, queue_size=queue_size)
+        self.root = root
+        self.tile_size = tile_size
+        self.meta_lock = threading.Lock()
+        self.granule_ids = {}
+
+    def start(self):
+        """
+        > start(self)
+            Start writer thread (no database server).
+
+        > Arguments:
+            - self: GEDI_ParquetWriter instance.
+        
+        > Output:
+            - No outputs (leads to writer thread start).
+        """
+        if pq is None:
+            raise ImportError("pyarrow is required by the 'parquet' backend")
+        
+        # Create metadata folder if it does not exist
+        meta = os.path.join(self.root, "_meta")
+        os.makedirs(meta, exist_ok=True)
+
+        # Registered granules, read once instead of on every granule
+        for name in os.listdir(meta):
+            if name.startswith("granules_v") and name.endswith(".jsonl"):
+                collection = name[:-len(".jsonl")]
+                self.granule_ids[collection] = {
+                    g["_id"] for g in self.read_meta(self.root, collection)
+                    }
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.start_time = time.perf_counter()
+        self.thread.start()
+
+    def create_indexes(self, versions):
+        """
+        > create_indexes(self, versions)
+            No indexes on the columnar store (no-op).
+
+        > Arguments:
+            - self: GEDI_ParquetWriter instance;
+            - versions: List of GEDI Versions to process.
+        
+        > Output:
+            - No outputs.
+        """
+        pass
+
+    def insert_table(self, collection, table):
+        """
+        > insert_table(self, collection, table)
+            Queue columns to be written into tile/year partitions.
+
+        > Arguments:
+            - self: GEDI_ParquetWriter instance;
+            - collection: Collection name (shots_v<version>);
+            - table: Columns from GEDI_Shots.shot_table().
+        
+        > Output:
+            - No outputs (blocks while the queue is full).
+        """
+        if len(table["shot_number"]) > 0:
+            self._put(("table", collection, table))
+
+    def register_granule(self, version, strMatch, l1b, l2a, l2b):
+        """
+        > register_granule(self, version, strMatch, l1b, l2a, l2b)
+            Get granule _id on granules_v<version> (inserted if missing).
+
+        > Arguments:
+            - self: GEDI_ParquetWriter instance;
+            - version: GEDI Product Version;
+            - strMatch: String with Granule unique ID;
+            - l1b, l2a, l2b: Granule filenames.
+        
+        > Output:
+            - str: Granule _id (same as strMatch).
+        """
+        collection = "granules_v" + version
+        with self.meta_lock:
+            granule_ids = self.granule_ids.setdefault(collection, set())
+            if strMatch not in granule_ids:
+                self._append_meta(
+                    collection,
+                    {"_id": strMatch, "str2match": strMatch, 
+                     "l1b": l1b, "l2a": l2a, "l2b": l2b}
+                    )
+                granule_ids.add(strMatch)
+        
+        # Return results
+        return strMatch
+
+    def find_checkpoints(self, version, strMatch):
+        """
+        > find_checkpoints(self, version, strMatch)
+            Get beams of a granule committed by a previous run.
+
+        > Arguments:
+            - self: GEDI_ParquetWriter instance;
+            - version: GEDI Product Version;
+            - strMatch: String with Granule unique ID.
+        
+        > Output:
+            - list: Committed beams.
+        """
+        with self.meta_lock:
+            checkpoints = self.read_meta(self.root, "checkpoints_v" + version)
+        return sorted([c["beam"] for c in checkpoints if c["str2match"] == strMatch])
+
+    def reset_beams(self, version, strMatch, beams):
+        """
+        > reset_beams(self, version, strMatch, beams)
+            Queue deletion of the partition files of uncommitted beams, so
+            windows of an interrupted run are not stored twice.
+
+        > Arguments:
+            - self: GEDI_ParquetWriter instance;
+            - version: GEDI Product Version;
+            - strMatch: String with Granule unique ID;
+            - beams: Uncommitted beams (see config.beam_list).
+        
+        > Output:
+            - No outputs (blocks while the queue is full).
+        """
+        if len(beams) > 0:
+            self._put(("reset", "shots_v" + version, [strMatch, list(beams)]))
+
+    @staticmethod
+    def read_meta(root, collection):
+        """
+        > read_meta(root, collection)
+            Read JSON-lines metadata (granules, process log, checkpoints).
+
+        > Arguments:
+            - root: Columnar store folder (see config.parquetStorage);
+            - collection: Metadata collection name.
+        
+        > Output:
+            - list: Metadata docs.
+        """
+        path = os.path.join(root, "_meta", collection + ".jsonl")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    @staticmethod
+    def partition_folder(root, collection, lat0, lon0):
+        """
+        > partition_folder(root, collection, lat0, lon0)
+            Folder of a lat/lon tile partition (all years).
+
+        > Arguments:
+            - root: Columnar store folder (see config.parquetStorage);
+            - collection: Collection name (shots_v<version>);
+            - lat0, lon0: Lower-left corner of the tile.
+        
+        > Output:
+            - str: Tile partition folder.
+        """
+        return os.path.join(root, collection, f"tile={lat0:g}_{lon0:g}")
+
+    def _append_meta(self, collection, doc):
+        # Append doc to JSON-lines metadata (caller holds meta_lock)
+        path = os.path.join(self.root, "_meta", collection + ".jsonl")
+        with open(path, "a") as f:
+            f.write(json.dumps(doc) + "\n")
+
+    def _write(self, kind, collection, payload):
+        # Execute a queued write
+        if kind == "table":
+            self._write_table(collection, payload)
+        
+        elif kind == "reset":
+            # Files named <granule>_<beam>_<first shot> on every partition
+            strMatch, beams = payload
+            pattern = os.path.join(
+                self.root, collection, "tile=*", "year=*", f"{strMatch}_*.parquet"
+                )
+            for path in glob.glob(pattern):
+                beam = os.path.basename(path)[len(strMatch) + 1:].split("_")[0]
+                if beam in beams:
+                    os.remove(path)
+        
+        elif kind == "one":
+            with self.meta_lock:
+                self._append_meta(collection, payload)
+        
+        elif kind == "delete":
+            with self.meta_lock:
+                docs = [
+                    d for d in self.read_meta(self.root, collection)
+                    if any(d.get(k) != v for k, v in payload.items())
+                    ]
+                path = os.path.join(self.root, "_meta", collection + ".jsonl")
+                with open(path + ".tmp", "w") as f:
+                    f.writelines(json.dumps(d) + "\n" for d in docs)
+                os.replace(path + ".tmp", path)
+        
+        else:
+            raise ValueError(f"'{kind}' writes are not supported on Parquet")
+
+    def _write_table(self, collection, table):
+        # Partition keys: lat/lon tile and year of each shot
+        tile_lat = np.floor(table["lat"] / self.tile_size) * self.tile_size + 0.0
+        tile_lon = np.floor(table["lon"] / self.tile_size) * self.tile_size + 0.0
+        years = table["date_acquired"].astype("datetime64[Y]").astype(int) + 1970
+        keys, inverse = np.unique(
+            np.stack([tile_lat, tile_lon, years], axis=1), 
+            axis=0, return_inverse=True
+            )
+        inverse = inverse.ravel()
+        
+        for part_index, (lat0, lon0, year) in enumerate(keys):
+            rows = inverse == part_index
+            part = {column: values[rows] for column, values in table.items()}
+
+            # Create partition folder if it does not exist
+            folder = os.path.join(
+                self.partition_folder(self.root, collection, lat0, lon0), 
+                f"year={int(year)}"
+                )
+            os.makedirs(folder, exist_ok=True)
+
+            # Deterministic filename, reruns overwrite instead of duplicating
+            name = f"{part['granule'][0]}_{part['beam'][0]}_{part['shot_number'][0]}"
+            path = os.path.join(folder, name + ".parquet")
+            
+            # Atomic write
+            pq.write_table(pa.table(part), path + ".tmp")
+            os.replace(path + ".tmp", path)
+            self.docs += int(np.count_nonzero(rows))
+
+
+class GEDI_NullWriter(GEDI_Writer):
+    """
+    GEDI_NullWriter class
+
+    In-process stand-in for GEDI_Writer: docs are built and queued as usual, 
+    but the writer thread only counts them (benchmarks, dry runs)
+
+    Attributes:
+        - (see GEDI_Writer)
+    
+    Methods:
+        - start(self): Start writer thread
+        - create_indexes(self, versions): No indexes (no-op)
+        - insert_table(self, collection, table): Queue columns (counted)
+        - register_granule(self, version, strMatch, l1b, l2a, l2b): Granule _id
+        - find_checkpoints(self, version, strMatch): Get committed beams
+        - reset_beams(self, version, strMatch, beams): Nothing stored (no-op)
+        - (see GEDI_Writer)
+
+    """
+    def __init__(
+        self, batch_size=config.writer_batch_size, 
+        queue_size=config.writer_queue_size, columnar=False
+        ):
+        super().__init__(None, batch_size, queue_size)
+        self.columnar = columnar
+
+    def start(self):
+        """
+        > start(self)
+            Start writer thread (no database server).
+
+        > Arguments:
+            - self: GEDI_NullWriter instance.
+        
+        > Output:
+            - No outputs (leads to writer thread start).
+        """
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.start_time = time.perf_counter()
+        self.thread.start()
+
+    def create_indexes(self, versions):
+        """
+        > create_indexes(self, versions)
+            No indexes, nothing is stored (no-op).
+
+        > Arguments:
+            - self: GEDI_NullWriter instance;
+            - versions: List of GEDI Versions to process.
+        
+        > Output:
+            - No outputs.
+        """
+        pass
+
+    def insert_table(self, collection, table):
+        """
+        > insert_table(self, collection, table)
+            Queue columns (counted only).
+
+        > Arguments:
+            - self: GEDI_NullWriter instance;
+            - collection: Collection name (shots_v<version>);
+            - table: Columns from GEDI_Shots.shot_table().
+        
+        > Output:
+            - No outputs (blocks while the queue is full).
+        """
+        if len(table["shot_number"]) > 0:
+            self._put(("table", collection, table))
+
+    def register_granule(self, version, strMatch, l1b, l2a, l2b):
+        """
+        > register_granule(self, version, strMatch, l1b, l2a, l2b)
+            Get granule _id (same as strMatch, nothing is stored).
+
+        > Arguments:
+            - self: GEDI_NullWriter instance;
+            - version: GEDI Product Version;
+            - strMatch: String with Granule unique ID;
+            - l1b, l2a, l2b: Granule filenames.
+        
+        > Output:
+            - str: Granule _id (same as strMatch).
+        """
+        return strMatch
+
+    def find_checkpoints(self, version, strMatch):
+        """
+        > find_checkpoints(self, version, strMatch)
+            Get beams committed by a previous run (always none).
+
+        > Arguments:
+            - self: GEDI_NullWriter instance;
+            - version: GEDI Product Version;
+            - strMatch: String with Granule unique ID.
+        
+        > Output:
+            - list: Committed beams (empty).
+        """
+        return []
+
+    def reset_beams(self, version, strMatch, beams):
+        """
+        > reset_beams(self, version, strMatch, beams)
+            Nothing is stored, nothing to drop (no-op).
+
+        > Arguments:
+            - self: GEDI_NullWriter instance;
+            - version: GEDI Product Version;
+            - strMatch: String with Granule unique ID;
+            - beams: Uncommitted beams (see config.beam_list).
+        
+        > Output:
+            - No outputs.
+        """
+        pass
+
+    def _write(self, kind, collection, payload):
+        # Count queued docs/rows, nothing is written
+        if kind == "many":
+            self.docs += len(payload)
+        elif kind == "table":
+            self.docs += len(payload["shot_number"])
+
+
+class GEDI_WaveformStore():
+    """
+    GEDI_WaveformStore class
+
+    Memory-mappable store of GEDI01_B waveforms (rxwaveform), one flat
+    sample array and one index per version and lat/lon tile:
+        <root>/v<version>/tile=<lat>_<lon>/samples.f4
+        <root>/v<version>/tile=<lat>_<lon>/index.bin
+
+    Attributes:
+        - root: Waveform store folder (see config.waveformStorage)
+        - tile_size: Tile size, in degrees (see config.waveform_tile_size)
+        - index_dtype: Index records (shot_number, offset, count)
+        - orders: Sorted shot numbers and their index records by tile index 
+            (see tile_order())
+    
+    Methods:
+        - tile_folder(self, version, lat0, lon0): Folder of a tile
+        - tile_order(self, index_path): Sorted shot numbers of a tile index
+        - append(self, version, shots, lon, lat, waveforms): Append waveforms
+            (shots already stored are skipped)
+        - get_waveforms(self, version, shots, lon, lat): Zero-copy views
+
+    """
+    # Index records, offset and count in samples
+    index_dtype = np.dtype(
+        [("shot_number", "<u8"), ("offset", "<u8"), ("count", "<u4")]
+        )
+
+    def __init__(self, root=config.waveformStorage, tile_size=config.waveform_tile_size):
+        self.root = root
+        self.tile_size = tile_size
+        self.orders = {}
+
+    def tile_folder(self, version, lat0, lon0):
+        """
+        > tile_folder(self, version, lat0, lon0)
+            Folder of a version/tile waveform store.
+
+        > Arguments:
+            - self: GEDI_WaveformStore instance;
+            - version: GEDI Product Version;
+            - lat0, lon0: Lower-left corner of the tile.
+        
+        > Output:
+            - str: Tile folder.
+        """
+        return os.path.join(self.root, "v" + version, f"tile={lat0:g}_{lon0:g}")
+
+    def tile_order(self, index_path):
+        """
+        > tile_order(self, index_path)
+            Sorted shot numbers of a tile index and their record positions,
+            cached and merged with the records appended since the last call.
+
+        > Arguments:
+            - self: GEDI_WaveformStore instance;
+            - index_path: Path to the tile index.bin.
+        
+        > Output:
+            - NumPy array: Sorted shot numbers;
+            - NumPy array: Index record of each sorted shot number.
+        """
+        size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+        total = size // self.index_dtype.itemsize
+        sorted_shots, order = self.orders.get(
+            index_path, (np.zeros(0, "<u8"), np.zeros(0, "int64"))
+            )
+        
+        # Index rewritten by someone else, sort it again
+        if total < len(order):
+            sorted_shots, order = np.zeros(0, "<u8"), np.zeros(0, "int64")
+        
+        # Merge records appended since the last call
+        if total > len(order):
+            new = np.fromfile(
+                index_path, dtype=self.index_dtype, count=total - len(order),
+                offset=len(order) * self.index_dtype.itemsize
+                )["shot_number"]
+            new_order = np.argsort(new, kind="stable")
+            pos = np.searchsorted(sorted_shots, new[new_order], side="right")
+            sorted_shots = np.insert(sorted_shots, pos, new[new_order])
+            order = np.insert(order, pos, len(order) + new_order)
+            self.orders[index_path] = (sorted_shots, order)
+
+        # Return results
+        return sorted_shots, order
+
+    def append(self, version, shots, lon, lat, waveforms):
+        """
+        > append(self, version, shots, lon, lat, waveforms)
+            Append waveforms to the tile stores (single writer).
+
+        > Arguments:
+            - self: GEDI_WaveformStore instance;
+            - version: GEDI Product Version;
+            - shots: NumPy array of shot numbers;
+            - lon, lat: NumPy arrays of shot coordinates;
+            - waveforms: NumPy object array of waveforms (one per shot).
+        
+        > Output:
+            - No outputs (leads to samples and index appending).
+        """
+        for (lat0, lon0), rows in self._group_tiles(lon, lat).items():
+            
+            # Create tile folder if it does not exist
+            folder = self.tile_folder(version, lat0, lon0)
+            os.makedirs(folder, exist_ok=True)
+            index_path = os.path.join(folder, "index.bin")
+
+            # Skip shots already stored (reruns) or repeated in the batch
+            sorted_shots, order = self.tile_order(index_path)
+            rows = np.sort(rows[np.unique(shots[rows], return_index=True)[1]])
+            pos = np.minimum(
+                np.searchsorted(sorted_shots, shots[rows]), 
+                max(len(sorted_shots) - 1, 0)
+                )
+            if len(sorted_shots) > 0:
+                rows = rows[sorted_shots[pos] != shots[rows]]
+            if len(rows) == 0:
+                continue
+
+            # Samples of the tile shots as one flat array
+            tile_waves = [np.asarray(w, dtype="<f4") for w in waveforms[rows]]
+            counts = np.array([len(w) for w in tile_waves], dtype="<u4")
+            samples_path = os.path.join(folder, "samples.f4")
+            first = os.path.getsize(samples_path) // 4 if os.path.exists(samples_path) else 0
+
+            # Index records (offsets in samples)
+            records = np.empty(len(rows), dtype=self.index_dtype)
+            records["shot_number"] = shots[rows]
+            records["count"] = counts
+            records["offset"] = first + np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+            # Samples first, so the index never points past the samples
+            with open(samples_path, "ab") as f:
+                f.write(np.concatenate(tile_waves).tobytes())
+            with open(index_path, "ab") as f:
+                f.write(records.tobytes())
+
+    def get_waveforms(self, version, shots, lon, lat):
+        """
+        > get_waveforms(self, version, shots, lon, lat)
+            Get waveforms of a set of shots as zero-copy views.
+
+        > Arguments:
+            - self: GEDI_WaveformStore instance;
+            - version: GEDI Product Version;
+            - shots: NumPy array of shot numbers;
+            - lon, lat: NumPy arrays of shot coordinates (tile lookup).
+        
+        > Output:
+            - dict: Waveform (memory-mapped NumPy view) by shot number.
+        """
+        shots = np.asarray(shots, dtype="<u8")
+        waveforms = {}
+        for (lat0, lon0), rows in self._group_tiles(lon, lat).items():
+
+            # Skip tiles without waveforms
+            folder = self.tile_folder(version, lat0, lon0)
+            index_path = os.path.join(folder, "index.bin")
+            samples_path = os.path.join(folder, "samples.f4")
+            if not os.path.exists(index_path) or os.path.getsize(index_path) == 0:
+                continue
+
+            # Sorted shot numbers (cached by tile), then memory-mapped index 
+            # and samples (records appended meanwhile are not looked up)
+            sorted_shots, order = self.tile_order(index_path)
+            index = np.memmap(index_path, dtype=self.index_dtype, mode="r")
+            samples = np.memmap(samples_path, dtype="<f4", mode="r")
+
+            # Locate requested shots on the index (sorted lookup)
+            pos = np.searchsorted(sorted_shots, shots[rows])
+            pos = np.minimum(pos, len(sorted_shots) - 1)
+            found = sorted_shots[pos] == shots[rows]
+
+            for shot, record in zip(shots[rows][found], index[order[pos[found]]]):
+                beg = int(record["offset"])
+                waveforms[int(shot)] = samples[beg:beg + int(record["count"])]
+        
+        # Return results
+        return waveforms
+
+    def _group_tiles(self, lon, lat):
+        # Row indexes of each lat/lon tile
+        tile_lat = np.floor(np.asarray(lat) / self.tile_size) * self.tile_size + 0.0
+        tile_lon = np.floor(np.asarray(lon) / self.tile_size) * self.tile_size + 0.0
+        keys, inverse = np.unique(
+            np.stack([tile_lat, tile_lon], axis=1), axis=0, return_inverse=True
+            )
+        inverse = inverse.ravel()
+        
+        # Rows sorted by tile, split at tile boundaries (rows stay in order)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1]
+        return {
+            (lat0, lon0): rows for (lat0, lon0), rows 
+            in zip(keys.tolist(), np.split(order, bounds))
+            }
+
+
+class GEDI_Footprint():
+    """
+    GEDI_Footprint class
+
+    Footprint index of a GEDI granule: bounding boxes of along-track segments 
+    of each beam, cached on disk as <root>/<l1b granule>.json
+
+    Attributes:
+        - granule: L1B granule filename
+        - root: Footprint cache folder (see config.footprintStorage)
+        - segment: Shots by segment (see config.footprint_segment)
+        - step: Decimation of the geolocation read (see config.footprint_step)
+        - pad: Padding of the segment boxes (see config.footprint_pad)
+        - beams: Segments [beg, end, minx, miny, maxx, maxy] by beam
+    
+    Methods:
+        - cache_path(self): Path to the cached footprint index
+        - load_or_build(self, reader): Load cached index or build it
+        - load(self): Load cached index
+        - beam_bounds(self): Bounding box of each beam
+        - build(self, reader): Build index from a decimated geolocation read
+        - beam_ranges(self, beam, roi): L1B row ranges of segments 
+            intersecting ROI
+
+    """
+    def __init__(
+        self, granule, root=config.footprintStorage, 
+        segment=config.footprint_segment, step=config.footprint_step, 
+        pad=config.footprint_pad
+        ):
+        self.granule = granule
+        self.root = root
+        self.segment = segment
+        self.step = step
+        self.pad = pad
+        self.beams = None
+
+    def cache_path(self):
+        """
+        > cache_path(self)
+            Path to the cached footprint index of the granule.
+
+        > Arguments:
+            - self: GEDI_Footprint instance.
+        
+        > Output:
+            - str: Path to JSON file.
+        """
+        return os.path.join(self.root, os.path.splitext(self.granule)[0] + ".json")
+
+    def load_or_build(self, reader):
+        """
+        > load_or_build(self, reader)
+            Load cached footprint index, or build and cache it.
+
+        > Arguments:
+            - self: GEDI_Footprint instance;
+            - reader: Open GranuleReader instance.
+        
+        > Output:
+            - No outputs (sets self.beams).
+        """
+        # Cached index is reused only if built with the same parameters
+        if self.load():
+            return
+        
+        # Build index and cache it (atomic rename)
+        self.build(reader)
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.cache_path() + ".tmp", "w") as f:
+            json.dump(
+                {"params": [self.segment, self.step, self.pad], "beams": self.beams}, 
+                f
+                )
+        os.replace(self.cache_path() + ".tmp", self.cache_path())
+
+    def load(self):
+        """
+        > load(self)
+            Load cached footprint index (built with the same parameters).
+
+        > Arguments:
+            - self: GEDI_Footprint instance.
+        
+        > Output:
+            - bool: True if the cached index was loaded (sets self.beams).
+        """
+        if not os.path.exists(self.cache_path()):
+            return False
+        
+        with open(self.cache_path(), "r") as f:
+            cached = json.load(f)
+        if cached.get("params") != [self.segment, self.step, self.pad]:
+            return False
+        
+        self.beams = cached["beams"]
+        return True
+
+    def beam_bounds(self):
+        """
+        > beam_bounds(self)
+            Bounding box of each beam (union of its segment boxes).
+
+        > Arguments:
+            - self: GEDI_Footprint instance (loaded).
+        
+        > Output:
+            - dict: [minx, miny, maxx, maxy] by beam.
+        """
+        return {
+            beam: [
+                min(seg[2] for seg in segments), min(seg[3] for seg in segments),
+                max(seg[4] for seg in segments), max(seg[5] for seg in segments)
+                ]
+            for beam, segments in self.beams.items() if len(segments) > 0
+        }
+
+    def build(self, reader):
+        """
+        > build(self, reader)
+            Build footprint index from a decimated geolocation read.
+
+        > Arguments:
+            - self: GEDI_Footprint instance;
+            - reader: Open GranuleReader instance.
+        
+        > Output:
+            - No outputs (sets self.beams).
+        """
+        # Geolocation datasets of the reader (see config.basicDatasets)
+        lat_product, lat_dataset = reader.datasets["lat"]
+        lon_product, lon_dataset = reader.datasets["lon"]
+
+        self.beams = {}
+        for beam in config.beam_list:
+            
+            # Beams missing from the granule have no segments
+            if beam not in reader.h5[lat_product]:
+                continue
+
+            self.beams[beam] = h5Tasks.segment_bounds(
+                reader.h5[lat_product][beam + "/" + lat_dataset],
+                reader.h5[lon_product][beam + "/" + lon_dataset],
+                self.segment, self.step, self.pad
+                )
+
+    def beam_ranges(self, beam, roi):
+        """
+        > beam_ranges(self, beam, roi)
+            L1B row ranges of beam segments intersecting a given ROI.
+
+        > Arguments:
+            - self: GEDI_Footprint instance;
+            - beam: GEDI BEAM name (see config.beam_list);
+            - roi: Compiled ROI (GEDI_ROI instance).
+        
+        > Output:
+            - list: Sorted [beg, end) row ranges (adjacent segments merged).
+        """
+        segments = self.beams.get(beam, [])
+        if len(segments) == 0:
+            return []
+        
+        # Segments whose boxes intersect ROI
+        mask = roi.boxes_within([seg[2:] for seg in segments])
+        
+        # Merge adjacent segments into single ranges
+        ranges = []
+        for seg, within in zip(segments, mask):
+            if not within:
+                continue
+            if len(ranges) > 0 and ranges[-1][1] == seg[0]:
+                ranges[-1][1] = seg[1]
+            else:
+                ranges.append([seg[0], seg[1]])
+        
+        # Return results
+        return ranges
+
+
+class GEDI_ROI():
+    """
+    GEDI_ROI class
+
+    Compiled ROI: geometry (Polygon/MultiPolygon) read once, prepared for 
+    exact tests, plus a raster mask over its bounding box so most points are 
+    classified with an array lookup. Compiled ROIs are cached on disk as 
+    <cache>/<file hash>_<cell_size>_<max_cells>.npz
+
+    Attributes:
+        - path: ROI GeoJSON file (see config.roiPath)
+        - cache: Compiled ROI cache folder (see config.roiCache)
+        - cell_size: Raster cell size, in degrees (see config.roi_cell_size)
+        - max_cells: Max raster cells (see config.roi_max_cells)
+        - geometry: Shapely Polygon/MultiPolygon
+        - prepared: Geometry prepared for exact tests
+        - raster: Raster mask (see geoTasks.rasterize_extent())
+        - hash: Hash of the ROI file contents (see file_hash())
+    
+    Methods:
+        - file_hash(self): Hash of the ROI file contents (computed once)
+        - cache_path(self): Path to the compiled ROI of the file
+        - load(self): Load compiled ROI (compiled and cached if missing)
+        - contains(self, lon, lat): Vectorized test of points within ROI
+        - boxes_within(self, boxes): Test of boxes intersecting ROI
+
+    """
+    def __init__(
+        self, path=config.roiPath, cache=config.roiCache, 
+        cell_size=config.roi_cell_size, max_cells=config.roi_max_cells
+        ):
+        self.path = path
+        self.cache = cache
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.geometry = None
+        self.prepared = None
+        self.raster = None
+        self.hash = None
+    
+    def __getstate__(self):
+        # Prepared geometries are not picklable (GEDI Storer workers)
+        state = self.__dict__.copy()
+        state["prepared"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.geometry is not None:
+            self.prepared = geoTasks.prepare_extent(self.geometry)
+
+    def file_hash(self):
+        """
+        > file_hash(self)
+            Hash of the ROI file contents (compiled ROIs, granule subsets),
+            read once and kept for later calls.
+
+        > Arguments:
+            - self: GEDI_ROI instance.
+        
+        > Output:
+            - str: First 16 hex digits of the SHA-256 digest.
+        """
+        if self.hash is None:
+            with open(self.path, "rb") as f:
+                self.hash = hashlib.sha256(f.read()).hexdigest()[:16]
+        
+        # Return results
+        return self.hash
+
+    def cache_path(self):
+        """
+        > cache_path(self)
+            Path to the compiled ROI, keyed by the ROI file hash.
+
+        > Arguments:
+            - self: GEDI_ROI instance.
+        
+        > Output:
+            - str: Path to .npz file.
+        """
+        return os.path.join(
+            self.cache, f"{self.file_hash()}_{self.cell_size:g}_{self.max_cells}.npz"
+            )
+
+    def load(self):
+        """
+        > load(self)
+            Load compiled ROI (compiled and cached if missing).
+
+        > Arguments:
+            - self: GEDI_ROI instance.
+        
+        > Output:
+            - GEDI_ROI instance (self, loaded).
+        """
+        cache_path = self.cache_path()
+
+        if os.path.exists(cache_path):
+            # Geometry (WKB) and raster mask from cache
+            with np.load(cache_path) as cached:
+                self.geometry = wkb.loads(cached["wkb"].tobytes())
+                self.raster = {
+                    "mask": cached["mask"],
+                    "minx": float(cached["minx"]),
+                    "miny": float(cached["miny"]),
+                    "cell_size": float(cached["cell_size"])
+                }
+        
+        else:
+            # Compile ROI from the GeoJSON file
+            self.geometry = geoTasks.shapely_from_GeoJSON(self.path)
+            self.raster = geoTasks.rasterize_extent(
+                self.geometry, self.cell_size, self.max_cells
+                )
+            
+            # Cache compiled ROI (atomic rename)
+            os.makedirs(self.cache, exist_ok=True)
+            with open(cache_path + ".tmp", "wb") as f:
+                np.savez(
+                    f, wkb=np.frombuffer(wkb.dumps(self.geometry), dtype="uint8"),
+                    **self.raster
+                    )
+            os.replace(cache_path + ".tmp", cache_path)
+        
+        # Prepare geometry for exact tests
+        self.prepared = geoTasks.prepare_extent(self.geometry)
+
+        # Return results
+        return self
+
+    def contains(self, lon, lat):
+        """
+        > contains(self, lon, lat)
+            Vectorized test of points (lon, lat) within ROI.
+
+        > Arguments:
+            - self: GEDI_ROI instance;
+            - lon: NumPy array of longitudes;
+            - lat: NumPy array of latitudes.
+        
+        > Output:
+            - NumPy boolean array (True for points within ROI).
+        """
+        return geoTasks.points_within(
+            self.geometry, lon, lat, self.prepared, self.raster
+            )
+
+    def boxes_within(self, boxes):
+        """
+        > boxes_within(self, boxes)
+            Test of bounding boxes intersecting ROI.
+
+        > Arguments:
+            - self: GEDI_ROI instance;
+            - boxes: Boxes (minx, miny, maxx, maxy) by row.
+        
+        > Output:
+            - NumPy boolean array (True for boxes intersecting ROI).
+        """
+        return geoTasks.boxes_within(self.geometry, boxes, self.prepared)
+
+
+class GEDI_Catalog():
+    """
+    GEDI_Catalog class
+
+    Local catalog (SQLite) of GEDI granules shared by GEDI Finder, Downloader
+    and Storer: granule names are parsed once, local state is queried instead
+    of globbing and slicing filenames
+
+    Attributes:
+        - path: Catalog file (see config.catalogPath)
+        - conn: SQLite connection
+    
+    Methods:
+        - open(self): Open catalog (tables created if missing)
+        - close(self): Commit and close catalog
+        - parse_name(name): Parse a granule filename or URL (static)
+        - add_found(self, urls): Register granules found on LP DAAC
+        - mark_downloaded(self, name, size, checksum): Update download status
+        - mark_failed(self, name): Update download status (failed)
+        - sync_local(self, files, root): Register files in local storage
+        - local_names(self, product, version): Names of downloaded granules
+        - granule_triplets(self): Matching L1B, L2A and L2B local granules
+        - mark_ingested(self, version, strMatch): Update ingest status
+        - stored_names(self): Names of granules already stored
+        - set_local(self, files, root): Register local files read instead of 
+            the downloads (granule subsets)
+        - mark_deleted(self, names): Update download status (raw file deleted)
+        - set_footprint(self, name, bounds): Store beam footprint bounds
+        - get_footprint(self, name): Get beam footprint bounds
+        - set_coverage(self, coverage): Store GEDI Finder tiles by granule
+        - tile_priority(self, names, tiles): Rank granules by priority tiles
+
+    """
+    # Catalog tables and indexes
+    schema = [
+        """CREATE TABLE IF NOT EXISTS granules (
+            name TEXT PRIMARY KEY, local_name TEXT, url TEXT, 
+            product TEXT, version TEXT, str2match TEXT, 
+            orbit INTEGER, track INTEGER, acquired TEXT,
+            size INTEGER, checksum TEXT, 
+            download_status TEXT DEFAULT 'found', 
+            ingest_status TEXT DEFAULT 'pending', updated TEXT
+            )""",
+        """CREATE INDEX IF NOT EXISTS granules_match 
+            ON granules (version, str2match)""",
+        """CREATE INDEX IF NOT EXISTS granules_status 
+            ON granules (product, version, download_status)""",
+        """CREATE TABLE IF NOT EXISTS footprints (
+            name TEXT, beam TEXT, 
+            minx REAL, miny REAL, maxx REAL, maxy REAL,
+            PRIMARY KEY (name, beam)
+            )""",
+        """CREATE TABLE IF NOT EXISTS coverage (
+            name TEXT, tile TEXT, PRIMARY KEY (name, tile)
+            )""",
+        """CREATE INDEX IF NOT EXISTS coverage_tile ON coverage (tile)"""
+    ]
+
+    def __init__(self, path=config.catalogPath):
+        self.path = path
+        self.conn = None
+    
+    def __enter__(self):
+        self.open()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """
+        > open(self)
+            Open catalog (tables created if missing), once: catalogs already
+            open (see gediTasks.gc_open_catalog()) keep their connection.
+
+        > Arguments:
+            - self: GEDI_Catalog instance.
+        
+        > Output:
+            - No outputs (leads to SQLite connection).
+        """
+        if self.conn is not None:
+            return
+        
+        self.conn = sqlite3.connect(self.path)
+        for statement in self.schema:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    def close(self):
+        """
+        > close(self)
+            Commit and close catalog.
+
+        > Arguments:
+            - self: GEDI_Catalog instance.
+        
+        > Output:
+            - No outputs (leads to SQLite connection closing).
+        """
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    @staticmethod
+    def parse_name(name):
+        """
+        > parse_name(name)
+            Parse a GEDI granule filename or URL.
+
+        > Arguments:
+            - name: Granule filename or URL (with or without 'processed_', 
+                or subset filename, see GEDI_Shots.subset_granule()).
+        
+        > Output:
+            - dict: name (no prefix), product, version, str2match, orbit, 
+                track and acquired (YYYY-MM-DD).
+        """
+        # Filename without URL, 'processed_' prefix and subset suffix
+        name = GEDI_Shots.source_name(os.path.basename(name.strip().split("/")[-1]))
+        if name.startswith("processed_"):
+            name = name[len("processed_"):]
+        
+        # GEDI01_B_2019109210808_O01988_T02056_02_003_01.h5
+        parts = os.path.splitext(name)[0].split("_")
+        
+        # Return results
+        return {
+            "name": name,
+            "product": parts[0] + "_" + parts[1],
+            "version": parts[-1],
+            "str2match": "_".join(parts[2:5]),
+            "orbit": int(parts[3][1:]),
+            "track": int(parts[4][1:]),
+            "acquired": datetime.strptime(parts[2][:7], "%Y%j").strftime("%Y-%m-%d")
+        }
+
+    def add_found(self, urls):
+        """
+        > add_found(self, urls):
+            Register granules found on LP DAAC (status is kept if known).
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - urls: List of granule URLs.
+        
+        > Output:
+            - No outputs (leads to catalog update).
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = []
+        for url in urls:
+            g = self.parse_name(url)
+            rows.append([
+                g["name"], url.strip(), g["product"], g["version"], 
+                g["str2match"], g["orbit"], g["track"], g["acquired"], now
+                ])
+        
+        # Insert new granules, keep status of known ones (url updated)
+        self.conn.executemany(
+            """INSERT INTO granules (name, url, product, version, str2match, 
+                orbit, track, acquired, updated) VALUES (?,?,?,?,?,?,?,?,?)
+               ON CONFLICT(name) DO UPDATE SET url = excluded.url""",
+            rows
+            )
+        self.conn.commit()
+
+    def mark_downloaded(self, name, size, checksum=None):
+        """
+        > mark_downloaded(self, name, size, checksum=None)
+            Update download status of a granule (downloaded).
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - name: Granule filename or URL;
+            - size: File size, in bytes;
+            - checksum: File checksum (default = None).
+        
+        > Output:
+            - No outputs (leads to catalog update).
+        """
+        self._upsert_local([[name, size, checksum]])
+
+    def mark_failed(self, name):
+        """
+        > mark_failed(self, name)
+            Update download status of a granule (failed).
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - name: Granule filename or URL.
+        
+        > Output:
+            - No outputs (leads to catalog update).
+        """
+        self.conn.execute(
+            """UPDATE granules SET download_status = 'failed', updated = ? 
+               WHERE name = ? AND download_status != 'downloaded'""",
+            [datetime.now().isoformat(timespec="seconds"), 
+             self.parse_name(name)["name"]]
+            )
+        self.conn.commit()
+
+    def sync_local(self, files, root=config.localStorage):
+        """
+        > sync_local(self, files, root=config.localStorage)
+            Register files in local storage (and granules no longer there).
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - files: Local granule filenames (see gs_get_files());
+            - root: Path to local folder with downloaded GEDI Granules.
+        
+        > Output:
+            - No outputs (leads to catalog update).
+        """
+        # Local names already registered as downloaded
+        known = {
+            row[0]: row[1] for row in self.conn.execute(
+                """SELECT name, local_name FROM granules 
+                   WHERE download_status = 'downloaded'"""
+                )
+            }
+        
+        # Only new files are stat'ed and registered (subsets read instead of 
+        # their granules, see GEDI_Shots.granule_files())
+        names = {
+            self.parse_name(f)["name"]: f 
+            for f in sorted(files, key=lambda f: f.endswith(GEDI_Shots.subset_suffix))
+            }
+        new = [
+            [f, os.path.getsize(
+                os.path.join(root, self.parse_name(f)["product"], f)
+                ), None]
+            for name, f in names.items() if known.get(name) != f
+            ]
+        self._upsert_local(new)
+
+        # Files removed from local storage
+        gone = [[name] for name in known if name not in names]
+        self.conn.executemany(
+            """UPDATE granules SET download_status = 'missing' 
+               WHERE name = ?""",
+            gone
+            )
+        self.conn.commit()
+
+    def local_names(self, product=None, version=None):
+        """
+        > local_names(self, product=None, version=None)
+            Names (no 'processed_' prefix) of downloaded granules.
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - product: GEDI product (default = None, all products);
+            - version: GEDI Product Version (default = None, all versions).
+        
+        > Output:
+            - set: Granule names.
+        """
+        query = "SELECT name FROM granules WHERE download_status = 'downloaded'"
+        params = []
+        if product is not None:
+            query += " AND product = ?"
+            params.append(product)
+        if version is not None:
+            query += " AND version = ?"
+            params.append(version)
+        return {row[0] for row in self.conn.execute(query, params)}
+
+    def granule_triplets(self):
+        """
+        > granule_triplets(self)
+            Matching L1B, L2A and L2B downloaded granules by version.
+
+        > Arguments:
+            - self: GEDI_Catalog instance.
+        
+        > Output:
+            - dict: {version: {str2match: [l1b, l2a, l2b local names]}}
+                (incomplete matches keep only the products found).
+        """
+        rows = self.conn.execute(
+            """SELECT version, str2match, product, local_name FROM granules 
+               WHERE download_status = 'downloaded' 
+               ORDER BY version, str2match, product"""
+            )
+        
+        # Group products by version and match parameter (L1B required)
+        triplets = {}
+        for version, str2match, product, local_name in rows:
+            triplets.setdefault(version, {}).setdefault(str2match, {})[product] = local_name
+        
+        # Return results
+        return {
+            version: {
+                str2match: [products[p] for p in config.gedi_products if p in products]
+                for str2match, products in matches.items() if "GEDI01_B" in products
+                }
+            for version, matches in triplets.items()
+        }
+
+    def mark_ingested(self, version, strMatch):
+        """
+        > mark_ingested(self, version, strMatch)
+            Update ingest status of a granule triplet (stored).
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - version: GEDI Product Version;
+            - strMatch: String with Granule unique ID.
+        
+        > Output:
+            - No outputs (leads to catalog update).
+        """
+        self.conn.execute(
+            """UPDATE granules SET ingest_status = 'stored', updated = ? 
+               WHERE version = ? AND str2match = ?""",
+            [datetime.now().isoformat(timespec="seconds"), version, strMatch]
+            )
+        self.conn.commit()
+
+    def stored_names(self):
+        """
+        > stored_names(self)
+            Names (no 'processed_' prefix) of granules already stored.
+
+        > Arguments:
+            - self: GEDI_Catalog instance.
+        
+        > Output:
+            - set: Granule names.
+        """
+        rows = self.conn.execute(
+            "SELECT name FROM granules WHERE ingest_status = 'stored'"
+            )
+        return {row[0] for row in rows}
+
+    def set_local(self, files, root=config.localStorage):
+        """
+        > set_local(self, files, root=config.localStorage)
+            Register local files read instead of the downloaded granules 
+            (subsets, see GEDI_Shots.subset_granule()), checksum kept.
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - files: Local filenames (missing files are left out);
+            - root: Path to local folder with downloaded GEDI Granules.
+        
+        > Output:
+            - No outputs (leads to catalog update).
+        """
+        paths = {
+            f: os.path.join(root, self.parse_name(f)["product"], f) for f in files
+            }
+        self._upsert_local([
+            [f, os.path.getsize(path), None] 
+            for f, path in paths.items() if os.path.exists(path)
+            ])
+
+    def mark_deleted(self, names):
+        """
+        > mark_deleted(self, names)
+            Update download status of granules whose raw file was deleted.
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - names: Granule filenames.
+        
+        > Output:
+            - No outputs (leads to catalog update).
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        self.conn.executemany(
+            "UPDATE granules SET download_status = 'deleted', updated = ? WHERE name = ?",
+            [[now, self.parse_name(name)["name"]] for name in names]
+            )
+        self.conn.commit()
+
+    def set_footprint(self, name, bounds):
+        """
+        > set_footprint(self, name, bounds)
+            Store footprint bounds of each beam of a granule.
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - name: Granule filename;
+            - bounds: [minx, miny, maxx, maxy] by beam (see GEDI_Footprint).
+        
+        > Output:
+            - No outputs (leads to catalog update).
+        """
+        name = self.parse_name(name)["name"]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO footprints VALUES (?,?,?,?,?,?)",
+            [[name, beam] + list(box) for beam, box in bounds.items()]
+            )
+        self.conn.commit()
+
+    def get_footprint(self, name):
+        """
+        > get_footprint(self, name)
+            Get footprint bounds of each beam of a granule.
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - name: Granule filename.
+        
+        > Output:
+            - dict: [minx, miny, maxx, maxy] by beam.
+        """
+        rows = self.conn.execute(
+            "SELECT beam, minx, miny, maxx, maxy FROM footprints WHERE name = ?",
+            [self.parse_name(name)["name"]]
+            )
+        return {row[0]: list(row[1:]) for row in rows}
+
+    def set_coverage(self, coverage):
+        """
+        > set_coverage(self, coverage)
+            Store GEDI Finder tiles touched by each granule.
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - coverage: {granule name: [tile_id]} (see gf_requests()).
+        
+        > Output:
+            - No outputs (leads to catalog update).
+        """
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO coverage (name, tile) VALUES (?,?)",
+            [[self.parse_name(name)["name"], tile] 
+             for name, tiles in coverage.items() for tile in tiles]
+            )
+        self.conn.commit()
+
+    def tile_priority(self, names, tiles=config.priority_tiles):
+        """
+        > tile_priority(self, names, tiles=config.priority_tiles)
+            Rank granules by the first priority tile they touch.
+
+        > Arguments:
+            - self: GEDI_Catalog instance;
+            - names: Granule filenames or URLs;
+            - tiles: Priority tiles (see config.priority_tiles).
+        
+        > Output:
+            - dict: Rank by name given (len(tiles) for granules touching none).
+        """
+        parsed = {name: self.parse_name(name)["name"] for name in names}
+        
+        # Coverage of the given granules on priority tiles only (rank is the 
+        # position of the tile on the JSON array)
+        touched = {}
+        if len(tiles) > 0 and len(parsed) > 0:
+            touched = dict(self.conn.execute(
+                """SELECT coverage.name, MIN(t.key) FROM coverage 
+                   JOIN json_each(?) AS t ON t.value = coverage.tile
+                   JOIN json_each(?) AS n ON n.value = coverage.name
+                   GROUP BY coverage.name""",
+                [json.dumps(list(tiles)), json.dumps(sorted(set(parsed.values())))]
+                ))
+        
+        # Return results
+        return {name: touched.get(g, len(tiles)) for name, g in parsed.items()}
+
+    def _upsert_local(self, files):
+        # Register downloaded files ([filename, size, checksum]), local name 
+        # as found on local storage (with or without 'processed_' prefix)
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = []
+        for f, size, checksum in files:
+            g = self.parse_name(f)
+            rows.append([
+                g["name"], os.path.basename(f.strip().split("/")[-1]), 
+                g["product"], g["version"],
+                g["str2match"], g["orbit"], g["track"], g["acquired"], 
+                size, checksum, now
+                ])
+        self.conn.executemany(
+            """INSERT INTO granules (name, local_name, product, version, 
+                str2match, orbit, track, acquired, size, checksum, 
+                download_status, updated) 
+               VALUES (?,?,?,?,?,?,?,?,?,?,'downloaded',?)
+               ON CONFLICT(name) DO UPDATE SET 
+                local_name = excluded.local_name, size = excluded.size, 
+                checksum = COALESCE(excluded.checksum, granules.checksum),
+                download_status = 'downloaded', updated = excluded.updated""",
+            rows
+            )
+        self.conn.commit()
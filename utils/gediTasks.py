@@ -12,11 +12,13 @@ Author: Marcus Moresco Boeno
 import os
 import sys
 import time
+import json
 import requests
 import tkinter as tk
 
 # library specific imports
 from subprocess import Popen
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from getpass import getpass
 from netrc import netrc
 from tkinter import filedialog
@@ -25,6 +27,7 @@ from datetime import datetime
 
 # Third party library imports
 import pymongo
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Point, Polygon
@@ -130,6 +133,7 @@ def gedi_downloader():
         gediDownloader_Menu = [
             f"Define file with LPDAAC links (current: {source_links})",
             "Download files",
+            "Download and store files (pipelined by granule triplet)",
             "Return to Main Menu",
             "Exit System"
             ]
@@ -156,7 +160,7 @@ def gedi_downloader():
             root.withdraw()
             source_links = filedialog.askopenfilename()
         
-        elif downloader_option == 2:
+        elif downloader_option in [2, 3]:
             if source_links != "...empty...":
                 
                 # Retrieve list of granules to download, and define a subset
@@ -170,10 +174,13 @@ def gedi_downloader():
                     # Checking credentials
                     gd_check_credentials()
 
-                    # Download files
+                    # Download files (and store triplets as they complete)
                     print("\n ... Starting Download Routine ...\n")
                     time.sleep(1.5)
-                    gd_download(files2down)
+                    if downloader_option == 2:
+                        gd_download(files2down)
+                    else:
+                        gd_download_and_store(files2down)
                     print(f"\n ...  Download Routine Completed! ...\n")
                     print("\n" + "- - " * 20, "\n")
                     break
@@ -191,7 +198,7 @@ def gedi_downloader():
                 print(strings.colors("> Define Links Source File!", 1))
                 print("\n" + "- - " * 20, "\n")
              
-        elif downloader_option == 3:
+        elif downloader_option == 4:
             # Return to Main Menu
             print("\n >> Returning to main menu ...\n")
             print("\n" + "- - " * 20, "\n")
@@ -214,17 +221,22 @@ def gedi_storer():
         - No outputs (function leads to MongoDB update).
     """
 
-    # Get local storage files
-    all_files = gs_get_files()
+    with gc_open_catalog() as catalog:
 
-    # Get gedi versions inside local storage
-    versions = gs_get_versions(all_files)
+        # Get dictionary with files per version and product level
+        files_dict = catalog.granule_triplets()
 
-    # Get dictionary with files per version and product level
-    files_dict = gs_match_files(all_files, versions)
+        # Get dictionary of files to process
+        files, numgranules = gs_files_to_Process(files_dict)
 
-    # Get dictionary of files to process
-    files, numgranules = gs_files_to_Process(files_dict)
+        # Granules touching priority tiles first (by L1B granule coverage)
+        for version in files:
+            priority = catalog.tile_priority(
+                [matched[0] for matched in files[version].values()]
+                )
+            files[version] = dict(sorted(
+                files[version].items(), key=lambda item: priority[item[1][0]]
+                ))
 
     if numgranules == 0:
         print(
@@ -240,7 +252,11 @@ def gedi_storer():
         # Print number of files to process
         print(strings.colors(f"\nUpdating {numgranules} GEDI Granules", 2))
 
-        # Get dictionary keys
+        # Compiled ROI, loaded once for every granule
+        roi = gediClasses.GEDI_ROI(config.roiPath).load()
+
+        # Get list of GEDI_Shots instances to process
+        tasks = []
         for version in list(files.keys()):
             for index_gran, match in enumerate(list(files[version].keys())):
 
@@ -250,33 +266,43 @@ def gedi_storer():
                 else:
 
                     # Create class instance to process shots
-                    gediShots = gediClasses.GEDI_Shots(
-                        path = config.localStorage,
-                        l1b = files[version][match][0],
-                        l2a = files[version][match][1],
-                        l2b = files[version][match][2],
-                        vers = version,
-                        strMatch = match,
-                        beams = config.beam_list,
-                        db = config.base_mongodb,
-                        extent = gpd.read_file(config.roiPath)["geometry"][0],
-                        index_gran=index_gran+1, 
-                        num_grans=numgranules
+                    tasks.append(
+                        gediClasses.GEDI_Shots(
+                            path = config.localStorage,
+                            l1b = files[version][match][0],
+                            l2a = files[version][match][1],
+                            l2b = files[version][match][2],
+                            vers = version,
+                            strMatch = match,
+                            beams = config.beam_list,
+                            db = config.base_mongodb,
+                            roi = roi,
+                            index_gran=index_gran+1, 
+                            num_grans=numgranules
+                        )
                     )
+        
+        # Single writer stage for the whole run (see config.storage_backend)
+        writer = gs_get_writer()
+
+        with writer:
 
-                    # Process shots and store into MongoDB
-                    gediShots.process_and_store()
+            # Make sure collections are indexed
+            writer.create_indexes(list(files.keys()))
 
-                    # Update process log
-                    gediShots.update_process_log()
+            # Process granules (failed granules are logged and left out)
+            stored = gs_store_parallel(tasks, config.storer_workers, writer)
         
-        print(
-            strings.colors(
-                f"\n > MongoDB '{config.base_mongodb}' succesfully updated!", 
-                2
-                )
-            )
-        print("\n" + "- - " * 20 + "\n")
+        # Writes are flushed, update ingest status on the local catalog
+        gs_catalog_stored(stored)
+
+        # Print writer throughput, shots removed by each filter and stages
+        writer.report()
+        gs_report_filters(tasks)
+        gs_report_stages(tasks, writer)
+
+        # Print storage updated
+        gs_print_updated()
 
 
 def gedi_extractor():
@@ -437,13 +463,14 @@ def gedi_extractor():
                         
                         
                     else:
-                        pass
-                        # ge_extract_full_info(
-                        #     geometry_src,
-                        #     buffer,
-                        #     output_folder,
-                        #     output_format
-                        #     )
+
+                        ge_extract_full_info(
+                            geometry_src,
+                            buffer,
+                            output_folder,
+                            output_format,
+                            config.base_mongodb
+                            )
             else:
                 # Ask user to define missing info
                 if geometry_src == "...empty...":
@@ -475,6 +502,32 @@ def gedi_extractor():
             
 
 
+# ----- GEDI Catalog methods ------------------------------------------------- #
+
+
+def gc_open_catalog(path=config.localStorage):
+    """
+    > gc_open_catalog(path=config.localStorage)
+        Open local catalog (see config.catalogPath) synced with local storage.
+
+    > Arguments:
+        - path: Path to local folder with downloaded GEDI Granules.
+            --> default = config.localStorage (see utils/config.py)
+    
+    > Output:
+        - Open GEDI_Catalog instance (use as a context manager, which keeps 
+            this connection and closes it on exit).
+    """
+    catalog = gediClasses.GEDI_Catalog()
+    catalog.open()
+
+    # Register files downloaded (or removed) outside GEDI Downloader
+    catalog.sync_local(gs_get_files(path), path)
+    
+    # Return results
+    return catalog
+
+
 # ----- GEDI Finder methods -------------------------------------------------- #
 
 
@@ -528,19 +581,32 @@ def gf_search(bbox):
     # Create list of products and versions
     pv_list = [[prod, version] for prod in products for version in versions] 
 
-    # Create empty list to store results
-    gedi_granules = []
+    # Create empty dict to store results (granule name: parsed info)
+    gedi_granules = {}
+
+    # Query products, versions and tiles concurrently (cached responses reused)
+    link_lists, coverage = gf_requests(pv_list, bbox)
+
+    # Local catalog, synced with local storage
+    with gc_open_catalog() as catalog:
 
-    # Iterate over list of products and versions
-    for product, version in pv_list:
-        request = gediClasses.GEDI_request(p=product, v=version, bbox=bbox)
-        link_list = request.process_request()
+        # Iterate over list of products and versions
+        for product, version in pv_list:
+            link_list = link_lists.get((product, version), [])
 
-        # Get only filenames, not entire URL
-        link_list = [f[57:] for f in link_list]
+            # Register granules found (download status is kept)
+            catalog.add_found(link_list)
 
-        # Update list
-        gedi_granules.extend(link_list)
+            # Get only filenames (and parsed info), not entire URL
+            for f in link_list:
+                g = catalog.parse_name(f)
+                gedi_granules[g["name"]] = g
+        
+        # Tiles touched by each granule (download and ingest priority)
+        catalog.set_coverage(coverage)
+
+        # Granules already downloaded
+        local_names = catalog.local_names()
     
     # Create empty list to store results
     gedi_granules_all_files = []
@@ -548,8 +614,8 @@ def gf_search(bbox):
 
     # Sometimes v02 products are inside v01 products on LP_DAAC/NASA Server
     # so we need to check for this bug 
-    prods_corr = sorted(list(set([f[0:8] for f in gedi_granules])))
-    vers_corr = sorted(list(set([f[-5:-3] for f in gedi_granules])))
+    prods_corr = sorted(list(set([g["product"] for g in gedi_granules.values()])))
+    vers_corr = sorted(list(set([g["version"] for g in gedi_granules.values()])))
 
     # Update pv_list with corrected versions
     pv_list = [[prod, version] for prod in prods_corr for version in vers_corr]
@@ -558,26 +624,16 @@ def gf_search(bbox):
     for index, item in enumerate(pv_list):
         
         # Retrieve files that match product and version
-        beg, end = item[0], item[1] + ".h5"
         gedi_granules_all_files.append(
-            [f for f in gedi_granules if f.startswith(beg) and f.endswith(end)]
+            sorted([
+                name for name, g in gedi_granules.items() 
+                if g["product"] == item[0] and g["version"] == item[1]
+                ])
         )
-
-        # files on storage
-        folder = config.localStorage + os.sep + item[0] + os.sep
-        files_localStorage = [
-            os.path.basename(f)[10:] for f in glob(
-                folder + "*" + item[1] + ".h5"
-                )
-            ]
         
         # Files to download
         gedi_granules_to_download.append(
-            sorted(
-                list(
-                    set(gedi_granules_all_files[index]) - set(files_localStorage)
-                )
-                )
+            [f for f in gedi_granules_all_files[index] if f not in local_names]
             )
     
     # Create text file with results
@@ -596,6 +652,84 @@ def gf_search(bbox):
     print("\n" + "- - " * 20 + "\n")
 
 
+def gf_requests(pv_list, bbox, workers=config.finder_workers, 
+                tile_size=config.finder_tile_size, **kwargs):
+    """
+    > gf_requests(pv_list, bbox, workers=config.finder_workers,
+                  tile_size=config.finder_tile_size, **kwargs)
+        Run GEDI Finder requests of products, versions and bbox tiles 
+        concurrently, merging granules as results arrive.
+
+    > Arguments:
+        - pv_list: List of [product, version];
+        - bbox: Bounding Box for LP_DAAC/NASA query;
+        - workers: Number of concurrent requests.
+            --> default = config.finder_workers (see utils/config.py)
+        - tile_size: Tile size of large bboxes, in degrees (0 = no tiles).
+            --> default = config.finder_tile_size (see utils/config.py)
+        - kwargs: GEDI_request options (base_url, timeout, cache, ttl, etc.).
+    
+    > Output:
+        - dict: Granule links (no duplicates) by (product, version);
+        - dict: Tiles touched by each granule name (see geoTasks.bbox_tiles()).
+    """
+    tiles = geoTasks.bbox_tiles(bbox, tile_size)
+    if len(tiles) > 1:
+        print(f"   > Searching {len(tiles)} tiles of {tile_size} degrees")
+    
+    # Links by (product, version) and granule name (first link is kept)
+    links = {(product, version): {} for product, version in pv_list}
+    coverage = {}
+    failed = 0
+    
+    # Single pooled session for every request
+    with requests.Session() as session:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {}
+            for product, version in pv_list:
+                for tile_id, tile in tiles:
+                    request = gediClasses.GEDI_request(product, version, tile, **kwargs)
+                    futures[pool.submit(request.process_request, session)] = [
+                        request, tile_id
+                        ]
+            
+            # Merge results as they arrive
+            for future in as_completed(futures):
+                request, tile_id = futures[future]
+                key = (request.product, request.version)
+                try:
+                    link_list = future.result()
+                except Exception as error:
+                    failed += 1
+                    msg = f"[ERROR] GEDI Finder request {key} {tile_id} failed: {error}"
+                    print(strings.colors(f"\n{msg}", 1))
+                    continue
+                
+                for f in link_list:
+                    name = f.split("/")[-1].strip()
+                    links[key].setdefault(name, f)
+                    coverage.setdefault(name, set()).add(tile_id)
+                
+                # Print request source (single bbox only)
+                if len(tiles) == 1:
+                    source = "cache" if request.from_cache else "LP_DAAC"
+                    print(f"   > {request.product} v{request.version}: ", end="")
+                    print(f"{len(link_list)} granules ({source})")
+    
+    # Print merged results of tiled searches
+    if len(tiles) > 1:
+        for (product, version), found in links.items():
+            print(f"   > {product} v{version}: {len(found)} granules")
+    if failed > 0:
+        print(strings.colors(f"   > {failed} failed requests (granules may be missing)", 1))
+    
+    # Return results
+    return (
+        {key: list(found.values()) for key, found in links.items()},
+        {name: sorted(tiles) for name, tiles in coverage.items()}
+    )
+
+
 def gf_write_searchResults(bbox, prodVers_list, full_list, toDownload_list):
     """
     > gf_write_searhResults(full_list, toDownload_list):
@@ -672,43 +806,29 @@ def gd_files2down(src_file):
         - list: List of files (full links) to download.
     """
     
-    # Get list of files
-    fileList = [f.strip() for f in open(src_file, "r").readlines()]
-    
-    # Retrieve GEDI Products
-    prods = sorted(list(set([f[-49:-41] for f in fileList])))
-    
-    # Iterate over GEDI Product
-    files2down = []
-    files_alrdDown = []
+    # Get list of files (granule links only)
+    fileList = [
+        f.strip() for f in open(src_file, "r").readlines() 
+        if f.strip().endswith(".h5")
+        ]
     
-    for prod in prods:
-
-        # Create product local storage directory if they do not exist
-        if not os.path.exists(config.localStorage + os.sep + prod):
-            
-            # Create local storage
-            os.makedirs(config.localStorage + os.sep + prod)
-            
-            # Get all files for that product
-            files2down.extend([f for f in fileList if f[-49:-41] == prod])
+    # Granules already downloaded (see config.catalogPath)
+    # (stored granules whose raw files were deleted are not downloaded again)
+    with gc_open_catalog() as catalog:
+        local_names = catalog.local_names() | catalog.stored_names()
+        granules = {f: catalog.parse_name(f) for f in fileList}
         
-        else:
-            # Get list of files already downloaded
-            filesDown = [
-                os.path.basename(f) for f in glob(
-                    config.localStorage + os.sep + prod + os.sep + "*.h5"
-                    )
-            ]
-
-            # Update list of files to download 
-            if len(filesDown) > 0:
-                prodFiles = [f for f in fileList if f[-49:-41] == prod]
-                files2down.extend([f for f in prodFiles if f[-59:] not in filesDown])
-                files_alrdDown.extend([f for f in prodFiles if f[-59:] in filesDown])
+        # Granules touching priority tiles first (see config.priority_tiles)
+        priority = catalog.tile_priority(fileList)
+        fileList = sorted(fileList, key=lambda f: priority[f])
 
-            else:
-                files2down.extend([f for f in fileList if f[-49:-41] == prod])
+    # Create product local storage directories if they do not exist
+    for prod in sorted(set([g["product"] for g in granules.values()])):
+        os.makedirs(config.localStorage + os.sep + prod, exist_ok=True)
+    
+    # Split files already downloaded and files to download
+    files2down = [f for f in fileList if granules[f]["name"] not in local_names]
+    files_alrdDown = [f for f in fileList if granules[f]["name"] in local_names]
     
     # Print info on number of granules to be downloaded
     print("\n" + "- - " * 20)
@@ -721,14 +841,16 @@ def gd_files2down(src_file):
     
         
 
-def gd_download(files2down):
+def gd_download(files2down, workers=config.download_workers):
     """
-    > gedi_downloader()
+    > gd_download(files2down, workers=config.download_workers)
         Function to download pre-processed GEDI Granules from LPDAAC Server.
 
     > Arguments:
         - files2down: List of files (full link) to download.
             ---> Output from gd_files2down()
+        - workers: Number of parallel transfers.
+            --> default = config.download_workers (see utils/config.py)
     
     > Output:
         - No outputs (function leads to GEDI Granules download).
@@ -736,82 +858,240 @@ def gd_download(files2down):
     # Get number of files to download
     listLen = len(files2down)
 
-    # Retrieve GEDI Products
-    prods = sorted(list(set([f[-49:-41] for f in files2down])))
+    # Destination of each file (see config.localStorage)
+    jobs = []
+    for f in files2down:
+        prod = gediClasses.GEDI_Catalog.parse_name(f)["product"]
+        outFolder = config.localStorage + os.sep + prod
+        jobs.append([f, os.path.join(outFolder, f.split('/')[-1].strip())])
+
+    # Authentication credentials (netrc parsed once)
+    auth = gd_netrc_auth()
 
-    # Create and submit request and download file
-    netrcDir = os.path.expanduser("~/.netrc")
+    # Local catalog updated as files are downloaded
+    print(f"\n ... Downloading {listLen} files ({workers} parallel transfers) ...")
+    with gediClasses.GEDI_Catalog() as catalog:
+        downloader = gediClasses.GEDI_Downloader(
+            auth, workers, 
+            checksums=gediClasses.GEDI_Downloader.load_checksums()
+            )
+        with downloader:
             
-    # Address to call for authentication
-    urs = 'urs.earthdata.nasa.gov'
+            # Files are reported as transfers complete
+            fileCount = 0
+            for f, fileName, size, checksum, error in downloader.download(jobs):
+                fileCount += 1
 
-    # Authentication credentials
-    auth = (
-        netrc(netrcDir).authenticators(urs)[0], 
-        netrc(netrcDir).authenticators(urs)[2]
-        )
+                if error is not None:
+                    fn = f.split('/')[-1].strip()
+                    print(strings.colors(f"\n{fn} not downloaded ({fileCount} of {listLen})", 1))
+                    print(f"   > {error}")
+                    print("         > Server maintenance downtime - Code: 503")
+                    print("         > Others - Code: Various\n")
+                    catalog.mark_failed(f)
+                
+                else:
+                    # Register download on the local catalog
+                    catalog.mark_downloaded(fileName, size, checksum)
+                    
+                    # Print indication when granule download is complete
+                    msg = f"   > [DONE] {fileCount} of {listLen}: {f}" 
+                    print(strings.colors(msg, 2))
+            
+            # Print aggregate throughput
+            downloader.report()
 
-    # Iterate over gedi products
-    fileCount = 0
-    for prod in prods:
-        
-        # Get files of the given product
-        prodFiles = [f for f in files2down if f[-49:-41] == prod]
 
-        # Defining output folder (see config.localStorage)
-        outFolder = config.localStorage + os.sep + prod
+def gd_download_and_store(files2down, workers=config.download_workers, 
+                          delete_raw=config.pipeline_delete_raw):
+    """
+    > gd_download_and_store(files2down, workers=config.download_workers,
+                            delete_raw=config.pipeline_delete_raw)
+        Download GEDI Granules triplet by triplet, storing each triplet 
+        (L1B, L2A and L2B) as soon as it is complete while further 
+        downloads continue.
 
-        # Iterate over files
-        for f in prodFiles:
-            
-            # Create filename
-            fileName = os.path.join(outFolder, f.split('/')[-1].strip())
+    > Arguments:
+        - files2down: List of files (full link) to download.
+            ---> Output from gd_files2down()
+        - workers: Number of parallel transfers.
+            --> default = config.download_workers (see utils/config.py)
+        - delete_raw: Delete raw granules once stored.
+            --> default = config.pipeline_delete_raw (see utils/config.py)
+    
+    > Output:
+        - No outputs (function leads to GEDI Granules download and storage).
+    """
+    # Parse links and schedule downloads by granule triplet (triplets 
+    # touching priority tiles first, see config.priority_tiles)
+    parse_name = gediClasses.GEDI_Catalog.parse_name
+    granules = {f: parse_name(f) for f in files2down}
+    with gediClasses.GEDI_Catalog() as catalog:
+        priority = catalog.tile_priority(files2down)
+    triplet_rank = {}
+    for f, g in granules.items():
+        key = (g["version"], g["str2match"])
+        triplet_rank[key] = min(triplet_rank.get(key, priority[f]), priority[f])
+    files2down = sorted(
+        files2down, 
+        key=lambda f: [triplet_rank[(granules[f]["version"], granules[f]["str2match"])]] 
+        + [granules[f][k] for k in ["version", "str2match", "product"]]
+        )
+    jobs = [
+        [f, os.path.join(
+            config.localStorage, granules[f]["product"], f.split('/')[-1].strip()
+            )]
+        for f in files2down
+        ]
+    versions = sorted(set(g["version"] for g in granules.values()))
+
+    # Products already in local storage, by triplet
+    pending = {}
+    with gediClasses.GEDI_Catalog() as catalog:
+        for version, matches in catalog.granule_triplets().items():
+            for match, names in matches.items():
+                pending[(version, match)] = {parse_name(n)["product"]: n for n in names}
+    
+    # Triplets already stored are only downloaded
+    processed = gs_processed_keys(versions)
+    numgranules = len({
+        (g["version"], g["str2match"]) for g in granules.values()
+        if g["str2match"] not in processed[g["version"]]
+        })
 
-            # Increase file counter
-            fileCount += 1
+    # Compiled ROI, loaded once for every granule
+    roi = gediClasses.GEDI_ROI(config.roiPath).load()
 
-            try:
-                # Try to establish connection and get GEDI Granule
-                response = requests.get(f, verify=False, stream=True, auth=auth)  
-            
-            except ConnectionRefusedError:
-                message = "[ConnectionRefusedError] - Connection denied"
-                print(strings.colors(f"\n{message}\n", 1))
-            
-            else:
+    # Downloads (threads), processing (processes) and writes (writer thread) overlap
+    listLen = len(files2down)
+    print(f"\n ... Downloading {listLen} files ({workers} parallel transfers) ...")
+    deleted = []
+    writer = gs_get_writer()
+    downloader = gediClasses.GEDI_Downloader(
+        gd_netrc_auth(), workers, 
+        checksums=gediClasses.GEDI_Downloader.load_checksums()
+        )
+
+    with writer, downloader, gediClasses.GEDI_Catalog() as catalog:
+
+        # Make sure collections are indexed
+        writer.create_indexes(versions)
+
+        with gediClasses.GEDI_StorerPool(writer, config.storer_workers) as pool:
+
+            # Finished transfers are queued with the storer items (errors as
+            # text, items are pickled)
+            downloader.submit(jobs, lambda f, fileName, size, checksum, error: pool.put(
+                ("download", None, [f, fileName, size, checksum, 
+                                    None if error is None else str(error)])
+                ))
+
+            # Single loop over downloads and beam windows, whichever comes first
+            fileCount = 0
+            while fileCount < listLen or pool.busy():
+                item = pool.get()
+                if item is None:
+                    continue
+                if item[0] != "download":
+                    gd_store_item(pool, item, deleted, delete_raw)
+                    continue
+                
+                f, fileName, size, checksum, error = item[2]
+                fileCount += 1
 
-                # Check for code status
-                if response.status_code != 200:
+                if error is not None:
                     fn = f.split('/')[-1].strip()
-                    print(strings.colors(f"\n{fn} not downloaded\n", 1))
-                    print(f"   > Status Code: {response.status_code}")
-                    print("         > Server maintenance downtime - Code: 503")
-                    print("         > Others - Code: Various\n")
+                    print(strings.colors(f"\n{fn} not downloaded ({fileCount} of {listLen})", 1))
+                    print(f"   > {error}")
+                    catalog.mark_failed(f)
+                    continue
+                
+                # Register download on the local catalog
+                catalog.mark_downloaded(fileName, size, checksum)
+                print(strings.colors(f"   > [DONE] {fileCount} of {listLen}: {f}", 2))
+
+                # Complete triplets are submitted to the process pool
+                g = granules[f]
+                products = pending.setdefault((g["version"], g["str2match"]), {})
+                products[g["product"]] = os.path.basename(fileName)
+                if len(products) == len(config.gedi_products) and (
+                    g["str2match"] not in processed[g["version"]]
+                    ):
+                    l1b, l2a, l2b = [products[p] for p in config.gedi_products]
+                    gediShots = gediClasses.GEDI_Shots(
+                        path=config.localStorage, l1b=l1b, l2a=l2a, l2b=l2b,
+                        vers=g["version"], strMatch=g["str2match"],
+                        beams=config.beam_list, db=config.base_mongodb, roi=roi,
+                        index_gran=len(pool.stored)+len(pool.running)+len(pool.pending)+1, 
+                        num_grans=numgranules
+                        )
+                    pool.submit(gediShots)
+            stored = pool.stored
+    
+    # Writes are flushed, update ingest status on the local catalog
+    gs_catalog_stored(stored)
+    if deleted:
+        with gediClasses.GEDI_Catalog() as catalog:
+            catalog.mark_deleted(deleted)
+    
+    # Print throughput, shots removed by each filter and stages
+    downloader.report()
+    writer.report()
+    if stored:
+        gs_report_filters(stored)
+        gs_report_stages(stored, writer)
+    gs_print_updated()
 
-                # If OK status code (200) continue to download
-                else:
 
-                    # Get raw web content
-                    response.raw.decode_content = True
-                    content = response.raw
-                    
-                    # Open file and start writing
-                    with open(fileName, 'wb') as d:
+def gd_store_item(pool, item, deleted, delete_raw):
+    """
+    > gd_store_item(pool, item, deleted, delete_raw)
+        Store a worker item of gd_download_and_store() and queue the deletion
+        of raw files of stored granules.
 
-                        # Print info on granule being downloaded
-                        print(f"\nDownloading {fileCount} of {listLen}:")
-                        print(f"   > {f} ...")
-                        
-                        # Reading and writing data
-                        while True:
-                            chunk = content.read(16 * 1024)
-                            if not chunk:
-                                break
-                            d.write(chunk)
-                    
-                    # Print indication when granule download is complete
-                    msg = "   > [DONE] File Succesfully downloaded" 
-                    print(strings.colors(f"{msg}\n", 2))
+    > Arguments:
+        - pool: Running GEDI_StorerPool instance;
+        - item: Worker item (see GEDI_Shots.process_windows());
+        - deleted: List of deleted raw granules (appended by the writer);
+        - delete_raw: Delete raw granules once stored.
+    
+    > Output:
+        - No outputs (leads to granule storage).
+    """
+    gediShots = pool.handle(item)
+    if gediShots is None or gediShots not in pool.stored:
+        return
+
+    # Raw files (and subsets) are deleted only after the granule writes 
+    # were committed
+    if delete_raw:
+        files = [gediShots.l1b_file, gediShots.l2a_file, gediShots.l2b_file]
+        files += [f for f in gediShots.granule_files() if f not in files]
+        
+        def delete_files():
+            for f in files:
+                os.remove(os.path.join(
+                    config.localStorage, 
+                    gediClasses.GEDI_Catalog.parse_name(f)["product"], f
+                    ))
+                deleted.append(f)
+        
+        pool.writer.after_writes(delete_files)
+
+
+def gd_netrc_auth(urs="urs.earthdata.nasa.gov"):
+    """
+    > gd_netrc_auth(urs="urs.earthdata.nasa.gov")
+        Read NASA Earthdata Login credentials from ~/.netrc.
+
+    > Arguments:
+        - urs: Address to call for authentication.
+    
+    > Output:
+        - tuple: (username, password).
+    """
+    login, account, password = netrc(os.path.expanduser("~/.netrc")).authenticators(urs)
+    return (login, password)
 
 
 def gd_check_credentials():
@@ -865,154 +1145,300 @@ def gd_check_credentials():
 # ----- GEDI Storer methods -------------------------------------------------- #
 
 
-def gs_get_files(path=config.localStorage):
+def gs_get_files(path=config.localStorage, manifest=config.localManifest):
     """
-    > gs_get_files(path=config.localStorage)
+    > gs_get_files(path=config.localStorage, manifest=config.localManifest)
         Function to get files into local storage (see utils/config.py).
 
     > Arguments:
         - path: Path to local folder with downloaded GEDI Granules.
             --> default = config.localStorage (see utils/config.py)
+        - manifest: Listing cache of product folders ("" = always glob).
+            --> default = config.localManifest (see utils/config.py)
     
     > Output:
         - List of granules in local storage (all gedi versions and levels).
     """
+    # Load listings of a previous run
+    listings = {}
+    if manifest and os.path.exists(manifest):
+        with open(manifest, "r") as f:
+            listings = json.load(f)
+
     # Start empty list to store results
     files = []
+    changed = False
 
     # Iterate through product list
     for product in config.gedi_products:
-        files.extend(
-            [
-                os.path.basename(f) for f in glob(
-                      path + os.sep + product + os.sep + "*.h5"
-                    )
-                ]
-            )
+        folder = path + os.sep + product
+        mtime = os.path.getmtime(folder) if os.path.isdir(folder) else None
+        
+        # Re-glob only folders changed since the listing was cached
+        cached = listings.get(product)
+        if cached is None or cached["mtime"] != mtime:
+            cached = {
+                "mtime": mtime,
+                "files": [
+                    os.path.basename(f) for f in glob(folder + os.sep + "*.h5")
+                    ]
+            }
+            listings[product] = cached
+            changed = True
+        
+        files.extend(cached["files"])
+    
+    # Update manifest (atomic rename)
+    if manifest and changed:
+        with open(manifest + ".tmp", "w") as f:
+            json.dump(listings, f)
+        os.replace(manifest + ".tmp", manifest)
     
     # Return results
     return files
 
 
-def gs_get_versions(files):
+def gs_files_to_Process(files_dict):
     """
-    > gs_get_versions(files)
-        Function to get versions of GEDI Granules in local storage.
+    > gs_files_to_Process(files_dict)
+        Function to get dictionary of GEDI Granules to process.
 
     > Arguments:
-        - files: list of GEDI filenames.
+        - files_dict: Dictionary of matching granules by version.
+            --> Output from GEDI_Catalog.granule_triplets().
     
     > Output:
-        - List of GEDI Versions in local storage.
+        - final_dict: Dictionary of granules to process;
+        - granules: Number of granules to process.
     """
-    return list(set([v[-5:-3] for v in files]))
+    # Empty dictionary to store results
+    final_dict = {}
+
+    # Reckon versions
+    versions = list(files_dict.keys())
+
+    # Processed granules of each version (one bulk fetch per version)
+    processed = gs_processed_keys(versions)
+
+    for version in versions:
+        final_dict[version] = {
+            match: matched for match, matched in files_dict[version].items()
+            if match not in processed[version]
+            }
+
+    # Get number of GEDI granules to process
+    granules = 0
+    for version in versions:
+        granules += len(list(final_dict[version].keys()))
+    
+    # Return results
+    return final_dict, granules
 
 
-def gs_match_files(files, versions):
+def gs_processed_keys(versions):
     """
-    > gs_match_files(files, versions)
-        Function to get dictionary of matching L1B, L2A and L2B Granules.
+    > gs_processed_keys(versions)
+        Function to get granules already processed (see config.storage_backend).
 
     > Arguments:
-        - files: list of GEDI filenames;
         - versions: list of GEDI Versions.
     
     > Output:
-        - Dictionary of matching granules by version.
+        - Dictionary of processed str2match sets by version.
     """
-    
-    # Create empty dictionary to store results
-    gedi_dict = {}
+    # Empty dictionary to store results
+    processed = {}
 
-    # iterate through versions
-    for version in versions:
-        
-        # Create nested dictionary for version
-        gedi_dict[version] = {}
+    if config.storage_backend == "parquet":
 
-        # Get files for version
-        version_files = [f for f in files if f.endswith(version + ".h5")]
+        # Process log is kept with the columnar store
+        for version in versions:
+            processed[version] = {
+                log["str2match"] for log in 
+                gediClasses.GEDI_ParquetWriter.read_meta(
+                    config.parquetStorage, "processed_v" + version
+                    )
+                }
     
-        # Get L1B files for version
-        l1b_files = [
-            f for f in version_files if f.startswith("processed_GEDI01_B")
-            ]
-        
-        # Iterate through L1B files
-        for l1b_file in l1b_files:
-            
-            # Get match parameter
-            str2match = l1b_file[19:46]
-
-            # Get matching L2A and L2B files
-            matched_files = [f for f in files if f[19:46] == str2match]
+    else:
+        # Create MongoDB Connection
+        with pymongo.mongo_client.MongoClient() as mongo:
 
-            # Append files to dictionary
-            gedi_dict[version][str2match] = matched_files
+            # Acces database
+            db = mongo.get_database(config.base_mongodb)
+        
+            # Keys only, streamed in a single query per version
+            for version in versions:
+                processed[version] = {
+                    log["str2match"] for log in db["processed_v" + version].find(
+                        {}, {"_id": 0, "str2match": 1}
+                        )
+                    }
     
     # Return results
-    return gedi_dict
+    return processed
 
 
-def gs_files_to_Process(files_dict):
+def gs_report_filters(tasks):
     """
-    > gs_files_to_Process(files_dict)
-        Function to get dictionary of GEDI Granules to process.
+    > gs_report_filters(tasks)
+        Print number of shots removed by each ingest filter.
 
     > Arguments:
-        - files_dict: Dictionary of matching granules by version.
-            --> Output from gs_match_files().
+        - tasks: List of processed GEDI_Shots instances.
     
     > Output:
-        - final_dict: Dictionary of granules to process;
-        - granules: Number of granules to process.
+        - No outputs (prints filter counters).
     """
-    # Empty dictionary to store results
-    final_dict = {}
+    # Sum counters of every granule
+    totals = {}
+    for gediShots in tasks:
+        for name, count in gediShots.filter_stats.items():
+            totals[name] = totals.get(name, 0) + count
+
+    # Print results
+    print("\n > Shots per ingest filter:")
+    print(f"     - Shots read: {totals.pop('shots_read', 0)}")
+    kept = totals.pop("shots_kept", 0)
+    for name, count in totals.items():
+        print(f"     - Removed by '{name}': {count}")
+    print(strings.colors(f"     - Shots kept: {kept}", 2))
+
+
+def gs_catalog_stored(tasks):
+    """
+    > gs_catalog_stored(tasks)
+        Update ingest status and beam footprints on the local catalog.
 
-    # Reckon versions
-    versions = list(files_dict.keys())
+    > Arguments:
+        - tasks: List of stored GEDI_Shots instances.
+    
+    > Output:
+        - No outputs (leads to local catalog update).
+    """
+    with gediClasses.GEDI_Catalog() as catalog:
+        for gediShots in tasks:
+            catalog.mark_ingested(gediShots.version, gediShots.strMatch)
 
-    # Create MongoDB Connection
-    with pymongo.mongo_client.MongoClient() as mongo:
+            # Subsets read from now on (see config.subset_granules)
+            files = gediShots.granule_files()
+            if gediShots.subset:
+                catalog.set_local(files)
 
-        # Acces database
-        db = mongo.get_database(config.base_mongodb)
-        
-        # iterate through versions
-        for version in versions:
+            # Beam bounds from the cached footprint index (see GEDI_Footprint)
+            footprint = gediClasses.GEDI_Footprint(files[0])
+            if footprint.load():
+                catalog.set_footprint(gediShots.l1b_file, footprint.beam_bounds())
 
-            # Create nested dictionary for version
-            final_dict[version] = {}
 
-            # Log collection name
-            collec_name = "processed_v" + version
+def gs_report_stages(tasks, writer, log_path=config.storer_log):
+    """
+    > gs_report_stages(tasks, writer, log_path=config.storer_log)
+        Print summary table of storer stages and append it to the storer log.
 
-            # Test whether log exists or not
-            if collec_name in db.list_collection_names():
+    > Arguments:
+        - tasks: List of processed GEDI_Shots instances;
+        - writer: Closed GEDI_Writer instance;
+        - log_path: Storer log (see config.storer_log, "" = no log).
+    
+    > Output:
+        - No outputs (prints stage table, Writing of external JSON-lines file).
+    """
+    # Sum stats of every granule (writer thread stages are timed apart)
+    totals = gediClasses.GEDI_Shots.sum_stats(tasks)
+    stages = dict(totals["stages"])
+    for kind, seconds in writer.write_times.items():
+        stages["write_" + kind] = seconds
+    total_s = sum(stages.values())
+
+    # Print results
+    print("\n > Storer stages:")
+    print(f"     {'stage':<16}{'seconds':>10}{'share':>8}")
+    for name, seconds in sorted(stages.items(), key=lambda x: -x[1]):
+        share = 100 * seconds / total_s if total_s > 0 else 0
+        print(f"     {name:<16}{seconds:>10.2f}{share:>7.1f}%")
+    read_stages = ["align", "predicates", "read_geo", "read", "waveforms"]
+    read_s = sum(stages.get(name, 0) for name in read_stages)
+    mb_read = totals["bytes_read"] / 1e6
+    print(f"     - HDF5 read: {mb_read:.1f} MB", end=" ")
+    print(strings.colors(f"({mb_read / read_s if read_s > 0 else 0:.1f} MB/s)", 3))
+    print(f"     - Docs built: {totals['docs']} / written: {writer.docs}")
+
+    # Append run summary to the storer log
+    if log_path:
+        record = {
+            "time": datetime.now().isoformat(timespec="seconds"), 
+            "record": "run", "granules": len(tasks), **totals,
+            "stages": stages, "docs_written": writer.docs, 
+            "duplicates": writer.duplicates
+            }
+        with open(log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def gs_store_parallel(tasks, workers, writer):
+    """
+    > gs_store_parallel(tasks, workers, writer)
+        Process GEDI granules on a process pool (or one by one in this 
+        process) and store results.
 
-                # Iterate over matching files
-                for match in list(files_dict[version].keys()):
-                    
-                    # Retrieve processed files
-                    processed_files = db[collec_name].find_one({
-                        "str2match": match
-                    })
-
-                    # If no matches found, processed_files wil be a NoneType
-                    if processed_files is None:
-                        final_dict[version][match] = files_dict[version][match]
-            else:
-                # If log does not exist, process all files
-                final_dict[version] = files_dict[version]
+    > Arguments:
+        - tasks: List of GEDI_Shots instances;
+        - workers: Number of worker processes (see config.storer_workers, 
+            0 = granules processed in this process);
+        - writer: Running GEDI_Writer instance.
     
-    # Get number of GEDI granules to process
-    granules = 0
-    for version in versions:
-        granules += len(list(final_dict[version].keys()))
+    > Output:
+        - list: GEDI_Shots instances stored (failed granules left out).
+    """
+    if workers > 0:
+        print(f"\n ... Processing granules with {workers} workers ...")
+
+    # Workers stream beam windows (at most one granule per worker in flight)
+    with gediClasses.GEDI_StorerPool(writer, workers) as pool:
+        for gediShots in tasks:
+            pool.submit(gediShots)
+        stored = pool.run()
     
     # Return results
-    return final_dict, granules
+    return stored
+
+
+def gs_get_writer():
+    """
+    > gs_get_writer()
+        Writer stage of the storage backend (see config.storage_backend).
+
+    > Arguments:
+        - No arguments.
+    
+    > Output:
+        - GEDI_Writer or GEDI_ParquetWriter instance (not started).
+    """
+    if config.storage_backend == "parquet":
+        return gediClasses.GEDI_ParquetWriter()
+    return gediClasses.GEDI_Writer(
+        config.base_mongodb, storage=config.storage_mode, schema=config.shots_schema
+        )
+
+
+def gs_print_updated():
+    """
+    > gs_print_updated()
+        Print storage updated (see config.storage_backend).
+
+    > Arguments:
+        - No arguments.
+    
+    > Output:
+        - No outputs (prints message).
+    """
+    if config.storage_backend == "parquet":
+        storage = f"Parquet store '{config.parquetStorage}'"
+    else:
+        storage = f"MongoDB '{config.base_mongodb}'"
+    print(strings.colors(f"\n > {storage} succesfully updated!", 2))
+    print("\n" + "- - " * 20 + "\n")
 
 
 # ----- GEDI Extractor methods ----------------------------------------------- #
@@ -1032,177 +1458,802 @@ def ge_extract_basic_info(geom_src, buffer, out_folder, out_format, mongo_db):
     > Output:
         - No outputs (Writing of external files containing GEDI data)
     """
+    # Query GEDI shots on the storage backend
+    shots_rows = ge_shots_rows(geom_src, buffer, mongo_db)
+    
+    if shots_rows is None:
 
+        print("\nNo Shot Data found. Update Database!")
+    
+    else:
+
+        # Create Pandas DataFrame with results
+        shots_df = ge_shots_dataframe(shots_rows)
+
+        # Write data
+        outFile = ge_write_shots(shots_df, geom_src, out_folder, out_format)
+        
+        # Write waveforms of the shots (see config.store_waveforms)
+        if config.store_waveforms:
+            ge_write_waveforms(shots_df, outFile + "_rxwaveform.npz")
+
+
+def ge_extract_full_info(geom_src, buffer, out_folder, out_format, mongo_db):
+    """
+    > ge_extract_full_info(geometry_src, buffer, output_folder, output_format)
+        Function to extract full GEDI Shot data (see config.fullInfo) from 
+        local granules, for the shots found on the storage backend
+
+    > Arguments:
+        - geom_src: Full path to file with geometries to query,
+        - buffer: Max distance aroung points,
+        - out_folder: Destination folder,
+        - out_format: Output format (csv, shp, geojson),
+        - mongo_db: config.base_mongodb
+    
+    > Output:
+        - No outputs (Writing of external files containing GEDI data)
+    """
+    # Query GEDI shots (shot numbers and granules) on the storage backend
+    shots_rows = ge_shots_rows(geom_src, buffer, mongo_db)
+    
+    if shots_rows is None:
+
+        print("\nNo Shot Data found. Update Database!")
+    
+    else:
+
+        # Create Pandas DataFrame with results
+        shots_df = ge_shots_dataframe(shots_rows)
+
+        # Read full shot data from local granules
+        full_df, waveforms = ge_read_full_info(shots_df)
+
+        # Full info replaces stored values, shot location/ids are kept
+        keep = [
+            c for c in shots_df.columns 
+            if c not in full_df.columns or c == "shot_number"
+            ]
+        shots_df = shots_df[keep].assign(
+            shot_number = shots_df.shot_number.astype("uint64")
+            ).merge(full_df, on="shot_number", how="inner")
+        
+        if len(shots_df) == 0:
+            print("\nNo local granules found. Download GEDI Granules!")
+            return
+
+        # Write data
+        outFile = ge_write_shots(shots_df, geom_src, out_folder, out_format)
+
+        # Write waveforms of the shots
+        if len(waveforms) > 0:
+            ge_save_waveforms(waveforms, outFile + "_rxwaveform.npz")
+
+
+def ge_read_full_info(shots_df, path=config.localStorage, datasets=config.fullDatasets):
+    """
+    > ge_read_full_info(shots_df, path, datasets)
+        Read full GEDI Shot data of extracted shots from local granules, 
+        opening each granule once and reading only the needed rows.
+
+    > Arguments:
+        - shots_df: Pandas DataFrame with extracted shots;
+        - path: Path to local folder with downloaded GEDI Granules.
+            --> default = config.localStorage (see utils/config.py)
+        - datasets: Columns to read as {column: [product, dataset]}
+            --> default = config.fullDatasets (see utils/config.py)
+    
+    > Output:
+        - Pandas DataFrame: Full shot data (one row per shot_number);
+        - dict: Waveform (NumPy array) by shot number.
+    """
+    # Empty lists/dict to store results
+    frames = []
+    waveforms = {}
+
+    # Group shots by granule, so every granule is opened only once
+    granules = shots_df.groupby(["l1b_file", "l2a_file", "l2b_file"])
+    for (l1b, l2a, l2b), granule_df in granules:
+        
+        # Skip granules missing from local storage
+        files = dict(zip(config.gedi_products, [l1b, l2a, l2b]))
+        missing = [
+            f for product, f in files.items()
+            if not os.path.exists(path + os.sep + product + os.sep + f)
+            ]
+        if len(missing) > 0:
+            print(strings.colors(f"\n[WARNING] Missing granules: {missing}", 1))
+            continue
+
+        with gediClasses.GranuleReader(path, l1b, l2a, l2b, datasets) as reader:
+            
+            # Sorted, coalesced reads of the requested shots of each beam
+            for beam, beam_df in granule_df.groupby("beam"):
+                cols = reader.read_shots(
+                    beam, beam_df.shot_number.astype("uint64").values
+                    )
+                
+                # Waveforms go to a separate file
+                if "rxwaveform" in cols:
+                    waveforms.update(
+                        zip(cols["shot_number"].tolist(), cols.pop("rxwaveform"))
+                        )
+                
+                # Multi-valued datasets (e.g. rh, pai_z) as text
+                for column, values in cols.items():
+                    if values.ndim > 1:
+                        cols[column] = [str(v) for v in values.tolist()]
+                
+                frames.append(pd.DataFrame(cols))
+    
+    # Empty result keeps the expected columns
+    if len(frames) == 0:
+        return pd.DataFrame(columns=["shot_number"]), waveforms
+
+    # Return results
+    full_df = pd.concat(frames, ignore_index=True)
+    full_df = full_df.assign(shot_number = full_df.shot_number.astype("uint64"))
+    return full_df.drop_duplicates("shot_number"), waveforms
+
+
+def ge_shots_rows(geom_src, buffer, mongo_db):
+    """
+    > ge_shots_rows(geom_src, buffer, mongo_db)
+        Query GEDI shots on the storage backend (see config.storage_backend).
+
+    > Arguments:
+        - geom_src: Full path to file with geometries to query;
+        - buffer: Max distance around points;
+        - mongo_db: config.base_mongodb.
+    
+    > Output:
+        - list: Shot data rows (None if there is no shot data).
+    """
     # Get geometry(ies)
     geoms = gpd.read_file(geom_src)
 
-    # Get collection names referring to GEDI Product version
+    # Query GEDI shots on the storage backend
+    if config.storage_backend == "parquet":
+        return ge_parquet_rows(geoms, buffer, config.parquetStorage)
+    else:
+        return ge_mongodb_rows(geoms, buffer, mongo_db)
+
+
+def ge_shots_dataframe(shots_rows):
+    """
+    > ge_shots_dataframe(shots_rows)
+        Create Pandas DataFrame from shot data rows.
+
+    > Arguments:
+        - shots_rows: Shot data rows (see ge_shots_rows()).
+    
+    > Output:
+        - Pandas DataFrame with shot data, lon and lat.
+    """
+    # Column names (legacy and typed shot docs are normalized)
+    columnNames = ["_id", "location"] + config.basicInfo
+
+    # Create Pandas DataFrame with results
+    shots_df = pd.DataFrame(
+        shots_rows,
+        columns=["geom_id", "gedi_version"] + columnNames + ["dist2ref"]
+        )
+
+    # Get lon, lat info to create shapely geometries
+    shots_df = shots_df.assign(
+        lon = shots_df.location.apply(lambda x: x["coordinates"][0]),
+        lat = shots_df.location.apply(lambda x: x["coordinates"][1])
+        )
+    
+    # Transform ObjectId to string
+    shots_df._id = shots_df._id.apply(lambda x: str(x))
+
+    # Transform TimeStamp to string
+    shots_df.date_acquired = shots_df.date_acquired.apply(
+        lambda x: str(x).split(" ")[0]
+        )
+    
+    # Return results
+    return shots_df
+
+
+def ge_write_shots(shots_df, geom_src, out_folder, out_format):
+    """
+    > ge_write_shots(shots_df, geom_src, out_folder, out_format)
+        Write GEDI Shot data to an external file.
+
+    > Arguments:
+        - shots_df: Pandas DataFrame with shot data, lon and lat;
+        - geom_src: Full path to file with geometries to query;
+        - out_folder: Destination folder;
+        - out_format: Output format (csv, shp, geojson).
+    
+    > Output:
+        - str: Output file, without extension.
+    """
+    # Transform Pandas DF to GeoPandas DF
+    shots_gdf = gpd.GeoDataFrame(
+        shots_df, 
+        geometry=gpd.points_from_xy(shots_df.lon, shots_df.lat)
+        )
+            
+    # Get source filename
+    src_name = os.path.basename(geom_src).split(".")[0]
+
+    # Get info on date and time
+    dt = datetime.now()
+    ymd = str(dt.now().year).zfill(4) + str(dt.now().month).zfill(2)
+    ymd += str(dt.now().day).zfill(2)
+    hms = str(dt.now().hour).zfill(2) + str(dt.now().minute).zfill(2)
+    hms += str(dt.second).zfill(2)
+
+    # Compose output filename
+    fileName = 'gediShots_' + ymd + hms + "_" + src_name
+    outFile = out_folder + "/" + fileName 
+    
+    # Write data
+    if out_format == "csv":
+        shots_gdf.to_csv(outFile + ".csv", index=False)
+        print(strings.colors(f"\n... GEDI Shots data save to file:", 2))
+        print(f"        > {strings.colors(outFile + '.csv', 3)}")
+        print("")
+    
+    elif out_format == "geojson":
+        shots_gdf.to_file(outFile + ".geojson", driver="GeoJSON", index=False)
+        print(strings.colors(f"\n... GEDI Shots data save to file:", 2))
+        print(f"        > {strings.colors(outFile + '.geojson', 3)}")
+        print("")
+
+    elif out_format == "shp":
+        shots_gdf.to_file(outFile + ".shp", index=False)
+        print(strings.colors(f"\n... GEDI Shots data save to file:", 2))
+        print(f"        > {strings.colors(outFile + '.shp', 3)}")
+        print("")
+    
+    # Return results
+    return outFile
+
+
+def ge_write_waveforms(shots_df, out_path, root=config.waveformStorage):
+    """
+    > ge_write_waveforms(shots_df, out_path, root)
+        Write waveforms of extracted shots from the waveform store.
+
+    > Arguments:
+        - shots_df: Pandas DataFrame with extracted shots;
+        - out_path: Destination file (.npz);
+        - root: Waveform store folder (see config.waveformStorage).
+    
+    > Output:
+        - No outputs (Writing of external file containing GEDI waveforms)
+    """
+    # Waveform store (memory-mapped reads)
+    store = gediClasses.GEDI_WaveformStore(root)
+
+    # Query waveforms by version (each version has its own store)
+    waveforms = {}
+    for collec_version, shots in shots_df.groupby("gedi_version"):
+        waveforms.update(
+            store.get_waveforms(
+                collec_version.split("_v")[-1], 
+                shots.shot_number.astype("uint64").values, 
+                shots.lon.values, shots.lat.values
+                )
+            )
+    
+    if len(waveforms) == 0:
+        print("\nNo Waveform data found. Update Waveform store!")
+    else:
+        ge_save_waveforms(waveforms, out_path)
+
+
+def ge_save_waveforms(waveforms, out_path):
+    """
+    > ge_save_waveforms(waveforms, out_path)
+        Save waveforms as flat samples plus shot_number/count (.npz).
+
+    > Arguments:
+        - waveforms: dict of waveform (NumPy array) by shot number;
+        - out_path: Destination file (.npz).
+    
+    > Output:
+        - No outputs (Writing of external file containing GEDI waveforms)
+    """
+    # Flat samples plus shot_number/count to split them back
+    shot_numbers = np.array(list(waveforms.keys()), dtype="uint64")
+    counts = np.array([len(w) for w in waveforms.values()], dtype="uint32")
+    samples = np.concatenate(list(waveforms.values()))
+    np.savez(out_path, shot_number=shot_numbers, count=counts, samples=samples)
+    print(strings.colors(f"\n... GEDI Waveforms data save to file:", 2))
+    print(f"        > {strings.colors(out_path, 3)}")
+    print("")
+
+
+def ge_mongodb_rows(geoms, buffer, mongo_db):
+    """
+    > ge_mongodb_rows(geoms, buffer, mongo_db)
+        Query GEDI shots on MongoDB shots and buckets collections.
+
+    > Arguments:
+        - geoms: GeoPandas GeoDataFrame with geometries to query;
+        - buffer: Max distance around points;
+        - mongo_db: config.base_mongodb.
+    
+    > Output:
+        - list: Shot data rows (None if there is no shot data).
+    """
+    # Create connection with MongoDB instance
     with pymongo.mongo_client.MongoClient() as mongo:
-                        
+                
         # Get DB
         db = mongo.get_database(mongo_db)
 
         # Get collections versions
-        collecs = [c for c in db.collection_names() if c.startswith("shots")]
+        collecs = [
+            c for c in db.collection_names() 
+            if c.startswith("shots") or c.startswith("buckets")
+            ]
+        
+        if len(collecs) == 0:
+            return None
+
+        # Granule filenames referenced by typed shot docs
+        granules = {
+            collec_version: ge_get_granules(db, collec_version) 
+            for collec_version in collecs
+            }
+        
+        # Create empty list to store results
+        shots_rows = []
+
+        # Iterating over geometries
+        for geom_index, row in geoms.iterrows():
+
+            for collec_version in collecs:
+
+                if collec_version.startswith("buckets"):
+                    # Query bucket envelopes and unbucket members
+                    query_shots = ge_query_buckets(
+                        db, collec_version, row["geometry"], buffer, 
+                        granules[collec_version]
+                        )
+                
+                else:
+                    # Query GEDI shots on both shot docs schemas
+                    query_shots = (
+                        ge_normalize_shot(shot, granules[collec_version])
+                        for shot in ge_query_shots(
+                            db, collec_version, row["geometry"], buffer
+                            )
+                        )
+
+                for shot_data in query_shots:
+
+                    # Get id and gedi version list
+                    id_data = {
+                        "geom_id": row["id"], 
+                        "gedi_version": collec_version
+                        }
+
+                    # Append shot data to results
+                    shots_rows.append({**id_data, **shot_data})
     
-    if len(collecs) == 0:
+    # Return results
+    return shots_rows
 
-        print("\nNo Shot Data found. Update Database!")
+
+def ge_parquet_rows(geoms, buffer, root):
+    """
+    > ge_parquet_rows(geoms, buffer, root)
+        Query GEDI shots on the local columnar store (Parquet).
+
+    > Arguments:
+        - geoms: GeoPandas GeoDataFrame with geometries to query;
+        - buffer: Max distance around points;
+        - root: Columnar store folder (see config.parquetStorage).
     
-    else:
+    > Output:
+        - list: Shot data rows (None if there is no shot data).
+    """
+    # Get collections versions
+    collecs = []
+    if os.path.exists(root):
+        collecs = [c for c in os.listdir(root) if c.startswith("shots")]
+    
+    if len(collecs) == 0:
+        return None
 
-        # Get column names
-        with pymongo.mongo_client.MongoClient() as mongo:
-                        
-            # Get DB
-            db = mongo.get_database(mongo_db)
+    # Create empty list to store results
+    shots_rows = []
 
-            # Get collections versions
-            columnNames = list(db[collecs[0]].find_one().keys())
-        
-        # Create empty Pandas DataFrame to store results
-        shots_df = pd.DataFrame(
-            columns=["geom_id", "gedi_version"] + columnNames + ["dist2ref"]
-            )
+    for collec_version in collecs:
+
+        # Granule filenames referenced by shots
+        version = collec_version.split("_v")[-1]
+        granules = {
+            g["_id"]: g for g in gediClasses.GEDI_ParquetWriter.read_meta(
+                root, "granules_v" + version
+                )
+            }
 
         # Iterating over geometries
         for geom_index, row in geoms.iterrows():
 
-            if isinstance(row["geometry"], Point):
-
-                for collec_version in collecs:
-
-                    # Create connection with MongoDB instance
-                    with pymongo.mongo_client.MongoClient() as mongo:
-                                
-                        # Get DB
-                        db = mongo.get_database(mongo_db)
-
-                        # geoQuery for GEDI shots
-                        query_shots = db[collec_version].aggregate([
-                                {
-                                    "$geoNear": {
-                                        "near": { 
-                                            "type": "Point", 
-                                            "coordinates": [
-                                                row["geometry"].bounds[0], # lon
-                                                row["geometry"].bounds[1]  # lat
-                                                ]
-                                            },
-                                        "key": "location",
-                                        "distanceField": "dist2ref",
-                                        "maxDistance": buffer
-                                    }
-                                }
-                        ])
+            query_shots = ge_query_parquet(
+                root, collec_version, row["geometry"], buffer, granules
+                )
+
+            for shot_data in query_shots:
+
+                # Get id and gedi version list
+                id_data = {
+                    "geom_id": row["id"], 
+                    "gedi_version": collec_version
+                    }
 
-                    # Aggregate return cursor, so we have to iterate over it
-                    for shotIndex, shot in enumerate(query_shots):
+                # Append shot data to results
+                shots_rows.append({**id_data, **shot_data})
+    
+    # Return results
+    return shots_rows
 
-                        # Get id and gedi version list
-                        id_data = [row["id"], collec_version]
 
-                        # Get shot data as a list
-                        shot_data = list(shot.values())
+def ge_query_parquet(root, collec_version, geometry, buffer, granules):
+    """
+    > ge_query_parquet(root, collec_version, geometry, buffer, granules)
+        Query tile partitions of the columnar store (vectorized filter).
 
-                        # Append shot data to Pandas DataFrame
-                        general_index = str(geom_index) + str(shotIndex+1)
-                        shots_df.loc[general_index] = id_data + shot_data
-            
-            elif isinstance(row["geometry"], Polygon):
+    > Arguments:
+        - root: Columnar store folder (see config.parquetStorage);
+        - collec_version: Collection name (shots_v<version>);
+        - geometry: Shapely Point or Polygon;
+        - buffer: Max distance around points;
+        - granules: Granule docs by _id.
+    
+    > Output:
+        - Generator of shot data with config.basicInfo field names.
+    """
+    # Bounding box of the query (buffer converted to degrees)
+    if isinstance(geometry, Point):
+        lon0, lat0 = geometry.bounds[0], geometry.bounds[1]
+        dlat = buffer / 111320.0
+        dlon = dlat / max(np.cos(np.radians(lat0)), 1e-6)
+        bounds = (lon0 - dlon, lat0 - dlat, lon0 + dlon, lat0 + dlat)
+    elif isinstance(geometry, Polygon):
+        prepared = geoTasks.prepare_extent(geometry)
+        bounds = geometry.bounds
+    else:
+        return
 
-                # Get polygon vertices to compose GeoJSON object for query
-                x, y = row["geometry"].exterior.coords.xy
-                pol_coords = [[[lon, lat] for lon, lat in zip(x, y)]]
-                
-                for collec_version in collecs:
-
-                    # Create connection with MongoDB instance
-                    with pymongo.mongo_client.MongoClient() as mongo:
-                                
-                        # Get DB
-                        db = mongo.get_database(mongo_db)
-
-                        # geoQuery for GEDI shots
-                        query_shots = db[collec_version].find(
-                            {
-                                "location": {
-                                    "$geoWithin": {
-                                        "$geometry": {
-                                            "type": "Polygon",
-                                            "coordinates": pol_coords
-                                            }
-                                        }
-                                    }
-                                }
-                            )
+    # Partition pruning, only tiles intersecting the query
+    files = []
+    for lat0_tile, lon0_tile in geoTasks.tile_origins(bounds, config.parquet_tile_size):
+        folder = gediClasses.GEDI_ParquetWriter.partition_folder(
+            root, collec_version, lat0_tile, lon0_tile
+            )
+        files.extend(glob(os.path.join(folder, "year=*", "*.parquet")))
+    
+    for parquet_file in files:
 
-                    # Aggregate return cursor, so we have to iterate over it
-                    for shotIndex, shot in enumerate(query_shots):
+        # Read partition file as NumPy columns
+        table = gediClasses.pq.read_table(parquet_file)
+        cols = {name: table[name].to_numpy() for name in table.column_names}
 
-                        # Get id and gedi version list
-                        id_data = [row["id"], collec_version]
+        # Vectorized filter of shots
+        if isinstance(geometry, Point):
+            dist = geoTasks.haversine(cols["lon"], cols["lat"], lon0, lat0)
+            mask = dist <= buffer
+        else:
+            mask = geoTasks.points_within(
+                geometry, cols["lon"], cols["lat"], prepared
+                )
+            dist = np.zeros(len(mask))
+
+        # Create shot data for selected shots
+        members = np.flatnonzero(mask)
+        fields = [f for f in cols.keys() if f not in ["lon", "lat", "granule"]]
+        values = [cols[f][members].tolist() for f in fields]
+        lons, lats = cols["lon"][members].tolist(), cols["lat"][members].tolist()
+        grans = cols["granule"][members].tolist()
+
+        for i, member in enumerate(members.tolist()):
+            granule = granules.get(grans[i], {})
+            shot = {
+                "location": {"type": "Point", "coordinates": [lons[i], lats[i]]},
+                "dist2ref": float(dist[member]),
+                "l1b_file": granule.get("l1b"),
+                "l2a_file": granule.get("l2a"),
+                "l2b_file": granule.get("l2b")
+            }
+            shot.update(zip(fields, [v[i] for v in values]))
+            shot["_id"] = f"{grans[i]}:{shot['shot_number']}"
+            yield shot
+
+
+def ge_get_granules(db, collec_version):
+    """
+    > ge_get_granules(db, collec_version)
+        Get granule filenames referenced by typed shot and bucket docs.
 
-                        # Get shot data as a list
-                        shot_data = list(shot.values()) + [0]
+    > Arguments:
+        - db: pymongo Database (see config.base_mongodb);
+        - collec_version: Shots/buckets collection name (<kind>_v<version>).
+    
+    > Output:
+        - dict: Granule docs by _id.
+    """
+    # Granules collection of the same GEDI version
+    version = collec_version.split("_v")[-1]
+    return {g["_id"]: g for g in db["granules_v" + version].find()}
 
-                        # Append shot data to Pandas DataFrame
-                        general_index = str(geom_index) + str(shotIndex+1)
-                        shots_df.loc[general_index] = id_data + shot_data
-        
 
-        # Get lon, lat info to create shapely geometries
-        shots_df = shots_df.assign(
-            lon = shots_df.location.apply(lambda x: x["coordinates"][0]),
-            lat = shots_df.location.apply(lambda x: x["coordinates"][1])
-            )
+def ge_geo_keys(db, collec_version):
+    """
+    > ge_geo_keys(db, collec_version)
+        Get location keys of legacy and typed shot docs in a collection.
+
+    > Arguments:
+        - db: pymongo Database (see config.base_mongodb);
+        - collec_version: Shots collection name (shots_v<version>).
+    
+    > Output:
+        - list: Location keys with a 2dsphere index (all keys if none).
+    """
+    # Check geospatial indexes on the collection
+    keys = [
+        key for index in db[collec_version].index_information().values() 
+        for key, kind in index["key"] if kind == pymongo.GEOSPHERE
+        ]
+    
+    # Return results
+    return keys if len(keys) > 0 else ["location", config.shotKeys["location"]]
+
+
+def ge_query_shots(db, collec_version, geometry, buffer):
+    """
+    > ge_query_shots(db, collec_version, geometry, buffer)
+        Query GEDI shots around a Point or within a Polygon.
+
+    > Arguments:
+        - db: pymongo Database (see config.base_mongodb);
+        - collec_version: Shots collection name (shots_v<version>);
+        - geometry: Shapely Point or Polygon;
+        - buffer: Max distance around points.
+    
+    > Output:
+        - Generator of shot docs (dist2ref in meters).
+    """
+    for key in ge_geo_keys(db, collec_version):
+
+        if isinstance(geometry, Point):
+
+            # geoQuery for GEDI shots
+            query_shots = db[collec_version].aggregate([
+                    {
+                        "$geoNear": {
+                            "near": { 
+                                "type": "Point", 
+                                "coordinates": [
+                                    geometry.bounds[0], # lon
+                                    geometry.bounds[1]  # lat
+                                    ]
+                                },
+                            "key": key,
+                            "distanceField": "dist2ref",
+                            "maxDistance": buffer
+                        }
+                    }
+            ])
+
+            # Aggregate return cursor, so we have to iterate over it
+            for shot in query_shots:
+                yield shot
         
-        # Transform ObjectId to string
-        shots_df._id = shots_df._id.apply(lambda x: str(x))
+        elif isinstance(geometry, Polygon):
+
+            # Get polygon vertices to compose GeoJSON object for query
+            x, y = geometry.exterior.coords.xy
+            pol_coords = [[[lon, lat] for lon, lat in zip(x, y)]]
+
+            # geoQuery for GEDI shots
+            query_shots = db[collec_version].find(
+                {
+                    key: {
+                        "$geoWithin": {
+                            "$geometry": {
+                                "type": "Polygon",
+                                "coordinates": pol_coords
+                                }
+                            }
+                        }
+                    }
+                )
 
-        # Transform TimeStamp to string
-        shots_df.date_acquired = shots_df.date_acquired.apply(
-            lambda x: str(x).split(" ")[0]
-            )
+            for shot in query_shots:
+                shot["dist2ref"] = 0
+                yield shot
+
+
+def ge_normalize_shot(shot, granules):
+    """
+    > ge_normalize_shot(shot, granules)
+        Convert legacy or typed shot docs to full field names.
 
-        # Transform Pandas DF to GeoPandas DF
-        shots_gdf = gpd.GeoDataFrame(
-            shots_df, 
-            geometry=gpd.points_from_xy(shots_df.lon, shots_df.lat)
+    > Arguments:
+        - shot: Shot doc (schema 1 or 2);
+        - granules: Granule docs by _id (see ge_get_granules()).
+    
+    > Output:
+        - dict: Shot data with config.basicInfo field names.
+    """
+    # Legacy shot docs already use full field names
+    if "location" in shot:
+        return shot
+    
+    # Expand short keys
+    data = {
+        name: shot[key] for name, key in config.shotKeys.items() if key in shot
+        }
+    data["_id"] = shot["_id"]
+    data["dist2ref"] = shot.get("dist2ref", 0)
+
+    # Beam number back to BEAM name
+    data["beam"] = "BEAM" + format(data["beam"], "04b")
+
+    # Granule reference back to filenames
+    granule = granules.get(data.pop("granule"), {})
+    data["l1b_file"] = granule.get("l1b")
+    data["l2a_file"] = granule.get("l2a")
+    data["l2b_file"] = granule.get("l2b")
+
+    # Return results
+    return data
+
+
+def ge_query_buckets(db, collec_version, geometry, buffer, granules):
+    """
+    > ge_query_buckets(db, collec_version, geometry, buffer, granules)
+        Query bucket envelopes and filter their shots (vectorized).
+
+    > Arguments:
+        - db: pymongo Database (see config.base_mongodb);
+        - collec_version: Buckets collection name (buckets_v<version>);
+        - geometry: Shapely Point or Polygon;
+        - buffer: Max distance around points;
+        - granules: Granule docs by _id (see ge_get_granules()).
+    
+    > Output:
+        - Generator of shot data with config.basicInfo field names.
+    """
+    if isinstance(geometry, Point):
+
+        # Buckets whose envelope is up to buffer meters from the point
+        lon0, lat0 = geometry.bounds[0], geometry.bounds[1]
+        query_buckets = db[collec_version].aggregate([
+                {
+                    "$geoNear": {
+                        "near": {"type": "Point", "coordinates": [lon0, lat0]},
+                        "key": "env",
+                        "distanceField": "dist2env",
+                        "maxDistance": buffer
+                    }
+                }
+        ])
+
+        for bucket in query_buckets:
+
+            # Members within buffer
+            cols = ge_unpack_bucket(bucket)
+            dist = geoTasks.haversine(cols["lon"], cols["lat"], lon0, lat0)
+            mask = dist <= buffer
+
+            for shot in ge_unbucket(bucket, cols, mask, dist, granules):
+                yield shot
+    
+    elif isinstance(geometry, Polygon):
+
+        # Get polygon vertices to compose GeoJSON object for query
+        x, y = geometry.exterior.coords.xy
+        pol_coords = [[[lon, lat] for lon, lat in zip(x, y)]]
+
+        # Buckets whose envelope intersects the polygon
+        query_buckets = db[collec_version].find(
+            {
+                "env": {
+                    "$geoIntersects": {
+                        "$geometry": {
+                            "type": "Polygon",
+                            "coordinates": pol_coords
+                            }
+                        }
+                    }
+                }
             )
-                
-        # Get source filename
-        src_name = os.path.basename(geom_src).split(".")[0]
-
-        # Get info on date and time
-        dt = datetime.now()
-        ymd = str(dt.now().year).zfill(4) + str(dt.now().month).zfill(2)
-        ymd += str(dt.now().day).zfill(2)
-        hms = str(dt.now().hour).zfill(2) + str(dt.now().minute).zfill(2)
-        hms += str(dt.second).zfill(2)
-
-        # Compose output filename
-        fileName = 'gediShots_' + ymd + hms + "_" + src_name
-        outFile = out_folder + "/" + fileName 
-        
-        # Write data
-        if out_format == "csv":
-            shots_gdf.to_csv(outFile + ".csv", index=False)
-            print(strings.colors(f"\n... GEDI Shots data save to file:", 2))
-            print(f"        > {strings.colors(outFile + '.csv', 3)}")
-            print("")
-        
-        elif out_format == "geojson":
-            shots_gdf.to_file(outFile + ".geojson", driver="GeoJSON", index=False)
-            print(strings.colors(f"\n... GEDI Shots data save to file:", 2))
-            print(f"        > {strings.colors(outFile + '.geojson', 3)}")
-            print("")
-
-        elif out_format == "shp":
-            shots_gdf.to_file(outFile + ".shp", index=False)
-            print(strings.colors(f"\n... GEDI Shots data save to file:", 2))
-            print(f"        > {strings.colors(outFile + '.shp', 3)}")
-            print("")
-        
 
-        
+        # Prepare polygon once for every bucket
+        prepared = geoTasks.prepare_extent(geometry)
+
+        for bucket in query_buckets:
+
+            # Members within polygon
+            cols = ge_unpack_bucket(bucket)
+            mask = geoTasks.points_within(
+                geometry, cols["lon"], cols["lat"], prepared
+                )
+            dist = np.zeros(len(mask))
+
+            for shot in ge_unbucket(bucket, cols, mask, dist, granules):
+                yield shot
+
+
+def ge_unpack_bucket(bucket):
+    """
+    > ge_unpack_bucket(bucket)
+        Unpack bucket arrays into NumPy columns.
+
+    > Arguments:
+        - bucket: Bucket doc (see GEDI_Shots.bucket_documents()).
+    
+    > Output:
+        - dict: Columns (NumPy arrays) with config.basicInfo field names.
+    """
+    # Short keys back to field names
+    names = {key: name for name, key in config.shotKeys.items()}
+    names.update({key: name for name, key in config.bucketKeys.items()})
+
+    # Return results
+    return {
+        names[key]: np.frombuffer(packed, dtype=bucket["t"][key])
+        for key, packed in bucket["a"].items()
+    }
+
+
+def ge_unbucket(bucket, cols, mask, dist, granules):
+    """
+    > ge_unbucket(bucket, cols, mask, dist, granules)
+        Create shot data for the selected members of a bucket.
+
+    > Arguments:
+        - bucket: Bucket doc (see GEDI_Shots.bucket_documents());
+        - cols: Columns from ge_unpack_bucket();
+        - mask: NumPy boolean array of selected members;
+        - dist: NumPy array of distances to the reference geometry;
+        - granules: Granule docs by _id (see ge_get_granules()).
+    
+    > Output:
+        - list: Shot data with config.basicInfo field names.
+    """
+    # Nothing selected
+    if not mask.any():
+        return []
+
+    # Fields shared by every shot of the bucket
+    granule = granules.get(bucket[config.shotKeys["granule"]], {})
+    common = {
+        "beam": "BEAM" + format(bucket[config.shotKeys["beam"]], "04b"),
+        "date_acquired": bucket[config.shotKeys["date_acquired"]],
+        "l1b_file": granule.get("l1b"),
+        "l2a_file": granule.get("l2a"),
+        "l2b_file": granule.get("l2b")
+    }
+
+    # Selected members as native Python types
+    members = np.flatnonzero(mask)
+    fields = [f for f in cols.keys() if f not in ["lon", "lat"]]
+    values = [cols[f][members].tolist() for f in fields]
+    lons, lats = cols["lon"][members].tolist(), cols["lat"][members].tolist()
+
+    # Create shot data
+    shots = []
+    for i, member in enumerate(members.tolist()):
+        shot = {
+            "_id": f"{bucket['_id']}:{member}",
+            "location": {"type": "Point", "coordinates": [lons[i], lats[i]]},
+            "dist2ref": float(dist[member])
+        }
+        shot.update(zip(fields, [v[i] for v in values]))
+        shot.update(common)
+        shots.append(shot)
+    
+    # Return results
+    return shots
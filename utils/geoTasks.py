@@ -9,7 +9,17 @@ Author: Marcus Moresco Boeno
 
 # Third party library imports
 import geojson
-from shapely.geometry import Point, Polygon
+import numpy as np
+import shapely
+from shapely.geometry import Point, Polygon, box, shape
+from shapely.ops import unary_union
+
+# Vectorized point-in-polygon test (shapely>=2.0 or shapely.vectorized)
+try:
+    from shapely import contains_xy
+except ImportError:
+    from shapely.vectorized import contains as contains_xy
+    from shapely.prepared import prep
 
 # Local application imports
 from utils import strings, numbers, config
@@ -24,8 +34,333 @@ def shapelyPol_from_GeoJSONSinglePol(geo_filepath):
         - geo_filepath: Full path to GeoJSON file.
     
     > Output:
-        - shapely.geometry.Polygon feature.
+        - shapely.geometry.Polygon feature (holes kept).
     """
+    # Union of the GeoJSON geometries must be a single polygon
+    geometry = shapely_from_GeoJSON(geo_filepath)
+    if geometry.geom_type != "Polygon":
+        raise ValueError(
+            f"{geo_filepath} is a {geometry.geom_type}, not a single Polygon "
+            "(see shapely_from_GeoJSON())"
+            )
+
     # Return shapely polygon
-    return Polygon([tuple([pair[1], pair[0]]) for pair in coords])
+    return geometry
+
+
+def shapely_from_GeoJSON(geo_filepath):
+    """
+    > shapely_from_GeoJSON(geo_filepath)
+        Read GeoJSON geometries (Polygons/MultiPolygons) as a single Shapely 
+        geometry, the union of all features.
+
+    > Arguments:
+        - geo_filepath: Full path to GeoJSON file.
+    
+    > Output:
+        - shapely.geometry.Polygon or MultiPolygon feature.
+    """
+    # Read GeoJSON object (FeatureCollection, Feature or Geometry)
+    with open(geo_filepath, "r") as f:
+        obj = geojson.load(f)
+    
+    # Get geometries of every feature
+    if obj["type"] == "FeatureCollection":
+        geometries = [feat["geometry"] for feat in obj["features"]]
+    elif obj["type"] == "Feature":
+        geometries = [obj["geometry"]]
+    else:
+        geometries = [obj]
+
+    # Return union of geometries
+    return unary_union([shape(geom) for geom in geometries if geom is not None])
+
 
+def prepare_extent(extent):
+    """
+    > prepare_extent(extent)
+        Prepare a Shapely geometry for repeated containment tests.
+
+    > Arguments:
+        - extent: Shapely Polygon/MultiPolygon (see config.roiPath).
+    
+    > Output:
+        - Prepared geometry to be used with points_within().
+    """
+    # Shapely>=2.0 prepares geometries in place
+    if hasattr(shapely, "prepare"):
+        shapely.prepare(extent)
+        return extent
+    
+    # Older versions wrap the geometry into a PreparedGeometry
+    return prep(extent)
+
+
+def points_within(extent, lon, lat, prepared=None, raster=None):
+    """
+    > points_within(extent, lon, lat, prepared=None, raster=None)
+        Vectorized test of points (lon, lat) within a given extent.
+
+    > Arguments:
+        - extent: Shapely Polygon/MultiPolygon (see config.roiPath);
+        - lon: NumPy array of longitudes;
+        - lat: NumPy array of latitudes;
+        - prepared: Output from prepare_extent(extent) (default = None);
+        - raster: Output from rasterize_extent(extent) (default = None).
+    
+    > Output:
+        - NumPy boolean array (True for points within extent).
+    """
+    # Make sure coordinates are NumPy arrays
+    lon = np.asarray(lon, dtype="float64")
+    lat = np.asarray(lat, dtype="float64")
+
+    # Bounding box prefilter, cheap comparisons over the whole array
+    minx, miny, maxx, maxy = extent.bounds
+    mask = (lon >= minx) & (lon <= maxx) & (lat >= miny) & (lat <= maxy)
+    candidates = np.flatnonzero(mask)
+
+    # Raster lookup, exact test left only for boundary cells
+    if raster is not None and len(candidates) > 0:
+        cells = raster_lookup(raster, lon[candidates], lat[candidates])
+        mask[candidates] = cells == 1
+        candidates = candidates[cells == 2]
+
+    # Exact containment test only for remaining candidates
+    if len(candidates) > 0:
+        if prepared is None:
+            prepared = prepare_extent(extent)
+        mask[candidates] = contains_xy(
+            prepared, lon[candidates], lat[candidates]
+            )
+    
+    # Return boolean mask
+    return mask
+
+
+def rasterize_extent(extent, cell_size, max_cells=None):
+    """
+    > rasterize_extent(extent, cell_size, max_cells=None)
+        Raster mask of an extent over its bounding box, with each cell 
+        classified as outside (0), inside (1) or boundary (2).
+
+    > Arguments:
+        - extent: Shapely Polygon/MultiPolygon (see config.roiPath);
+        - cell_size: Cell size, in degrees;
+        - max_cells: Max number of cells (cell_size grows to fit).
+    
+    > Output:
+        - dict: Raster mask ("mask", "minx", "miny", "cell_size").
+    """
+    minx, miny, maxx, maxy = extent.bounds
+
+    # Coarser cells if the grid would be too large
+    if max_cells is not None:
+        cell_size = max(cell_size, np.sqrt((maxx - minx) * (maxy - miny) / max_cells))
+    ncols = int(np.ceil((maxx - minx) / cell_size)) + 1
+    nrows = int(np.ceil((maxy - miny) / cell_size)) + 1
+
+    # Classify cells by their centers (vectorized)
+    xs = minx + (np.arange(ncols) + 0.5) * cell_size
+    ys = miny + (np.arange(nrows) + 0.5) * cell_size
+    xx, yy = np.meshgrid(xs, ys)
+    mask = contains_xy(prepare_extent(extent), xx.ravel(), yy.ravel())
+    mask = mask.reshape(nrows, ncols).astype("uint8")
+
+    # Cells crossed by the boundary, from rings densified to half a cell
+    boundary = np.zeros((nrows, ncols), dtype=bool)
+    polygons = getattr(extent, "geoms", [extent])
+    for polygon in polygons:
+        for ring in [polygon.exterior] + list(polygon.interiors):
+            coords = np.asarray(ring.coords)
+            for (x0, y0), (x1, y1) in zip(coords[:-1], coords[1:]):
+                steps = int(np.hypot(x1 - x0, y1 - y0) / (cell_size / 2)) + 2
+                t = np.linspace(0, 1, steps)
+                col = ((x0 + t * (x1 - x0) - minx) / cell_size).astype(int)
+                row = ((y0 + t * (y1 - y0) - miny) / cell_size).astype(int)
+                boundary[np.clip(row, 0, nrows - 1), np.clip(col, 0, ncols - 1)] = True
+    
+    # Neighbours of boundary cells are boundary too (corner crossings)
+    grown = boundary.copy()
+    grown[1:, :] |= boundary[:-1, :]
+    grown[:-1, :] |= boundary[1:, :]
+    boundary = grown.copy()
+    boundary[:, 1:] |= grown[:, :-1]
+    boundary[:, :-1] |= grown[:, 1:]
+    mask[boundary] = 2
+
+    # Return results
+    return {"mask": mask, "minx": minx, "miny": miny, "cell_size": cell_size}
+
+
+def raster_lookup(raster, lon, lat):
+    """
+    > raster_lookup(raster, lon, lat)
+        Class of the raster cells (see rasterize_extent()) of a set of points.
+
+    > Arguments:
+        - raster: Output from rasterize_extent(extent);
+        - lon: NumPy array of longitudes (within the raster bounds);
+        - lat: NumPy array of latitudes (within the raster bounds).
+    
+    > Output:
+        - NumPy array of cell classes (0 outside, 1 inside, 2 boundary).
+    """
+    mask = raster["mask"]
+    col = ((lon - raster["minx"]) / raster["cell_size"]).astype(int)
+    row = ((lat - raster["miny"]) / raster["cell_size"]).astype(int)
+    return mask[
+        np.clip(row, 0, mask.shape[0] - 1), np.clip(col, 0, mask.shape[1] - 1)
+        ]
+
+
+def boxes_within(extent, boxes, prepared=None):
+    """
+    > boxes_within(extent, boxes, prepared=None)
+        Test of bounding boxes intersecting a given extent.
+
+    > Arguments:
+        - extent: Shapely Polygon/MultiPolygon (see config.roiPath);
+        - boxes: NumPy array of boxes (minx, miny, maxx, maxy) by row;
+        - prepared: Output from prepare_extent(extent) (default = None).
+    
+    > Output:
+        - NumPy boolean array (True for boxes intersecting extent).
+    """
+    # Make sure boxes are a 2D NumPy array
+    boxes = np.asarray(boxes, dtype="float64").reshape(-1, 4)
+
+    # Bounding box prefilter, cheap comparisons over the whole array
+    minx, miny, maxx, maxy = extent.bounds
+    mask = (
+        (boxes[:, 0] <= maxx) & (boxes[:, 2] >= minx) & 
+        (boxes[:, 1] <= maxy) & (boxes[:, 3] >= miny)
+        )
+
+    # Exact intersection test only for boxes overlapping the bounding box
+    if mask.any():
+        if hasattr(shapely, "intersects"):
+            # Vectorized (shapely>=2.0), extent is prepared in place
+            prepare_extent(extent)
+            mask[mask] = shapely.intersects(extent, shapely.box(*boxes[mask].T))
+        else:
+            # One test by box (shapely.vectorized fallback)
+            if prepared is None:
+                prepared = prepare_extent(extent)
+            for i in np.flatnonzero(mask):
+                mask[i] = prepared.intersects(box(*boxes[i]))
+    
+    # Return boolean mask
+    return mask
+
+
+def envelope(lon, lat, pad=1e-3):
+    """
+    > envelope(lon, lat, pad=1e-3)
+        GeoJSON Polygon envelope (bounding box) of a set of points.
+
+    > Arguments:
+        - lon: NumPy array of longitudes;
+        - lat: NumPy array of latitudes;
+        - pad: Padding, in degrees (degenerate envelopes, geodesic edges).
+    
+    > Output:
+        - dict: GeoJSON Polygon (counter-clockwise ring).
+    """
+    # Bounding box of the points
+    minx, maxx = float(np.min(lon)) - pad, float(np.max(lon)) + pad
+    miny, maxy = float(np.min(lat)) - pad, float(np.max(lat)) + pad
+
+    # Return GeoJSON Polygon
+    return {
+        "type": "Polygon",
+        "coordinates": [[
+            [minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]
+            ]]
+    }
+
+
+def haversine(lon, lat, lon0, lat0, radius=6378100.0):
+    """
+    > haversine(lon, lat, lon0, lat0, radius=6378100.0)
+        Vectorized great-circle distance, in meters, to a reference point.
+
+    > Arguments:
+        - lon: NumPy array of longitudes;
+        - lat: NumPy array of latitudes;
+        - lon0: Reference longitude;
+        - lat0: Reference latitude;
+        - radius: Earth radius, in meters (same as MongoDB $geoNear).
+    
+    > Output:
+        - NumPy array of distances, in meters.
+    """
+    # Convert to radians
+    lon, lat = np.radians(lon), np.radians(lat)
+    lon0, lat0 = np.radians(lon0), np.radians(lat0)
+
+    # Haversine formula
+    a = np.sin((lat - lat0) / 2) ** 2
+    a += np.cos(lat) * np.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+    
+    # Return results
+    return 2 * radius * np.arcsin(np.sqrt(a))
+
+
+def tile_origins(bounds, tile_size):
+    """
+    > tile_origins(bounds, tile_size)
+        Lower-left corners of the lat/lon tiles intersecting a bbox.
+
+    > Arguments:
+        - bounds: Bounding box (minx, miny, maxx, maxy) in degrees;
+        - tile_size: Tile size, in degrees.
+    
+    > Output:
+        - list: Tiles as [lat0, lon0] (same keys as GEDI_ParquetWriter).
+    """
+    minx, miny, maxx, maxy = bounds
+
+    # Tile indexes covering the bbox
+    lat_tiles = range(int(np.floor(miny / tile_size)), int(np.floor(maxy / tile_size)) + 1)
+    lon_tiles = range(int(np.floor(minx / tile_size)), int(np.floor(maxx / tile_size)) + 1)
+
+    # Return results
+    return [
+        [float(i) * tile_size + 0.0, float(j) * tile_size + 0.0] 
+        for i in lat_tiles for j in lon_tiles
+    ]
+
+
+def bbox_tiles(bbox, tile_size):
+    """
+    > bbox_tiles(bbox, tile_size)
+        Split a GEDI Finder bbox into lat/lon tiles (clipped to the bbox).
+
+    > Arguments:
+        - bbox: Bounding box [ul_lat, ul_lon, lr_lat, lr_lon] (see gf_bbox());
+        - tile_size: Tile size, in degrees (0 = bbox as a single tile).
+    
+    > Output:
+        - list: Tiles as [tile_id, [ul_lat, ul_lon, lr_lat, lr_lon]] 
+            (tile_id "<lat0>_<lon0>", same keys as tile_origins()).
+    """
+    ul_lat, ul_lon, lr_lat, lr_lon = bbox
+
+    # Small bboxes (or no tiling) are queried as they are
+    if tile_size <= 0 or (ul_lat - lr_lat <= tile_size and lr_lon - ul_lon <= tile_size):
+        return [["bbox", list(bbox)]]
+
+    tiles = []
+    for lat0, lon0 in tile_origins([ul_lon, lr_lat, lr_lon, ul_lat], tile_size):
+        tile = [
+            min(lat0 + tile_size, ul_lat), max(lon0, ul_lon),
+            max(lat0, lr_lat), min(lon0 + tile_size, lr_lon)
+            ]
+        
+        # Tiles touching the bbox only on its edges are left out
+        if tile[0] > tile[2] and tile[1] < tile[3]:
+            tiles.append([f"{lat0:g}_{lon0:g}", tile])
+    
+    # Return results
+    return tiles
@@ -0,0 +1,275 @@
+"""
+HDF5 Tasks utilities
+
+Functions to read and align GEDI Shot data from HDF5 granules
+
+Author: Marcus Moresco Boeno
+
+"""
+
+# Standard library imports
+import operator
+
+# Third party library imports
+import numpy as np
+
+
+# Operators available for ingest predicates (see config.ingest_predicates)
+predicate_operators = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le
+}
+
+
+def align_shots(shot_arrays):
+    """
+    > align_shots(shot_arrays)
+        Join GEDI products on shot_number (sorted-merge, O(n log n)).
+
+    > Arguments:
+        - shot_arrays: List of shot_number NumPy arrays (one per product).
+    
+    > Output:
+        - NumPy array: Sorted shot numbers common to all products;
+        - list: Index vectors (one per product) of the common shots.
+    """
+    # Sort shot numbers of each product (granules are usually sorted already)
+    sorters, sorted_arrays = [], []
+    for shots in shot_arrays:
+        shots = np.asarray(shots)
+        if shots.size < 2 or np.all(shots[1:] >= shots[:-1]):
+            sorters.append(None)
+            sorted_arrays.append(shots)
+        else:
+            sorter = np.argsort(shots, kind="stable")
+            sorters.append(sorter)
+            sorted_arrays.append(shots[sorter])
+
+    # Get shots that are common to all products (handles gaps and drops)
+    common = sorted_arrays[0]
+    for shots in sorted_arrays[1:]:
+        common = np.intersect1d(common, shots)
+    
+    # Locate common shots on each product
+    indexes = []
+    for sorter, shots in zip(sorters, sorted_arrays):
+        index = np.searchsorted(shots, common)
+        indexes.append(index if sorter is None else sorter[index])
+    
+    # Return results
+    return common, indexes
+
+
+def gather_rows(dataset, index, max_gap=None):
+    """
+    > gather_rows(dataset, index, max_gap=None)
+        Read rows of a HDF5 dataset with contiguous slices.
+
+    > Arguments:
+        - dataset: h5py Dataset;
+        - index: NumPy array of row indexes to gather;
+        - max_gap: Max gap (rows) read through within a slice.
+            --> default = None (single slice covering all rows)
+    
+    > Output:
+        - NumPy array: Dataset rows in the same order as index.
+    """
+    # Nothing to read
+    if len(index) == 0:
+        return dataset[0:0]
+    
+    if max_gap is None:
+        # Read span covering all rows and gather them with one fancy-index
+        beg, end = int(index.min()), int(index.max()) + 1
+        return dataset[beg:end][index - beg]
+
+    # Coalesce sorted rows into runs split at gaps larger than max_gap
+    order = np.argsort(index, kind="stable")
+    sorted_index = np.asarray(index)[order]
+    breaks = np.flatnonzero(np.diff(sorted_index) > max_gap) + 1
+    rows = np.concatenate(
+        [gather_rows(dataset, run) for run in np.split(sorted_index, breaks)]
+        )
+
+    # Restore order of index
+    gathered = np.empty_like(rows)
+    gathered[order] = rows
+    
+    # Return results
+    return gathered
+
+
+def span_nbytes(dataset, index, max_gap=None):
+    """
+    > span_nbytes(dataset, index, max_gap=None)
+        Bytes of the slices read by gather_rows(dataset, index, max_gap).
+
+    > Arguments:
+        - dataset: h5py Dataset;
+        - index: NumPy array of row indexes to gather;
+        - max_gap: Max gap (rows) read through within a slice.
+    
+    > Output:
+        - int: Number of bytes.
+    """
+    # Nothing to read
+    if len(index) == 0:
+        return 0
+    
+    # Bytes of a single row
+    row_nbytes = dataset.dtype.itemsize * int(np.prod(dataset.shape[1:]))
+
+    if max_gap is None:
+        return (int(index.max()) - int(index.min()) + 1) * row_nbytes
+
+    # Rows of each coalesced run
+    sorted_index = np.sort(index)
+    breaks = np.flatnonzero(np.diff(sorted_index) > max_gap) + 1
+    runs = np.split(sorted_index, breaks)
+    return sum(int(run[-1]) - int(run[0]) + 1 for run in runs) * row_nbytes
+
+
+def subset_indexes(indexes, keep):
+    """
+    > subset_indexes(indexes, keep)
+        Keep the same rows on the index vectors of every product.
+
+    > Arguments:
+        - indexes: Index vectors by GEDI product (aligned);
+        - keep: NumPy boolean mask (or positions) of rows to keep.
+    
+    > Output:
+        - dict: Index vectors by GEDI product.
+    """
+    return {product: index[keep] for product, index in indexes.items()}
+
+
+def gather_waveforms(dataset, starts, counts, max_gap=None):
+    """
+    > gather_waveforms(dataset, starts, counts, max_gap=None)
+        Read waveforms (rxwaveform) of a set of shots with contiguous slices.
+
+    > Arguments:
+        - dataset: h5py Dataset with the flat sample array (rxwaveform);
+        - starts: NumPy array of rx_sample_start_index (1-based);
+        - counts: NumPy array of rx_sample_count;
+        - max_gap: Max gap (samples) read through within a slice.
+            --> default = None (single slice covering all waveforms)
+    
+    > Output:
+        - NumPy object array: Waveform (NumPy array) of each shot.
+    """
+    waveforms = np.empty(len(starts), dtype=object)
+
+    # Nothing to read
+    if len(starts) == 0:
+        return waveforms
+    
+    starts = np.asarray(starts, dtype="int64")
+    counts = np.asarray(counts, dtype="int64")
+
+    if max_gap is not None:
+        # Coalesce sorted waveforms into runs split at large sample gaps
+        order = np.argsort(starts, kind="stable")
+        ends = np.maximum.accumulate((starts + counts)[order])
+        breaks = np.flatnonzero(starts[order][1:] - ends[:-1] > max_gap) + 1
+        for run in np.split(order, breaks):
+            waveforms[run] = gather_waveforms(dataset, starts[run], counts[run])
+        return waveforms
+    
+    # Read span covering all waveforms (0-based)
+    starts = starts - 1
+    beg, end = int(starts.min()), int((starts + counts).max())
+    samples = dataset[beg:end]
+
+    # Slice each waveform from the span
+    for i, (start, count) in enumerate(zip((starts - beg).tolist(), counts.tolist())):
+        waveforms[i] = samples[start:start + count]
+    
+    # Return results
+    return waveforms
+
+
+def segment_bounds(lat_dataset, lon_dataset, segment, step, pad=0.0):
+    """
+    > segment_bounds(lat_dataset, lon_dataset, segment, step, pad=0.0)
+        Bounding boxes of along-track segments from a decimated read.
+
+    > Arguments:
+        - lat_dataset: h5py Dataset of latitudes (e.g. latitude_bin0);
+        - lon_dataset: h5py Dataset of longitudes (e.g. longitude_bin0);
+        - segment: Number of rows of each segment;
+        - step: Read one row every step rows;
+        - pad: Padding of the boxes, in degrees.
+    
+    > Output:
+        - list: Segments as [beg, end, minx, miny, maxx, maxy] (rows beg:end);
+            segments without valid coordinates are left out.
+    """
+    numRows = lat_dataset.shape[0]
+    if numRows == 0:
+        return []
+
+    # Decimated read, plus the last row so the track end is covered
+    rows = np.arange(0, numRows, step)
+    lat, lon = lat_dataset[::step], lon_dataset[::step]
+    if rows[-1] != numRows - 1:
+        rows = np.append(rows, numRows - 1)
+        lat = np.append(lat, lat_dataset[numRows - 1])
+        lon = np.append(lon, lon_dataset[numRows - 1])
+    
+    # Drop fill values (outside valid coordinates)
+    valid = (
+        np.isfinite(lat) & np.isfinite(lon) & 
+        (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+        )
+    rows, lat, lon = rows[valid], lat[valid], lon[valid]
+
+    segments = []
+    for beg in range(0, numRows, segment):
+        end = min(beg + segment, numRows)
+
+        # Samples of the segment and the nearest ones on each side, so the
+        # track between samples stays inside the box
+        lo = max(np.searchsorted(rows, beg, side="right") - 1, 0)
+        hi = np.searchsorted(rows, end - 1, side="left") + 1
+        if hi <= lo or lo >= len(rows):
+            continue
+        
+        segments.append([
+            beg, end, 
+            float(lon[lo:hi].min()) - pad, float(lat[lo:hi].min()) - pad, 
+            float(lon[lo:hi].max()) + pad, float(lat[lo:hi].max()) + pad
+            ])
+    
+    # Return results
+    return segments
+
+
+def rows_in_ranges(index, ranges):
+    """
+    > rows_in_ranges(index, ranges)
+        Test of row indexes within a set of [beg, end) row ranges.
+
+    > Arguments:
+        - index: NumPy array of row indexes;
+        - ranges: List of sorted, non-overlapping [beg, end] ranges.
+    
+    > Output:
+        - NumPy boolean array (True for rows within a range).
+    """
+    # No ranges, no rows
+    if len(ranges) == 0:
+        return np.zeros(len(index), dtype=bool)
+    
+    # Locate rows on the sorted range starts
+    begs = np.array([r[0] for r in ranges])
+    ends = np.array([r[1] for r in ranges])
+    pos = np.searchsorted(begs, index, side="right") - 1
+    
+    # Return boolean mask
+    return (pos >= 0) & (index < ends[np.maximum(pos, 0)])